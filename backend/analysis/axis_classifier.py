@@ -0,0 +1,224 @@
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from config import (
+    AXIS_CLASSIFIER_DATASETS_ROOT,
+    AXIS_CLASSIFIER_ENABLED,
+    AXIS_CLASSIFIER_METHOD,
+    AXIS_CLASSIFIER_MIN_CONFIDENCE,
+    AXIS_CLASSIFIER_PATH,
+    AXIS_CLASSIFIER_TEMPERATURE,
+    M1_AXIS_WEIGHTS,
+)
+from analysis.rubric_bank import collect_rubric_history
+from utils.embedding_utils import embed_texts
+
+AXES = list(M1_AXIS_WEIGHTS)
+# Static axis descriptions, shared by both medical evaluators' classification prompts
+AXIS_DESCRIPTIONS = {
+    "Completeness": "Answer addresses all relevant aspects of the question comprehensively",
+    "Accuracy": "Medical information is factually correct and evidence-based",
+    "Context Awareness": "Response is appropriate for the specific medical context",
+    "Communication": "Information is communicated clearly and effectively",
+    "Terminology Accessibility": "Medical terms are explained accessibly for patients",
+}
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class AxisClassifier:
+    """Assigns rubrics to quality axes from SBERT embeddings of previously classified rubrics.
+
+    Both methods reduce to a linear layer over the embedding, ``softmax(scale * X @ W.T + b)``:
+    "centroid" uses the per-axis mean embeddings (with each axis description as one extra
+    example) and a temperature, "logreg" a multinomial logistic regression. The top
+    probability is the confidence; rubrics under ``min_confidence`` go to the judge.
+    """
+
+    def __init__(self, axes: List[str], weights: np.ndarray, bias: np.ndarray, scale: float = 1.0,
+                 method: str = AXIS_CLASSIFIER_METHOD, min_confidence: float = AXIS_CLASSIFIER_MIN_CONFIDENCE):
+        self.axes = list(axes)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.scale = float(scale)
+        self.method = method
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "llm": 0, "llm_calls": 0, "llm_failed": 0, "agree_with_llm": 0}
+
+    @classmethod
+    def fit(cls, rubrics: List[str], axes: List[str], method: str = AXIS_CLASSIFIER_METHOD,
+            descriptions: Optional[Dict[str, str]] = None,
+            temperature: float = AXIS_CLASSIFIER_TEMPERATURE, **kwargs) -> "AxisClassifier":
+        """Train on (rubric, axis) pairs; labels outside AXES are ignored."""
+        descriptions = AXIS_DESCRIPTIONS if descriptions is None else descriptions
+        pairs = [(r, a) for r, a in zip(rubrics, axes) if a in AXES]
+        texts = [r for r, _ in pairs] + [descriptions[a] for a in AXES if a in descriptions]
+        labels = np.asarray([AXES.index(a) for _, a in pairs] + [AXES.index(a) for a in AXES if a in descriptions])
+        vectors = embed_texts(texts)
+        weights, bias, scale = cls._train(vectors, labels, method, temperature)
+        return cls(AXES, weights, bias, scale, method, **kwargs)
+
+    @staticmethod
+    def _train(vectors: np.ndarray, labels: np.ndarray, method: str,
+               temperature: float) -> Tuple[np.ndarray, np.ndarray, float]:
+        n_axes = len(AXES)
+        if method == "centroid":
+            weights = np.zeros((n_axes, vectors.shape[1]), dtype=np.float32)
+            bias = np.zeros(n_axes, dtype=np.float32)
+            for i in range(n_axes):
+                members = vectors[labels == i]
+                if len(members) == 0:
+                    bias[i] = -np.inf
+                    continue
+                mean = members.mean(axis=0)
+                weights[i] = mean / (np.linalg.norm(mean) or 1.0)
+            return weights, bias, 1.0 / temperature
+        if method == "logreg":
+            from sklearn.linear_model import LogisticRegression
+            model = LogisticRegression(max_iter=1000, class_weight="balanced").fit(vectors, labels)
+            coef, intercept = model.coef_, model.intercept_
+            if len(model.classes_) == 2:
+                # Binary fits keep one row; split it so the softmax gives the same probabilities
+                coef = np.vstack([-coef[0] / 2, coef[0] / 2])
+                intercept = np.asarray([-intercept[0] / 2, intercept[0] / 2])
+            weights = np.zeros((n_axes, vectors.shape[1]), dtype=np.float32)
+            bias = np.full(n_axes, -np.inf, dtype=np.float32)
+            weights[model.classes_] = coef
+            bias[model.classes_] = intercept
+            return weights, bias, 1.0
+        raise ValueError(f"Unknown axis classifier method: {method}")
+
+    @classmethod
+    def from_history(cls, datasets_root: str = AXIS_CLASSIFIER_DATASETS_ROOT, **kwargs) -> Optional["AxisClassifier"]:
+        """Train on every judge axis placement stored under <dataset>/<model> runs (None if there are none)."""
+        history = collect_rubric_history(datasets_root).dropna(subset=["axis"])
+        history = history[history["axis"].isin(AXES)].drop_duplicates("rubric")
+        if history.empty:
+            print("Warning: no classified rubric history, axes will be assigned by the judge")
+            return None
+        print(f"Axis classifier: training on {len(history)} classified rubrics "
+              f"({history['axis'].value_counts().to_dict()})")
+        return cls.fit(history["rubric"].tolist(), history["axis"].tolist(), **kwargs)
+
+    def save(self, path: str = AXIS_CLASSIFIER_PATH) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, axes=np.asarray(self.axes), weights=self.weights, bias=self.bias,
+                 scale=np.float32(self.scale), method=np.asarray(self.method))
+        print(f"Axis classifier saved to: {path}")
+
+    @classmethod
+    def load(cls, path: str = AXIS_CLASSIFIER_PATH, **kwargs) -> Optional["AxisClassifier"]:
+        if not Path(path).exists():
+            return None
+        data = np.load(path)
+        return cls([str(a) for a in data["axes"]], data["weights"], data["bias"], float(data["scale"]),
+                   str(data["method"]), **kwargs)
+
+    def probabilities(self, rubrics: List[str], allowed: Optional[List[str]] = None) -> np.ndarray:
+        """Probability per (rubric, axis), renormalized over ``allowed`` axes when given."""
+        logits = (embed_texts(rubrics) @ self.weights.T) * self.scale + self.bias
+        if allowed is not None:
+            logits[:, [i for i, axis in enumerate(self.axes) if axis not in allowed]] = -np.inf
+        # Rows with no usable axis at all come out as zeros rather than NaN
+        return np.nan_to_num(_softmax(logits))
+
+    def classify(self, rubrics: List[str], axes: List[str],
+                 fallback: Optional[Callable[[List[str]], Dict[str, List[str]]]] = None) -> Dict[str, List[str]]:
+        """Classification over ``axes`` (plus "unclassified"), local where confident.
+
+        Rubrics under the confidence threshold are sent together to ``fallback`` (one judge
+        call); if that fails they keep the local best guess. Each axis lists its rubrics in
+        input order.
+        """
+        classification: Dict[str, List[str]] = {axis: [] for axis in list(axes) + ["unclassified"]}
+        if not rubrics:
+            return classification
+        probs = self.probabilities(rubrics, allowed=axes)
+        best = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(rubrics)), best]
+        placed = {rubric: self.axes[i] if c > 0 else "unclassified"
+                  for rubric, i, c in zip(rubrics, best, confidence)}
+        uncertain = [r for r, c in zip(rubrics, confidence) if c < self.min_confidence]
+        judged: Dict[str, str] = {}
+        if uncertain and fallback is not None:
+            result = fallback(uncertain)
+            judged = {r: axis for axis, listed in (result or {}).items() for r in listed}
+            with self._lock:
+                self.stats["llm_calls"] += 1
+                self.stats["llm"] += len(judged)
+                self.stats["llm_failed"] += len(uncertain) - len(judged)
+                self.stats["agree_with_llm"] += sum(1 for r, axis in judged.items() if placed.get(r) == axis)
+        with self._lock:
+            self.stats["local"] += len(rubrics) - len(uncertain)
+        placed.update(judged)
+        for rubric in rubrics:
+            classification.setdefault(placed[rubric], []).append(rubric)
+        return classification
+
+    def holdout_accuracy(self, rubrics: List[str], labels: List[str], folds: int = 5,
+                         temperature: float = AXIS_CLASSIFIER_TEMPERATURE, seed: int = 0) -> Dict[str, float]:
+        """k-fold accuracy against judge labels, overall and on rubrics above the threshold."""
+        pairs = [(r, a) for r, a in zip(rubrics, labels) if a in self.axes]
+        n = len(pairs)
+        if n < folds:
+            return {}
+        vectors = embed_texts([r for r, _ in pairs])
+        truth = np.asarray([self.axes.index(a) for _, a in pairs])
+        fold_of = np.random.default_rng(seed).permutation(n) % folds
+        hits = confident = confident_hits = 0
+        for fold in range(folds):
+            train, test = fold_of != fold, fold_of == fold
+            weights, bias, scale = self._train(vectors[train], truth[train], self.method, temperature)
+            probs = _softmax((vectors[test] @ weights.T) * scale + bias)
+            correct = probs.argmax(axis=1) == truth[test]
+            sure = probs.max(axis=1) >= self.min_confidence
+            hits += int(correct.sum())
+            confident += int(sure.sum())
+            confident_hits += int((correct & sure).sum())
+        return {
+            "accuracy": round(hits / n, 3),
+            "confident_fraction": round(confident / n, 3),
+            "confident_accuracy": round(confident_hits / confident, 3) if confident else 0.0,
+        }
+
+    def report(self) -> Dict[str, float]:
+        """Routing counts, and how often the local guess matched the judge on routed rubrics."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["local_accuracy_vs_llm"] = round(stats["agree_with_llm"] / stats["llm"], 3) if stats["llm"] else None
+        return stats
+
+
+_classifier: Optional[AxisClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_axis_classifier() -> Optional[AxisClassifier]:
+    """Process-wide classifier (loaded, or trained from history and saved on first use).
+
+    None when AXIS_CLASSIFIER_ENABLED is off or there is no history to train on.
+    """
+    global _classifier
+    if not AXIS_CLASSIFIER_ENABLED:
+        return None
+    with _classifier_lock:
+        if _classifier is None:
+            classifier = AxisClassifier.load()
+            if classifier is None:
+                classifier = AxisClassifier.from_history()
+                if classifier is None:
+                    return None
+                classifier.save()
+            _classifier = classifier
+        return _classifier
+
+
+def axis_classifier_stats() -> Dict[str, float]:
+    with _classifier_lock:
+        return _classifier.report() if _classifier is not None else {}
@@ -7,6 +7,8 @@ from rouge_score import rouge_scorer
 from nltk.translate.meteor_score import meteor_score
 from transformers import GPT2Tokenizer, GPT2LMHeadModel
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+from utils.file_utils import read_csv_cached
+from utils.token_utils import register_tokenizer
 try:
     nltk.data.find('tokenizers/punkt')
 except LookupError:
@@ -22,15 +24,19 @@ except LookupError:
 
 
 class LinguisticAnalyzer:
+    OUTPUT_COLUMNS = ["bleu_score", "meteor_score", "rouge_l_score", "perplexity", "linguistic_quality_score"]
+
     def __init__(self, dataset_path: str):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.rouge_scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
         self.smoothing = SmoothingFunction()
         self.tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+        # Reuse the loaded tokenizer for request token estimates in later stages
+        register_tokenizer(self.tokenizer)
         self.model = GPT2LMHeadModel.from_pretrained("gpt2").to(self.device)
         self.model.eval()
         self.dataset_path = dataset_path
-        self.df = pd.read_csv(dataset_path)
+        self.df = read_csv_cached(dataset_path)
         self.references = self.df["Answer"].fillna("").tolist()
         self.candidates = self.df["llm_response"].fillna("").tolist()
 
@@ -1,11 +1,13 @@
-import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Any, List, Dict
 import pandas as pd
 from dotenv import load_dotenv
-from openai import OpenAI
-from config import JUDGE_MODEL
+from config import JUDGE_MAX_CONCURRENCY, JUDGE_MODEL
+from analysis.theme_classifier import ThemeClassifier
+from utils.file_utils import atomic_write_csv, read_csv_cached
+from utils.judge_client import get_judge_client
 load_dotenv()
 
 
@@ -27,7 +29,7 @@ class ThemeRubricGenerator:
 
 
     def __init__(self, dataset_path: str, themes: List[str], output_folder: str):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.judge = get_judge_client(JUDGE_MODEL)
         self.dataset_path = Path(dataset_path)
         self.themes = themes
         self.output_folder = Path(output_folder)
@@ -35,7 +37,7 @@ class ThemeRubricGenerator:
         if not self.dataset_path.exists():
             raise FileNotFoundError(f"Dataset not found: {self.dataset_path}")
 
-        self.df = pd.read_csv(self.dataset_path)
+        self.df = read_csv_cached(self.dataset_path)
         if "Questions" not in self.df.columns:
             raise ValueError("Dataset must contain a 'Questions' column")
 
@@ -43,33 +45,18 @@ class ThemeRubricGenerator:
 
 
     def _call_llm(self, prompt: str, max_tokens: int = 600, temperature: float = 0.1) -> str:
-        for _ in range(3):
-            try:
-                resp = self.client.chat.completions.create(
-                    model=JUDGE_MODEL,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=max_tokens,
-                    temperature=temperature
-                )
-                return resp.choices[0].message.content
-            except Exception:
-                continue
-        raise RuntimeError("LLM call failed after 3 attempts")
+        resp = self.judge.complete(prompt, max_tokens=max_tokens, temperature=temperature)
+        if resp is None:
+            raise RuntimeError("LLM call failed after retries")
+        return resp
 
 
     def _classify_questions(self) -> pd.Series:
-        theme_list = "\n".join(f"- {t}" for t in self.themes)
-        assignments = []
-        for question in self.df["Questions"]:
-            prompt = (
-                f"Classify this medical question into one of the themes below:\n"
-                f"{theme_list}\n\n"
-                f"Question:\n\"\"\"{question}\"\"\"\n\n"
-                "Return ONLY the exact theme name."
-            )
-            resp = self._call_llm(prompt, max_tokens=50, temperature=0.0).strip()
-            assignments.append(resp if resp in self.themes else "unclassified")
-        return pd.Series(assignments, index=self.df.index)
+        """Local embedding classifier first; uncertain questions go to the judge in batches"""
+        classifier = ThemeClassifier.from_labeled(self.themes)
+        themes = classifier.classify(self.df["Questions"].fillna("").astype(str).tolist(), judge=self.judge)
+        print(f"  → Theme classifier: {classifier.report()}")
+        return pd.Series([t or "unclassified" for t in themes], index=self.df.index)
 
 
     def _generate_rubrics(self, theme: str, count: int = 20) -> List[str]:
@@ -116,44 +103,51 @@ class ThemeRubricGenerator:
         return classification
 
 
-    def run(self) -> None:
-        # Step 1: classify and save themed dataset
-        print("Step 1: Classifying questions into themes")
-        self.df["Theme"] = self._classify_questions()
+    def _build_theme(self, theme: str) -> Dict[str, Any]:
+        """Rubric generation then axis classification for one theme, handed over in memory"""
+        rubs = self._generate_rubrics(theme)
+        print(f"  • Generated {len(rubs)} rubrics for: {theme}")
+        cls = self._classify_rubrics_to_axes(theme, rubs)
+        print(f"  • Classified rubrics for: {theme}")
+        return {"rubrics": rubs, "classification": cls}
+
+
+    def run(self, max_workers: int = JUDGE_MAX_CONCURRENCY) -> None:
+        """Theme the questions and build the per-theme rubric bank, then write the three CSVs.
+
+        Question theming and each theme's generate -> classify pipeline are independent, so
+        they run together on a pool of ``max_workers`` threads (1 runs them in order).
+        Nothing is written until every step has succeeded.
+        """
+        print(f"Classifying questions and building rubric banks for {len(self.themes)} themes "
+              f"({max_workers} workers)")
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            themed = pool.submit(self._classify_questions)
+            built = {theme: pool.submit(self._build_theme, theme) for theme in self.themes}
+            self.df["Theme"] = themed.result()
+            banks = {theme: future.result() for theme, future in built.items()}
+
         themed_csv = self.output_folder / f"{self.dataset_path.stem}_themed.csv"
-        self.df.to_csv(themed_csv, index=False)
+        atomic_write_csv(self.df, str(themed_csv))
         print(f"  → Themed questions saved to: {themed_csv}")
 
-        # Step 2: generate and save rubric bank
-        print("Step 2: Generating rubric bank per theme")
-        rubric_rows: List[Dict[str, str]] = []
-        for theme in self.themes:
-            print(f"  • Generating rubrics for: {theme}")
-            rubs = self._generate_rubrics(theme)
-            rubric_rows.append({
-                "Theme": theme,
-                "Rubrics": json.dumps(rubs, ensure_ascii=False)
-            })
+        rubric_rows: List[Dict[str, str]] = [
+            {"Theme": theme, "Rubrics": json.dumps(bank["rubrics"], ensure_ascii=False)}
+            for theme, bank in banks.items()
+        ]
         rubric_csv = self.output_folder / "theme_rubric_bank.csv"
-        pd.DataFrame(rubric_rows).to_csv(rubric_csv, index=False)
+        atomic_write_csv(pd.DataFrame(rubric_rows), str(rubric_csv))
         print(f"  → Rubric bank saved to: {rubric_csv}")
 
-        # Step 3: classify rubrics into axes and save
-        print("Step 3: Classifying rubrics into axes")
         classified_rows: List[Dict[str, str]] = []
-        bank_df = pd.read_csv(rubric_csv)
-        for _, row in bank_df.iterrows():
-            theme = row["Theme"]
-            rubs = json.loads(row["Rubrics"])
-            print(f"  • Classifying rubrics for: {theme}")
-            cls = self._classify_rubrics_to_axes(theme, rubs)
+        for theme, bank in banks.items():
             # prepare a flat row: Theme + JSON per axis
             entry = {"Theme": theme}
             for ax in self.AXES + ["unclassified"]:
-                entry[ax] = json.dumps(cls.get(ax, []), ensure_ascii=False)
+                entry[ax] = json.dumps(bank["classification"].get(ax, []), ensure_ascii=False)
             classified_rows.append(entry)
         classified_csv = self.output_folder / "theme_rubric_bank_classified.csv"
-        pd.DataFrame(classified_rows).to_csv(classified_csv, index=False)
+        atomic_write_csv(pd.DataFrame(classified_rows), str(classified_csv))
         print(f"  → Classified rubric bank saved to: {classified_csv}")
 
 
@@ -1,13 +1,18 @@
-import os
 import json
 import pandas as pd
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
-from openai import OpenAI
 from config import JUDGE_MODEL
+from utils.file_utils import read_csv_cached
+from utils.judge_client import get_judge_client
+from utils.rubric_scoring import score_rubrics_by_id, static_rubric_block
+from utils.score_memo import memoized_rubric_scores
 load_dotenv()
 
+# Rubric score memo key component; bump when the scoring prompt below changes
+SCORING_PROMPT_VERSION = "m3-score-1"
+
 
 
 class ThemeRubricScorer:
@@ -27,10 +32,10 @@ class ThemeRubricScorer:
         output_dataset_csv: str,
         detailed_output_csv: str
     ):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.judge = get_judge_client(JUDGE_MODEL)
 
-        self.df = pd.read_csv(dataset_csv)
-        llm_df = pd.read_csv(llm_response_source_csv)
+        self.df = read_csv_cached(dataset_csv)
+        llm_df = read_csv_cached(llm_response_source_csv)
         rubric_df = pd.read_csv(classified_rubric_csv)
 
         if "llm_response" not in llm_df.columns:
@@ -60,33 +65,35 @@ class ThemeRubricScorer:
 
 
     def _call_llm(self, prompt: str, max_tokens: int = 800, temperature: float = 0.1) -> str:
-        for _ in range(3):
-            try:
-                resp = self.client.chat.completions.create(
-                    model=JUDGE_MODEL,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=max_tokens,
-                    temperature=temperature
-                )
-                return resp.choices[0].message.content
-            except Exception:
-                continue
-        raise RuntimeError("LLM call failed after 3 attempts")
-
-
-    def _score_rubrics(self, question: str, response: str, rubrics: List[str]) -> Dict[str, int]:
-        rubrics_json = json.dumps(rubrics, indent=2, ensure_ascii=False)
-        prompt = (
-            f"You are an expert medical evaluator.\n\n"
-            f"Question:\n\"\"\"{question}\"\"\"\n\n"
-            f"LLM Response:\n\"\"\"{response}\"\"\"\n\n"
-            f"Evaluation Criteria:\n{rubrics_json}\n\n"
-            "For each criterion, return 1 if fully satisfied, else 0, as a JSON object."
+        resp = self.judge.complete(prompt, max_tokens=max_tokens, temperature=temperature)
+        if resp is None:
+            raise RuntimeError("LLM call failed after retries")
+        return resp
+
+
+    def _score_rubrics(self, question: str, response: str, rubrics: List[str]) -> Dict[str, Optional[int]]:
+        # The theme's rubrics are the same for every question in it, so they lead the prompt
+        prefix = (
+            "You are an expert medical evaluator.\n\n"
+            f"Evaluation Criteria (ID: criterion):\n{static_rubric_block(rubrics)}\n\n"
+            "For each criterion ID listed under \"Criterion IDs to score\", return 1 if the LLM "
+            "response fully satisfies it, else 0, as a JSON object keyed by ID.\n"
+        )
+
+        def build_prompt(criteria: str, ids: List[str]) -> str:
+            return (
+                f"\nQuestion:\n\"\"\"{question}\"\"\"\n\n"
+                f"LLM Response:\n\"\"\"{response}\"\"\"\n\n"
+                f"Criterion IDs to score: {', '.join(ids)}"
+            )
+        scores = memoized_rubric_scores(
+            lambda known: score_rubrics_by_id(self.judge.complete, build_prompt, rubrics,
+                                              prefix=prefix, static_count=len(rubrics), known=known),
+            question, response, rubrics, self.judge.model, SCORING_PROMPT_VERSION
         )
-        out = self._call_llm(prompt)
-        body = out[out.find("{"): out.rfind("}") + 1]
-        scores = json.loads(body)
-        return {r: scores.get(r, 0) for r in rubrics}
+        if not scores:
+            raise RuntimeError("LLM call failed after retries")
+        return scores
 
 
     def run(self) -> None:
@@ -117,7 +124,8 @@ class ThemeRubricScorer:
                 rubric_scores = self._score_rubrics(question, response, rubrics)
                 rubric_scores_by_axis[axis] = rubric_scores
                 all_rubric_scores.update(rubric_scores)
-                axis_scores[axis] = sum(rubric_scores.values()) / len(rubric_scores)
+                scored = [v for v in rubric_scores.values() if v is not None]
+                axis_scores[axis] = sum(scored) / len(scored) if scored else 0.0
 
             total_score = sum(
                 axis_scores.get(ax, 0.0) * self.axis_weights.get(ax, 0.0)
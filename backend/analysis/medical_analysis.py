@@ -1,26 +1,57 @@
 import pandas as pd
 import json
-import openai
-from google import genai
-from google.genai import types
 import os
-import re
-import time
-from typing import List, Dict, Optional
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional
 from dotenv import load_dotenv
-from config import JUDGE_MODEL
+from config import JUDGE_MODEL, JUDGE_MAX_CONCURRENCY, M1_AXIS_WEIGHTS, RUBRIC_SOURCE
+from analysis.rubric_bank import RubricBank
+from analysis.axis_classifier import AXIS_DESCRIPTIONS, get_axis_classifier
+from utils.file_utils import read_csv_cached
+from utils.judge_client import get_judge_client
+from utils.journal import StageJournal
+from utils.rubric_scoring import (
+    SCORING_INSTRUCTIONS, STRING_LIST_SCHEMA, classify_rubrics_by_id, parse_json_response, score_rubrics_by_id,
+)
+from utils.cascade import JudgeCascade
+from utils.estimation import AdaptiveEstimate
+from utils.summary_stats import SummaryAggregator
+from utils.score_memo import memoized_rubric_scores
+from utils.token_utils import estimate_tokens
+from utils.batch_jobs import BatchPromptCollector, BatchProvider, run_in_phases
+from utils.partition_utils import ROW_ID_COLUMN, assign_row_ids
 load_dotenv()
 
+# Part of the rubric score memo key; bump when the scoring prompt changes so old scores are not reused
+SCORING_PROMPT_VERSION = "m1-score-1"
+
 
 class MedicalQualityEvaluator:
+    OUTPUT_COLUMNS = [
+        "medical_quality_score", "m1_rubrics", "m1_rubric_scores",
+        "m1_classification", "m1_axis_scores"
+    ]
+    SCORE_COLUMN = "medical_quality_score"
+    RUBRIC_SCORES_COLUMN = "m1_rubric_scores"
+    # Set only for rows that were fully scored; journaling and the cascade key off it
+    COMPLETE_COLUMN = "m1_rubrics"
+
     def __init__(self, dataset_path: str):
         # self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        self.client = genai.Client(api_key=api_key)
+        self.judge = get_judge_client(JUDGE_MODEL)
+        # Per-thread judge override and token meter, used by the judge cascade
+        self._local = threading.local()
+        # With RUBRIC_SOURCE "bank", questions near a banked question reuse its bank rubrics
+        self.rubric_bank = RubricBank.load() if RUBRIC_SOURCE == "bank" else None
+        self._bank_matches: Dict[str, Any] = {}
+        # Local rubric -> axis classifier (None when disabled or untrained)
+        self.axis_classifier = get_axis_classifier()
         self.dataset_path = dataset_path
         if not os.path.exists(dataset_path):
             raise FileNotFoundError(f"Dataset file not found: {dataset_path}")  
-        self.df = pd.read_csv(dataset_path)
+        self.df = read_csv_cached(dataset_path)
         required_columns = ['Questions', 'Answer', 'llm_response']
         missing_columns = [col for col in required_columns if col not in self.df.columns]
         if missing_columns:
@@ -32,20 +63,8 @@ class MedicalQualityEvaluator:
             "Communication",
             "Terminology Accessibility"
         ]
-        self.axis_weights = {
-            "Completeness": 0.25,
-            "Accuracy": 0.30,
-            "Context Awareness": 0.20,
-            "Communication": 0.15,
-            "Terminology Accessibility": 0.10
-        }
-        self.axis_descriptions = {
-            "Completeness": "Answer addresses all relevant aspects of the question comprehensively",
-            "Accuracy": "Medical information is factually correct and evidence-based",
-            "Context Awareness": "Response is appropriate for the specific medical context",
-            "Communication": "Information is communicated clearly and effectively",
-            "Terminology Accessibility": "Medical terms are explained accessibly for patients"
-        }
+        self.axis_weights = dict(M1_AXIS_WEIGHTS)
+        self.axis_descriptions = dict(AXIS_DESCRIPTIONS)
 
 
     # def call_llm(self, prompt: str, max_tokens: int = 800, temperature: float = 0.1) -> Optional[str]:
@@ -68,35 +87,33 @@ class MedicalQualityEvaluator:
     #     return None
     
 
-    def call_llm(self, prompt: str, max_tokens: int = 800, temperature: float = 0.1) -> Optional[str]:
-        """Call LLM with retry logic using the new Google GenAI SDK"""
-        max_retries = 3
-        generation_config = types.GenerateContentConfig(
-            max_output_tokens=max_tokens,
-            temperature=temperature,
-            thinking_config=types.ThinkingConfig(thinking_budget=0)
-        )
-        for attempt in range(max_retries):
-            try:
-                response = self.client.models.generate_content(
-                    model=JUDGE_MODEL, 
-                    contents=prompt,
-                    config=generation_config
-                )
-                if response and response.text:
-                    return response.text.strip()
-                else:
-                    print(f"Empty response received on attempt {attempt + 1}")
-                    
-            except Exception as e:
-                print(f"LLM call attempt {attempt + 1} failed: {str(e)}")
-                if attempt == max_retries - 1:
-                    print(f"LLM call failed after {max_retries} attempts: {e}")
-                    return None
-                wait_time = 2 ** (attempt + 1)
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)        
-        return None
+    def call_llm(self, prompt: str, max_tokens: int = 800, temperature: float = 0.1,
+                 response_schema: Optional[Dict[str, Any]] = None, prefix: Optional[str] = None) -> Optional[str]:
+        """Call the shared judge client (retries, backoff and throttling handled there)"""
+        judge = getattr(self._local, "judge", None) or self.judge
+        response = judge.complete(prompt, max_tokens=max_tokens, temperature=temperature,
+                                  response_schema=response_schema, prefix=prefix)
+        meter = getattr(self._local, "meter", None)
+        if meter is not None:
+            meter["input"] += estimate_tokens((prefix or "") + prompt)
+            meter["output"] += estimate_tokens(response or "")
+        return response
+
+
+    def current_judge_model(self) -> Optional[str]:
+        judge = getattr(self._local, "judge", None) or self.judge
+        return getattr(judge, "model", None)
+
+
+    @contextmanager
+    def using_judge(self, judge):
+        """Route this thread's judge calls to ``judge``; yields a dict of estimated tokens used"""
+        meter = {"input": 0, "output": 0}
+        self._local.judge, self._local.meter = judge, meter
+        try:
+            yield meter
+        finally:
+            self._local.judge, self._local.meter = None, None
 
 
     def generate_rubrics(self, question: str, gold_answer: str) -> List[str]:
@@ -127,112 +144,64 @@ Example format:
 
 JSON Response:"""
 
-        response = self.call_llm(prompt, max_tokens=600, temperature=0.3)
+        response = self.call_llm(prompt, max_tokens=600, temperature=0.3, response_schema=STRING_LIST_SCHEMA)
         if not response:
             return []
-        
-        try:
-            # Extract JSON from response
-            json_start = response.find('[')
-            json_end = response.rfind(']') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                rubrics = json.loads(json_str)
-                
-                # Validate that we got a list of strings
-                if isinstance(rubrics, list) and all(isinstance(r, str) for r in rubrics):
-                    if len(rubrics) < 10:
-                        print(f"Warning: Only {len(rubrics)} rubrics generated, expected 15-20")
-                    return rubrics
-                else:
-                    print("Warning: Invalid rubrics format received")
-                    return []
-            else:
-                print("Warning: No JSON array found in rubrics response")
-                return []
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error in rubric generation: {e}")
-            return []
-
-
-    def score_rubrics(self, question: str, llm_response: str, rubrics: List[str]) -> Dict[str, int]:
-        """Enhanced rubric scoring with clear JSON output format"""
-        rubrics_json = json.dumps(rubrics, indent=2)
-        
-        prompt = f"""You are an expert medical evaluator assessing AI-generated responses against specific quality criteria.
 
+        rubrics = parse_json_response(response, opening='[')
+        # Validate that we got a list of strings
+        if isinstance(rubrics, list) and all(isinstance(r, str) for r in rubrics):
+            if len(rubrics) < 10:
+                print(f"Warning: Only {len(rubrics)} rubrics generated, expected 15-20")
+            return rubrics
+        print("Warning: Invalid or missing JSON array in rubrics response")
+        return []
+
+
+    def score_rubrics(self, question: str, llm_response: str, rubrics: List[str],
+                      use_memo: bool = True) -> Dict[str, Optional[int]]:
+        """Score rubrics by ID with schema-constrained JSON; unscorable rubrics are None, not 0"""
+        def build_prompt(criteria: str, ids: List[str]) -> str:
+            return f"""
 Question Context:
 "{question}"
 
 LLM Response to Evaluate:
 "{llm_response}"
 
-Evaluation Criteria:
-{rubrics_json}
-
-Scoring Task:
-For each criterion, determine if the LLM response fully satisfies that requirement:
-- Score 1: The response clearly and adequately meets this criterion
-- Score 0: The response fails to meet this criterion, is insufficient, or is ambiguous
+Evaluation Criteria (ID: criterion):
+{criteria}
 
-Scoring Guidelines:
-- Be thorough but fair in your evaluation
-- Consider the medical context and patient needs
-- Look for evidence that each criterion is specifically addressed
-- If a criterion is partially met but not completely, score it as 0
-
-IMPORTANT: Return ONLY a JSON object where:
-- Keys are the exact rubric text (as provided above)
-- Values are either 0 or 1
-- Include ALL rubrics in your response
-- No explanations, no additional text, no markdown - just the raw JSON object
+Criterion IDs to score: {", ".join(ids)}
 
 JSON Response:"""
 
-        response = self.call_llm(prompt, max_tokens=800, temperature=0.1)
-        if not response:
-            return {}
-        
-        try:
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                scores = json.loads(json_str)
-                
-                # Validate scores format
-                valid_scores = {}
-                for rubric in rubrics:
-                    if rubric in scores and scores[rubric] in [0, 1]:
-                        valid_scores[rubric] = scores[rubric]
-                    else:
-                        print(f"Warning: Missing or invalid score for rubric: {rubric[:50]}...")
-                        valid_scores[rubric] = 0  # Default to 0 for missing scores
-                
-                if len(valid_scores) != len(rubrics):
-                    print(f"Warning: Only {len(valid_scores)}/{len(rubrics)} rubrics were properly scored")
-                
-                return valid_scores
-            else:
-                print("Warning: No JSON object found in scoring response")
-                return {}
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error in rubric scoring: {e}")
-            return {}
+        return memoized_rubric_scores(
+            lambda known: score_rubrics_by_id(self.call_llm, build_prompt, rubrics, max_tokens=800,
+                                              temperature=0.1, prefix=SCORING_INSTRUCTIONS, known=known),
+            question, llm_response, rubrics, self.current_judge_model(), SCORING_PROMPT_VERSION, use_memo
+        )
 
 
     def classify_rubrics_to_axes(self, rubrics: List[str]) -> Dict[str, List[str]]:
-        """Enhanced rubric classification with strict requirements and fallback handling"""
+        """Assign rubrics to axes with the local classifier; only low-confidence ones go to the judge"""
+        if self.axis_classifier is None:
+            return self.classify_rubrics_with_judge(rubrics)
+        return self.axis_classifier.classify(rubrics, self.selected_axes, fallback=self.classify_rubrics_with_judge)
+
+
+    def classify_rubrics_with_judge(self, rubrics: List[str]) -> Dict[str, List[str]]:
+        """Classify rubrics by ID into the quality dimensions with schema-constrained JSON"""
         axes_desc = "\n".join([f"- {axis}: {desc}" for axis, desc in self.axis_descriptions.items()])
-        rubrics_json = json.dumps(rubrics, indent=2)
-        
-        prompt = f"""You are classifying evaluation rubrics into predefined quality dimensions for medical response assessment.
+
+        def build_prompt(rubric_list: str) -> str:
+            return f"""You are classifying evaluation rubrics into predefined quality dimensions for medical response assessment.
 
 Available Quality Dimensions:
 {axes_desc}
 
-Rubrics to Classify:
-{rubrics_json}
+Rubrics to Classify (ID: rubric):
+{rubric_list}
 
 Classification Rules:
 - EVERY rubric MUST be assigned to exactly ONE dimension
@@ -246,60 +215,26 @@ Assign each rubric to its most appropriate dimension. Be decisive and ensure com
 
 IMPORTANT: Return ONLY a JSON object where:
 - Keys are the exact dimension names from above
-- Values are arrays of rubric strings that belong to that dimension
-- Every rubric from the input list must appear exactly once
+- Values are arrays of rubric IDs (r1, r2, ...) that belong to that dimension
+- Every rubric ID from the input list must appear exactly once
 - Include an "unclassified" key with an empty array (it should remain empty if you follow the rules)
 
 Example format:
 {{
-  "Dimension1": ["rubric text 1", "rubric text 2"],
-  "Dimension2": ["rubric text 3"],
+  "Dimension1": ["r1", "r2"],
+  "Dimension2": ["r3"],
   "unclassified": []
 }}
 
 JSON Response:"""
 
-        response = self.call_llm(prompt, max_tokens=1000, temperature=0.1)
-        if not response:
-            return {}
-        
-        try:
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                classification = json.loads(json_str)
-                
-                # Validate and fix classification
-                final_classification = {}
-                
-                # Initialize with empty lists for all axes plus unclassified
-                for axis in self.selected_axes:
-                    final_classification[axis] = classification.get(axis, [])
-                final_classification["unclassified"] = classification.get("unclassified", [])
-                
-                # Check which rubrics were classified
-                classified_rubrics = []
-                for rubric_list in final_classification.values():
-                    classified_rubrics.extend(rubric_list)
-                
-                # Find missing rubrics and assign them to unclassified
-                missing_rubrics = [r for r in rubrics if r not in classified_rubrics]
-                if missing_rubrics:
-                    print(f"Warning: {len(missing_rubrics)} rubrics were not classified, adding to unclassified")
-                    final_classification["unclassified"].extend(missing_rubrics)
-                
-                # Report classification results
-                total_classified = sum(len(rubrics_list) for rubrics_list in final_classification.values())
-                print(f"Classification complete: {total_classified} total assignments, {len(final_classification['unclassified'])} unclassified")
-                
-                return final_classification
-            else:
-                print("Warning: No JSON object found in classification response")
-                return {}
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error in rubric classification: {e}")
-            return {}
+        classification = classify_rubrics_by_id(
+            self.call_llm, build_prompt, rubrics, self.selected_axes, max_tokens=1000, temperature=0.1
+        )
+        if classification:
+            total_classified = sum(len(rubrics_list) for rubrics_list in classification.values())
+            print(f"Classification complete: {total_classified} total assignments, {len(classification['unclassified'])} unclassified")
+        return classification
 
 
     def calculate_axis_scores(self, rubric_scores: Dict[str, int], classification: Dict[str, List[str]]) -> Dict[str, float]:
@@ -309,7 +244,8 @@ JSON Response:"""
             if axis == "unclassified":
                 continue  # Skip unclassified rubrics in scoring
                 
-            valid_rubrics = [rubric_scores[r] for r in rubrics if r in rubric_scores]
+            # Rubrics the judge never scored (None) are left out rather than counted as 0
+            valid_rubrics = [rubric_scores[r] for r in rubrics if rubric_scores.get(r) is not None]
             if valid_rubrics:
                 axis_scores[axis] = sum(valid_rubrics) / len(valid_rubrics)
             else:
@@ -324,75 +260,169 @@ JSON Response:"""
         return sum(axis_scores.get(axis, 0.0) * self.axis_weights.get(axis, 0.0) for axis in self.selected_axes)
 
 
-    def run_and_update_scores(self) -> None:
-        """Enhanced main evaluation loop with better error handling"""
-        medical_scores = []
-        detailed_rows = []
-        # Embed detailed data directly into main dataframe columns for simplified storage
-        m1_rubrics_col, m1_rubric_scores_col = [], []
-        m1_classification_col, m1_axis_scores_col = [], []
-        
+    def evaluate_row(self, question: str, gold_answer: str, llm_response: str) -> Dict[str, Any]:
+        """Score one row; returns a value for every OUTPUT_COLUMNS entry (details None on failure)."""
+        outputs = self._failed_outputs()
+        banked = self._bank_matches.get(question)
+        rubrics = banked[0] if banked else self.generate_rubrics(question, gold_answer)
+        if not rubrics:
+            return outputs
+        rubric_scores = self.score_rubrics(question, llm_response, rubrics)
+        if not rubric_scores:
+            return outputs
+        classification = banked[1] if banked else self.classify_rubrics_to_axes(rubrics)
+        if not any(classification.get(axis) for axis in self.selected_axes):
+            return outputs
+        axis_scores = self.calculate_axis_scores(rubric_scores, classification)
+        outputs['medical_quality_score'] = self.calculate_medical_quality_score(axis_scores)
+        outputs['m1_rubrics'] = json.dumps(rubrics)
+        outputs['m1_rubric_scores'] = json.dumps(rubric_scores)
+        outputs['m1_classification'] = json.dumps(classification)
+        outputs['m1_axis_scores'] = json.dumps(axis_scores)
+        return outputs
+
+
+    def prefiltered_outputs(self, reason: str) -> Dict[str, Any]:
+        """Deterministic zero score for responses that need no judge (errors, empty text)"""
+        print(f"Scoring without judge: {reason}")
+        outputs = self._failed_outputs()
+        outputs['m1_rubrics'] = json.dumps([])
+        outputs['m1_rubric_scores'] = json.dumps({})
+        outputs['m1_classification'] = json.dumps({})
+        outputs['m1_axis_scores'] = json.dumps({axis: 0.0 for axis in self.selected_axes})
+        return outputs
+
+
+    def agreement_scores(self, question: str, llm_response: str, outputs: Dict[str, Any]) -> Dict[str, Optional[int]]:
+        """Score the row's rubrics again, to measure how consistent the current judge is"""
+        return self.score_rubrics(question, llm_response, json.loads(outputs['m1_rubrics']), use_memo=False)
+
+
+    def _failed_outputs(self) -> Dict[str, Any]:
+        outputs: Dict[str, Any] = {col: None for col in self.OUTPUT_COLUMNS}
+        outputs['medical_quality_score'] = 0.0
+        return outputs
+
+
+    def _unsampled_outputs(self) -> Dict[str, Any]:
+        return {col: None for col in self.OUTPUT_COLUMNS}
+
+
+    def run_and_update_scores(self, journal_path: Optional[str] = None,
+                              max_workers: int = JUDGE_MAX_CONCURRENCY,
+                              batch_provider: Optional[BatchProvider] = None,
+                              batch_dir: Optional[str] = None,
+                              cascade: Optional[JudgeCascade] = None,
+                              reference_scores: Optional[Dict[str, float]] = None,
+                              estimate: Optional[AdaptiveEstimate] = None,
+                              aggregator: Optional[SummaryAggregator] = None) -> None:
+        """Main evaluation loop over independent rows, run concurrently.
+
+        The shared judge client decides how many calls are really in flight. With a journal,
+        finished rows are recorded as they complete and replayed on restart. With a batch
+        provider, each judge step runs for all rows as one batch job instead. With a cascade
+        (not combined with batch mode), rows go cheap judge first and are escalated when
+        unsure; ``reference_scores`` maps row_id to SBERT similarity for that check. With an
+        estimate (also not combined with batch mode), only a stratified sample is judged,
+        until the score's confidence interval is narrow enough; other rows are left empty.
+        An aggregator receives each row's scores as soon as the row finishes.
+        """
+        journal = StageJournal(journal_path) if journal_path else None
+        completed = journal.load() if journal else {}
+        assign_row_ids(self.df)
+        if completed:
+            print(f"Resuming from journal: {len(completed)} rows already scored")
+
         print(f"Processing {len(self.df)} rows...")
-        
+        rows = []
         for idx, row in self.df.iterrows():
+            question_val = row.at['Questions'] if 'Questions' in row else ''
+            gold_answer_val = row.at['Answer'] if 'Answer' in row else ''
+            llm_response_val = row.at['llm_response'] if 'llm_response' in row else ''
+            question = str(question_val) if not pd.isna(question_val) else ""
+            gold_answer = str(gold_answer_val) if not pd.isna(gold_answer_val) else ""
+            llm_response = str(llm_response_val) if not pd.isna(llm_response_val) else ""
+            rows.append((idx, row[ROW_ID_COLUMN], question, gold_answer, llm_response))
+        if self.rubric_bank is not None:
+            # One batched embedding for every question still to score
+            self._bank_matches = self.rubric_bank.lookup_many(
+                [question for _, row_id, question, _, _ in rows if row_id not in completed]
+            )
+            print(f"Rubric bank: {len(self._bank_matches)} questions use bank rubrics, "
+                  f"the rest generate their own")
+
+        def score_row(item) -> Dict[str, Any]:
+            idx, row_id, question, gold_answer, llm_response = item
+            if row_id in completed:
+                return completed[row_id]
             if idx % 10 == 0:
                 print(f"Processing row {idx}/{len(self.df)}")
             try:
-                question_val = row.at['Questions'] if 'Questions' in row else ''
-                gold_answer_val = row.at['Answer'] if 'Answer' in row else ''
-                llm_response_val = row.at['llm_response'] if 'llm_response' in row else ''
-                question = str(question_val) if not pd.isna(question_val) else ""
-                gold_answer = str(gold_answer_val) if not pd.isna(gold_answer_val) else ""
-                llm_response = str(llm_response_val) if not pd.isna(llm_response_val) else ""
-                rubrics = self.generate_rubrics(question, gold_answer)
-                if not rubrics:
-                    medical_scores.append(0.0)
-                    continue
-                rubric_scores = self.score_rubrics(question, llm_response, rubrics)
-                if not rubric_scores:
-                    medical_scores.append(0.0)
-                    continue
-                classification = self.classify_rubrics_to_axes(rubrics)
-                if not any(classification[axis] for axis in self.selected_axes):
-                    medical_scores.append(0.0)
-                    continue
-                axis_scores = self.calculate_axis_scores(rubric_scores, classification)
-                medical_score = self.calculate_medical_quality_score(axis_scores)
-                medical_scores.append(medical_score)
-
-                # Append row-wise detailed JSON columns for consolidated CSV
-                m1_rubrics_col.append(json.dumps(rubrics))
-                m1_rubric_scores_col.append(json.dumps(rubric_scores))
-                m1_classification_col.append(json.dumps(classification))
-                m1_axis_scores_col.append(json.dumps(axis_scores))
-
-                detailed_rows.append({
-                    'question': question,
-                    'gold_standard_answer': gold_answer,
-                    'llm_response': llm_response,
-                    'rubrics': json.dumps(rubrics),
-                    'rubric_scores': json.dumps(rubric_scores),
-                    'classification': json.dumps(classification),
-                    'axis_scores': json.dumps(axis_scores),
-                    'medical_quality_score': medical_score
-                })
+                if cascade is not None:
+                    reference = (reference_scores or {}).get(row_id)
+                    outputs = cascade.evaluate(self, question, gold_answer, llm_response, reference)
+                else:
+                    outputs = self.evaluate_row(question, gold_answer, llm_response)
             except Exception as e:
                 print(f"Error processing row {idx}: {e}")
-                medical_scores.append(0.0)
-                continue
-        
-        # Critical fix: Ensure alignment between scores and dataframe
-        assert len(medical_scores) == len(self.df), f"Score length mismatch: {len(medical_scores)} vs {len(self.df)}"
-        
-        self.df['medical_quality_score'] = medical_scores
-        # Attach detailed columns (prefixed m1_) to main dataframe
-        self.df['m1_rubrics'] = m1_rubrics_col
-        self.df['m1_rubric_scores'] = m1_rubric_scores_col
-        self.df['m1_classification'] = m1_classification_col
-        self.df['m1_axis_scores'] = m1_axis_scores_col
-        self.detailed_df = pd.DataFrame(detailed_rows)
-        
-        print(f"Evaluation complete. Average medical quality score: {sum(medical_scores)/len(medical_scores):.3f}")
+                outputs = self._failed_outputs()
+            # Only fully scored rows are journaled so failed rows are retried on restart
+            if journal and outputs['m1_rubrics'] is not None:
+                journal.record(row_id, outputs)
+            return outputs
+
+        def process(item) -> Dict[str, Any]:
+            outputs = score_row(item)
+            # Batch mode replays every row in each phase, so those rows are aggregated at the end
+            if aggregator is not None and batch_provider is None:
+                aggregator.add_row(outputs)
+            return outputs
+
+        def run_pass() -> List[Dict[str, Any]]:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                return list(pool.map(process, rows))
+
+        if estimate is not None:
+            row_outputs = estimate.run(process, rows, self.SCORE_COLUMN,
+                                       self._unsampled_outputs, max_workers)
+        elif batch_provider is None:
+            row_outputs = run_pass()
+        else:
+            collector = BatchPromptCollector(self.judge)
+            self.judge = collector
+            try:
+                row_outputs = run_in_phases(collector, run_pass, batch_provider, batch_dir)
+            finally:
+                self.judge = collector.judge
+
+        # Attach score and detailed columns (prefixed m1_) to main dataframe
+        for col in self.OUTPUT_COLUMNS:
+            self.df[col] = [outputs.get(col) for outputs in row_outputs]
+        if aggregator is not None:
+            if batch_provider is not None:
+                aggregator.add_frame(self.df)
+            else:
+                aggregator.flush()
+        medical_scores = self.df['medical_quality_score']
+        print(f"Evaluation complete. Average medical quality score: {medical_scores.mean():.3f}")
+
+
+    @property
+    def detailed_df(self) -> pd.DataFrame:
+        """Per-row rubric details, built from the scored columns when asked for instead of kept as a copy"""
+        if 'm1_rubrics' not in self.df.columns:
+            return pd.DataFrame()
+        scored = self.df[self.df['m1_rubrics'].notna()]
+        return pd.DataFrame({
+            'question': scored['Questions'],
+            'gold_standard_answer': scored['Answer'],
+            'llm_response': scored['llm_response'],
+            'rubrics': scored['m1_rubrics'],
+            'rubric_scores': scored['m1_rubric_scores'],
+            'classification': scored['m1_classification'],
+            'axis_scores': scored['m1_axis_scores'],
+            'medical_quality_score': scored['medical_quality_score'],
+        }).reset_index(drop=True)
 
 
     def save_updated_dataset(self, output_path: str):
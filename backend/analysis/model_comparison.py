@@ -0,0 +1,167 @@
+import json
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import COMPARISON_ALPHA, COMPARISON_BOOTSTRAP_SAMPLES, COMPARISON_SEED
+from utils.file_utils import atomic_write_text
+from utils.parquet_utils import load_scored_dataset
+from utils.summary_stats import SUMMARY_METRICS
+
+# Summary key -> score column, as in summary_scores.csv
+METRIC_COLUMNS = SUMMARY_METRICS
+LOWER_IS_BETTER = {"perplexity"}
+
+
+def load_dataset_runs(dataset_dir: str) -> Dict[str, pd.DataFrame]:
+    """model -> its scored rows (Questions plus metric columns), one row per question."""
+    wanted = ["Questions"] + list(METRIC_COLUMNS.values())
+    runs = {}
+    for run_dir in sorted(p for p in Path(dataset_dir).iterdir() if p.is_dir()):
+        parquet_path = run_dir / "scored_final_dataset.parquet"
+        csv_path = run_dir / "scored_final_dataset.csv"
+        if parquet_path.exists():
+            df = load_scored_dataset(str(parquet_path), columns=wanted)
+        elif csv_path.exists():
+            df = pd.read_csv(csv_path, usecols=lambda c: c in wanted)
+        else:
+            continue
+        if "Questions" in df.columns:
+            runs[run_dir.name] = df.dropna(subset=["Questions"]).drop_duplicates("Questions")
+    return runs
+
+
+def question_index(runs: Dict[str, pd.DataFrame]) -> pd.Index:
+    """Union of the questions over every model, shared by all metrics of a dataset."""
+    questions = pd.Index([])
+    for df in runs.values():
+        questions = questions.union(pd.Index(df["Questions"]), sort=False)
+    return questions
+
+
+def align_metric(runs: Dict[str, pd.DataFrame], column: str,
+                 questions: Optional[pd.Index] = None) -> Tuple[List[str], np.ndarray]:
+    """(models, values) where values[q, m] is model m's score on question q (NaN if missing).
+
+    Questions come from ``questions`` (default: the union over models); pairs are later
+    compared on the questions both models have a score for.
+    """
+    questions = question_index(runs) if questions is None else questions
+    series = {model: pd.to_numeric(df.set_index("Questions")[column], errors="coerce").reindex(questions)
+              for model, df in runs.items() if column in df.columns}
+    if not series:
+        return [], np.zeros((0, 0))
+    table = pd.DataFrame(series)
+    return list(table.columns), table.to_numpy(dtype=np.float64)
+
+
+def bootstrap_counts(n_questions: int, n_boot: int = COMPARISON_BOOTSTRAP_SAMPLES,
+                     seed: int = COMPARISON_SEED) -> np.ndarray:
+    """How often each question is drawn in each resample (n_boot x n_questions).
+
+    Drawn once per dataset and reused for every metric.
+    """
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, n_questions, size=(n_boot, n_questions))
+    draws += np.arange(n_boot)[:, None] * n_questions
+    return np.bincount(draws.ravel(), minlength=n_boot * n_questions).reshape(n_boot, n_questions).astype(np.float64)
+
+
+def paired_bootstrap(values: np.ndarray, pairs: List[Tuple[int, int]], n_boot: int = COMPARISON_BOOTSTRAP_SAMPLES,
+                     alpha: float = COMPARISON_ALPHA, seed: int = COMPARISON_SEED,
+                     counts: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Mean difference (a - b), percentile CI and two-sided p-value for every pair at once.
+
+    Every pair shares the same resamples of questions: the count matrix (n_boot x questions,
+    see ``bootstrap_counts``) times the matrix of per-question differences gives all bootstrap
+    means in a single product. Questions a pair is missing a score for drop out of that
+    pair's means through the matching count of valid questions.
+    """
+    a, b = np.asarray([p[0] for p in pairs]), np.asarray([p[1] for p in pairs])
+    diffs = values[:, a] - values[:, b]
+    valid = ~np.isnan(diffs)
+    filled = np.where(valid, diffs, 0.0)
+    n = valid.sum(axis=0)
+    mean = np.divide(filled.sum(axis=0), n, out=np.full(len(pairs), np.nan), where=n > 0)
+    if counts is None:
+        counts = bootstrap_counts(len(values), n_boot, seed)
+    boot_n = counts @ valid
+    boot = np.divide(counts @ filled, boot_n, out=np.full(boot_n.shape, np.nan), where=boot_n > 0)
+    low, high = np.nanpercentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    below = np.mean(boot <= 0, axis=0)
+    above = np.mean(boot >= 0, axis=0)
+    p_value = np.where(n > 0, np.minimum(1.0, 2 * np.minimum(below, above)), np.nan)
+    return {"n": n, "mean_diff": mean, "ci_low": low, "ci_high": high, "p_value": p_value}
+
+
+def win_rates(values: np.ndarray, pairs: List[Tuple[int, int]]) -> Dict[str, np.ndarray]:
+    """Share of jointly scored questions where a beats (higher value), ties or loses to b."""
+    a, b = np.asarray([p[0] for p in pairs]), np.asarray([p[1] for p in pairs])
+    diffs = values[:, a] - values[:, b]
+    valid = ~np.isnan(diffs)
+    n = np.maximum(valid.sum(axis=0), 1)
+    return {
+        "win_rate": ((diffs > 0) & valid).sum(axis=0) / n,
+        "tie_rate": ((diffs == 0) & valid).sum(axis=0) / n,
+        "loss_rate": ((diffs < 0) & valid).sum(axis=0) / n,
+    }
+
+
+def _round(value: Any) -> Any:
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+def compare_models(runs: Dict[str, pd.DataFrame], n_boot: int = COMPARISON_BOOTSTRAP_SAMPLES,
+                   alpha: float = COMPARISON_ALPHA, seed: int = COMPARISON_SEED) -> Dict[str, Any]:
+    """Per metric: model means and, for every model pair, win rates and paired bootstrap stats.
+
+    Pair stats are oriented so that positive means a is better: mean_diff and its CI are
+    a - b, or b - a for LOWER_IS_BETTER metrics, and win_rate counts the questions where a
+    is better. Means are the raw metric values.
+    """
+    result: Dict[str, Any] = {"models": sorted(runs), "alpha": alpha, "n_boot": n_boot, "metrics": {}}
+    questions = question_index(runs)
+    counts = bootstrap_counts(len(questions), n_boot, seed) if len(questions) else None
+    for key, column in METRIC_COLUMNS.items():
+        models, values = align_metric(runs, column, questions)
+        if len(models) < 2 or len(values) == 0:
+            continue
+        pairs = list(combinations(range(len(models)), 2))
+        oriented = -values if key in LOWER_IS_BETTER else values
+        stats = paired_bootstrap(oriented, pairs, n_boot, alpha, seed, counts)
+        stats.update(win_rates(oriented, pairs))
+        scored = (~np.isnan(values)).sum(axis=0)
+        means = np.divide(np.nansum(values, axis=0), scored, out=np.full(len(models), np.nan), where=scored > 0)
+        result["metrics"][key] = {
+            "lower_is_better": key in LOWER_IS_BETTER,
+            "means": {model: _round(m) for model, m in zip(models, means)},
+            "pairs": [
+                {
+                    "a": models[i], "b": models[j], "n": int(stats["n"][p]),
+                    **{name: _round(stats[name][p]) for name in
+                       ("mean_diff", "ci_low", "ci_high", "p_value", "win_rate", "tie_rate", "loss_rate")},
+                    "significant": bool(stats["p_value"][p] < alpha),
+                }
+                for p, (i, j) in enumerate(pairs)
+            ],
+        }
+    return result
+
+
+def write_comparisons(datasets_root: str, output_name: str = "model_comparison.json",
+                      datasets: Optional[List[str]] = None, **kwargs) -> Dict[str, str]:
+    """Compare the models of each dataset and write ``<dataset>/<output_name>``; returns paths."""
+    written = {}
+    for dataset_dir in sorted(p for p in Path(datasets_root).iterdir() if p.is_dir()):
+        if datasets and dataset_dir.name not in datasets:
+            continue
+        runs = load_dataset_runs(str(dataset_dir))
+        if len(runs) < 2:
+            continue
+        comparison = {"dataset": dataset_dir.name, **compare_models(runs, **kwargs)}
+        path = dataset_dir / output_name
+        atomic_write_text(json.dumps(comparison, separators=(",", ":")), str(path))
+        written[dataset_dir.name] = str(path)
+    return written
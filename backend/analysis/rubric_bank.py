@@ -0,0 +1,233 @@
+import json
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import (
+    M1_AXIS_WEIGHTS,
+    RUBRIC_BANK_DIR,
+    RUBRIC_BANK_MAX_RUBRICS,
+    RUBRIC_BANK_MIN_SIMILARITY,
+    RUBRIC_BANK_NEIGHBORS,
+)
+from utils.embedding_utils import cosine_top_k, embed_texts
+from utils.parquet_utils import load_scored_dataset
+from utils.rubric_scoring import classify_rubrics_by_id
+
+AXES = list(M1_AXIS_WEIGHTS)
+HISTORY_COLUMNS = [
+    "Questions", "m1_rubrics", "m1_classification",
+    "m2_generated_rubrics", "m2_classification", "m2_generated_classification",
+]
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return None
+
+
+def _axis_lookup(classification: Any) -> Dict[str, str]:
+    if not isinstance(classification, dict):
+        return {}
+    return {rubric: axis for axis, rubrics in classification.items()
+            if axis != "unclassified" for rubric in (rubrics or [])}
+
+
+def collect_rubric_history(datasets_root: str) -> pd.DataFrame:
+    """Every generated rubric under <dataset>/<model> runs, with its question and judge axis.
+
+    Uses m1 rubrics and m2's generated rubrics (the fixed m2 rubrics are not generated).
+    Axis is None where the rubric was never placed on an axis.
+    """
+    records = []
+    for run_dir in sorted(p for p in Path(datasets_root).glob("*/*") if p.is_dir()):
+        parquet_path = run_dir / "scored_final_dataset.parquet"
+        csv_path = run_dir / "scored_final_dataset.csv"
+        if parquet_path.exists():
+            df = load_scored_dataset(str(parquet_path), columns=HISTORY_COLUMNS)
+        elif csv_path.exists():
+            df = pd.read_csv(csv_path, usecols=lambda c: c in HISTORY_COLUMNS)
+        else:
+            continue
+        for _, row in df.iterrows():
+            question = row.get("Questions")
+            if not isinstance(question, str) or not question.strip():
+                continue
+            m2_classification = row.get("m2_generated_classification")
+            if _decode(m2_classification) in (None, {}):
+                m2_classification = row.get("m2_classification")
+            for source, rubrics_col, classification in (
+                ("m1", "m1_rubrics", row.get("m1_classification")),
+                ("m2", "m2_generated_rubrics", m2_classification),
+            ):
+                axes = _axis_lookup(_decode(classification))
+                for rubric in _decode(row.get(rubrics_col)) or []:
+                    if isinstance(rubric, str) and rubric.strip():
+                        records.append((question, rubric, axes.get(rubric), source, run_dir.parent.name))
+    return pd.DataFrame(records, columns=["question", "rubric", "axis", "source", "dataset"])
+
+
+def cluster_rubrics(embeddings: np.ndarray, method: str = "hdbscan", min_cluster_size: int = 3,
+                    n_clusters: Optional[int] = None) -> Tuple[np.ndarray, Dict[int, int]]:
+    """Cluster unit-normalized rubric embeddings; returns (label per rubric, label -> medoid index).
+
+    hdbscan noise points become singleton clusters, so every rubric maps to some bank entry.
+    """
+    if method == "hdbscan":
+        import hdbscan
+        # Euclidean distance on unit vectors orders pairs the same way as cosine distance
+        labels = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric="euclidean").fit_predict(embeddings)
+        labels = labels.copy()
+        next_label = labels.max() + 1
+        for i in np.flatnonzero(labels == -1):
+            labels[i] = next_label
+            next_label += 1
+        medoids = {}
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            sims = embeddings[members] @ embeddings[members].T
+            medoids[int(label)] = int(members[np.argmax(sims.sum(axis=1))])
+        return labels, medoids
+    if method == "kmedoids":
+        import kmedoids
+        k = n_clusters or max(1, len(embeddings) // 4)
+        distances = 1.0 - (embeddings @ embeddings.T).astype(np.float64)
+        result = kmedoids.fasterpam(np.clip(distances, 0.0, None), k, random_state=0)
+        labels = np.asarray(result.labels)
+        return labels, {int(label): int(result.medoids[label]) for label in np.unique(labels)}
+    raise ValueError(f"Unknown clustering method: {method}")
+
+
+class RubricBank:
+    """Deduplicated rubrics (cluster medoids, one axis each) and the questions they came from.
+
+    ``lookup_many`` finds the banked questions nearest to a new question and returns the bank
+    rubrics those questions used, so m1 can skip rubric generation and classification.
+    """
+
+    def __init__(self, rubrics: pd.DataFrame, questions: pd.DataFrame, question_embeddings: np.ndarray):
+        # Row position is the bank ID
+        self.rubrics = rubrics.sort_values("bank_id").reset_index(drop=True)
+        self.questions = questions.reset_index(drop=True)
+        self.question_embeddings = question_embeddings.astype(np.float32)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def build(cls, history: pd.DataFrame, method: str = "hdbscan", min_cluster_size: int = 3,
+              n_clusters: Optional[int] = None, judge=None) -> "RubricBank":
+        """Cluster ``collect_rubric_history`` output into a bank.
+
+        Each medoid's axis is the majority of the judge's past placements of its cluster
+        members; medoids with no placement are classified in one call to ``judge`` if given.
+        """
+        texts = list(dict.fromkeys(history["rubric"]))
+        labels, medoids = cluster_rubrics(embed_texts(texts), method, min_cluster_size, n_clusters)
+        label_of = dict(zip(texts, labels.tolist()))
+        bank_id_of_label = {label: bank_id for bank_id, label in enumerate(sorted(medoids))}
+
+        axis_votes: Dict[int, Counter] = defaultdict(Counter)
+        for rubric, axis in zip(history["rubric"], history["axis"]):
+            if isinstance(axis, str) and axis in AXES:
+                axis_votes[label_of[rubric]][axis] += 1
+        sizes = Counter(labels.tolist())
+        rubric_rows = []
+        for label, bank_id in bank_id_of_label.items():
+            votes = axis_votes.get(label)
+            rubric_rows.append({
+                "bank_id": bank_id,
+                "rubric": texts[medoids[label]],
+                "axis": votes.most_common(1)[0][0] if votes else None,
+                "cluster_size": sizes[label],
+                "uses": 0,
+            })
+        rubrics = pd.DataFrame(rubric_rows)
+        unplaced = rubrics["axis"].isna()
+        if unplaced.any() and judge is not None:
+            classification = classify_rubrics_by_id(
+                judge.complete,
+                lambda block: (
+                    "Assign each evaluation criterion (ID: criterion) to exactly one quality axis: "
+                    f"{', '.join(AXES)}. Use \"unclassified\" if none fits.\n\n{block}\n\nJSON Response:"
+                ),
+                rubrics.loc[unplaced, "rubric"].tolist(), AXES,
+            )
+            axis_of = _axis_lookup(classification)
+            rubrics.loc[unplaced, "axis"] = rubrics.loc[unplaced, "rubric"].map(axis_of)
+        rubrics["axis"] = rubrics["axis"].fillna("unclassified")
+
+        bank_ids_by_question: Dict[str, List[int]] = defaultdict(list)
+        for question, rubric in zip(history["question"], history["rubric"]):
+            bank_id = bank_id_of_label[label_of[rubric]]
+            if bank_id not in bank_ids_by_question[question]:
+                bank_ids_by_question[question].append(bank_id)
+        questions = pd.DataFrame({
+            "question": list(bank_ids_by_question),
+            "bank_ids": [json.dumps(ids) for ids in bank_ids_by_question.values()],
+        })
+        uses = Counter(i for ids in bank_ids_by_question.values() for i in ids)
+        rubrics["uses"] = rubrics["bank_id"].map(uses).fillna(0).astype(int)
+        print(f"Rubric bank: {len(texts)} distinct rubrics -> {len(rubrics)} bank rubrics "
+              f"from {len(questions)} questions")
+        return cls(rubrics, questions, embed_texts(questions["question"].tolist()))
+
+    def save(self, bank_dir: str = RUBRIC_BANK_DIR) -> None:
+        path = Path(bank_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        self.rubrics.to_csv(path / "rubrics.csv", index=False)
+        self.questions.to_csv(path / "questions.csv", index=False)
+        np.save(path / "question_embeddings.npy", self.question_embeddings)
+        print(f"Rubric bank saved to: {path}")
+
+    @classmethod
+    def load(cls, bank_dir: str = RUBRIC_BANK_DIR) -> Optional["RubricBank"]:
+        path = Path(bank_dir)
+        if not (path / "rubrics.csv").exists():
+            print(f"Warning: no rubric bank at {path}, rubrics will be generated")
+            return None
+        return cls(
+            pd.read_csv(path / "rubrics.csv"),
+            pd.read_csv(path / "questions.csv"),
+            np.load(path / "question_embeddings.npy"),
+        )
+
+    def lookup_many(self, questions: List[str], k: int = RUBRIC_BANK_NEIGHBORS,
+                    min_similarity: float = RUBRIC_BANK_MIN_SIMILARITY,
+                    max_rubrics: int = RUBRIC_BANK_MAX_RUBRICS) -> Dict[str, Tuple[List[str], Dict[str, List[str]]]]:
+        """question -> (rubrics, classification) for questions with a close enough banked neighbour.
+
+        Bank rubrics are ranked by the summed similarity of the neighbours that used them.
+        """
+        unique = [q for q in dict.fromkeys(questions) if q]
+        if not unique or len(self.questions) == 0:
+            return {}
+        indices, sims = cosine_top_k(embed_texts(unique), self.question_embeddings, k)
+        bank_ids = [json.loads(ids) for ids in self.questions["bank_ids"]]
+        texts = self.rubrics["rubric"].tolist()
+        axes = self.rubrics["axis"].tolist()
+        matches = {}
+        for question, neighbour_idx, neighbour_sims in zip(unique, indices, sims):
+            votes: Counter = Counter()
+            for i, sim in zip(neighbour_idx, neighbour_sims):
+                if sim >= min_similarity:
+                    for bank_id in bank_ids[i]:
+                        votes[bank_id] += float(sim)
+            if not votes:
+                continue
+            chosen = [bank_id for bank_id, _ in votes.most_common(max_rubrics)]
+            classification: Dict[str, List[str]] = {axis: [] for axis in AXES + ["unclassified"]}
+            for bank_id in chosen:
+                classification[axes[bank_id] if axes[bank_id] in classification else "unclassified"].append(texts[bank_id])
+            matches[question] = ([texts[bank_id] for bank_id in chosen], classification)
+        with self._lock:
+            self.stats["hits"] += len(matches)
+            self.stats["misses"] += len(unique) - len(matches)
+        return matches
@@ -0,0 +1,284 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from config import M1_AXIS_WEIGHTS, M2_AXIS_WEIGHTS, M2_GENERATED_RUBRICS_PER_AXIS
+from utils.file_utils import atomic_write_csv
+from utils.estimation import row_strata, stratified_interval
+from utils.parquet_utils import load_scored_dataset, save_scored_dataset
+from utils.partition_utils import ROW_ID_COLUMN, partition_exists, read_partition, write_partition
+from utils.results_warehouse import get_results_warehouse, input_row_ids
+from utils.summary_stats import STAGE_METRICS, SummaryStore, write_summary_csv
+
+# Axes whose rubrics m2 generates (and caps); the other axes use the fixed rubrics
+M2_GENERATED_AXES = ["Accuracy", "Completeness"]
+# Cap applied to m2 rows stored before the untrimmed classification was kept
+LEGACY_M2_CAP = 4
+# Scores of the medical stages: summary key, stage (partition / shard name) and column
+MEDICAL_STAGES = [("med1", "medical", "medical_quality_score"), ("med2", "medical_2", "medical_quality_score_2")]
+
+
+def _decode(value: Any) -> Any:
+    """JSON cell (CSV) or already-decoded value (Parquet) -> list/dict, or None."""
+    if isinstance(value, (dict, list)):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return None
+
+
+def rubric_score_frame(scores: List[Any], classifications: List[Any]) -> pd.DataFrame:
+    """Long frame with one row per (dataset row, axis, rubric): position in the axis and score.
+
+    Rows without decodable scores or classification are left out; unscored rubrics have a
+    NaN score, so axis means skip them as the evaluators do.
+    """
+    row, axis_col, rank, score = [], [], [], []
+    for pos, (row_scores, classification) in enumerate(zip(scores, classifications)):
+        if not isinstance(row_scores, dict) or not isinstance(classification, dict):
+            continue
+        for axis, rubrics in classification.items():
+            if axis == "unclassified":
+                continue
+            for i, rubric in enumerate(rubrics or []):
+                row.append(pos)
+                axis_col.append(axis)
+                rank.append(i)
+                score.append(row_scores.get(rubric))
+    return pd.DataFrame({
+        "row": np.asarray(row, dtype=np.int64),
+        "axis": pd.Series(axis_col, dtype="object"),
+        "rank": np.asarray(rank, dtype=np.int64),
+        "score": pd.to_numeric(pd.Series(score, dtype="object"), errors="coerce"),
+    })
+
+
+def weighted_scores(long: pd.DataFrame, n_rows: int, weights: Dict[str, float],
+                    caps: Optional[Dict[str, int]] = None,
+                    axis_map: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Axis scores and the weighted total for every row, from a ``rubric_score_frame``.
+
+    ``caps`` keeps only the first N rubrics of an axis; ``axis_map`` then renames or merges
+    axes. Returns one column per axis plus "score", indexed 0..n_rows-1; rows with no
+    rubric data are NaN throughout.
+    """
+    if long.empty:
+        return pd.DataFrame(np.nan, index=range(n_rows), columns=sorted(weights) + ["score"])
+    if caps:
+        limit = long["axis"].map(caps)
+        long = long[limit.isna() | (long["rank"] < limit)]
+    if axis_map:
+        long = long.assign(axis=long["axis"].replace(axis_map))
+    axis_scores = long.groupby(["row", "axis"])["score"].mean().unstack("axis")
+    # Axes with rubrics but no valid scores count as 0, as in calculate_axis_scores
+    axis_scores = axis_scores.reindex(columns=sorted(set(axis_scores.columns) | set(weights))).fillna(0.0)
+    weight_vector = pd.Series(weights).reindex(axis_scores.columns).fillna(0.0)
+    axis_scores["score"] = axis_scores.to_numpy() @ weight_vector.to_numpy()
+    return axis_scores.reindex(range(n_rows))
+
+
+def _axis_score_json(table: pd.DataFrame) -> List[Optional[str]]:
+    axes = [c for c in table.columns if c != "score"]
+    values = table[axes].to_numpy()
+    return [
+        None if np.isnan(row_values).all() else json.dumps(dict(zip(axes, row_values.tolist())))
+        for row_values in values
+    ]
+
+
+def _apply(df: pd.DataFrame, table: pd.DataFrame, score_col: str, axis_col: str) -> int:
+    """Write recomputed scores into rows that had rubric data; returns how many changed."""
+    has_data = table["score"].notna().to_numpy()
+    new_scores = table["score"].to_numpy()
+    old_scores = pd.to_numeric(df[score_col], errors="coerce").to_numpy()
+    changed = int((has_data & ~np.isclose(old_scores, new_scores, equal_nan=True)).sum())
+    df[score_col] = np.where(has_data, new_scores, old_scores)
+    axis_json = _axis_score_json(table)
+    df[axis_col] = [new if ok else old for new, old, ok in zip(axis_json, df[axis_col], has_data)]
+    return changed
+
+
+def recompute_m1(df: pd.DataFrame, weights: Dict[str, float] = M1_AXIS_WEIGHTS,
+                 axis_map: Optional[Dict[str, str]] = None) -> int:
+    """Recompute medical_quality_score and m1_axis_scores in place; returns rows changed."""
+    if "m1_rubric_scores" not in df.columns or "m1_classification" not in df.columns:
+        return 0
+    long = rubric_score_frame(
+        [_decode(v) for v in df["m1_rubric_scores"]], [_decode(v) for v in df["m1_classification"]]
+    )
+    table = weighted_scores(long, len(df), weights, axis_map=axis_map)
+    return _apply(df, table, "medical_quality_score", "m1_axis_scores")
+
+
+def recompute_m2(df: pd.DataFrame, weights: Dict[str, float] = M2_AXIS_WEIGHTS,
+                 cap: int = M2_GENERATED_RUBRICS_PER_AXIS,
+                 axis_map: Optional[Dict[str, str]] = None) -> int:
+    """Recompute medical_quality_score_2 and m2_axis_scores in place; returns rows changed.
+
+    Rows with ``m2_generated_classification`` are rebuilt from the untrimmed generated
+    rubrics plus the fixed rubrics, so any cap works. Older rows only have the trimmed
+    classification, so for them a cap above LEGACY_M2_CAP has no effect.
+    """
+    if "m2_rubric_scores" not in df.columns or "m2_classification" not in df.columns:
+        return 0
+    stored = [_decode(v) for v in df["m2_classification"]]
+    if "m2_generated_classification" in df.columns:
+        generated = [_decode(v) for v in df["m2_generated_classification"]]
+        fixed = [_decode(v) for v in df.get("m2_fixed_rubrics", pd.Series([None] * len(df)))]
+    else:
+        generated, fixed = [None] * len(df), [None] * len(df)
+    classifications, legacy = [], 0
+    for row_stored, row_generated, row_fixed in zip(stored, generated, fixed):
+        if isinstance(row_generated, dict) and row_generated and isinstance(row_fixed, dict):
+            combined = {axis: row_generated.get(axis, []) for axis in M2_GENERATED_AXES}
+            combined.update(row_fixed)
+            classifications.append(combined)
+        else:
+            legacy += isinstance(row_stored, dict)
+            classifications.append(row_stored)
+    if legacy and cap > LEGACY_M2_CAP:
+        print(f"Warning: {legacy} m2 rows only store {LEGACY_M2_CAP} rubrics per generated axis; "
+              f"cap {cap} cannot add more for them")
+    long = rubric_score_frame([_decode(v) for v in df["m2_rubric_scores"]], classifications)
+    table = weighted_scores(long, len(df), weights, caps={axis: cap for axis in M2_GENERATED_AXES},
+                            axis_map=axis_map)
+    # Keep the stored classification in line with the cap used for the score
+    trimmed = []
+    for row_classification, row_stored, ok in zip(classifications, stored, table["score"].notna()):
+        if not ok or not isinstance(row_classification, dict):
+            trimmed.append(row_stored)
+            continue
+        row_classification = dict(row_classification)
+        for axis in M2_GENERATED_AXES:
+            row_classification[axis] = list(row_classification.get(axis, []))[:cap]
+        if isinstance(row_stored, dict) and row_stored.get("unclassified"):
+            row_classification["unclassified"] = row_stored["unclassified"]
+        trimmed.append(row_classification)
+    changed = _apply(df, table, "medical_quality_score_2", "m2_axis_scores")
+    # JSON strings suit both writers: the Parquet writer decodes them into nested columns
+    df["m2_classification"] = [json.dumps(c) if isinstance(c, dict) else c for c in trimmed]
+    return changed
+
+
+def _refresh_estimate(path: Path, df: pd.DataFrame, column: str) -> Dict[str, Any]:
+    """Recompute a stage's saved early-stopping estimate from the rows it judged."""
+    estimate = json.loads(path.read_text())
+    strata = np.asarray(row_strata(df), dtype=object)
+    scores = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+    scored = ~np.isnan(scores)
+    population = dict(pd.Series(strata, dtype=object).value_counts())
+    mean, low, high = stratified_interval(scores[scored], strata[scored], population, estimate["confidence"])
+    estimate.update(mean=mean, ci_low=low, ci_high=high)
+    path.write_text(json.dumps(estimate, indent=2))
+    return estimate
+
+
+def _update_partitions(partition_dir: Path, m1_weights: Dict[str, float], m2_weights: Dict[str, float],
+                       m2_cap: int, axis_map: Optional[Dict[str, str]]) -> None:
+    """Recompute the medical stages' partitions, which the pipeline re-assembles from."""
+    for stage, recompute in (("medical", lambda part: recompute_m1(part, m1_weights, axis_map)),
+                             ("medical_2", lambda part: recompute_m2(part, m2_weights, m2_cap, axis_map))):
+        if not partition_exists(str(partition_dir), stage):
+            continue
+        part = read_partition(str(partition_dir), stage)
+        recompute(part)
+        write_partition(part, str(partition_dir), stage, [c for c in part.columns if c != ROW_ID_COLUMN])
+
+
+def _update_warehouse(run_path: Path, df: pd.DataFrame) -> None:
+    """Store the recomputed medical columns (the whole run if the warehouse lacks it)."""
+    warehouse = get_results_warehouse()
+    if warehouse is None:
+        return
+    dataset, model = run_path.parent.name, run_path.name
+    if ROW_ID_COLUMN not in df.columns:
+        df = df.copy(deep=False)
+        df.insert(0, ROW_ID_COLUMN, input_row_ids(df))
+    columns = None
+    if (dataset, model) in warehouse.runs():
+        # Every column of an evaluator goes together: its rubric rows are rewritten as a whole
+        columns = [c for c in df.columns if c.startswith(("m1_", "m2_"))] + [c for _, _, c in MEDICAL_STAGES]
+    warehouse.write_frame(dataset, model, df, columns)
+
+
+def _update_summary(run_path: Path, df: pd.DataFrame, dataset: Optional[str] = None) -> None:
+    """Write the recomputed medical scores to the summary store and rebuild summary_scores.csv.
+
+    The store keys the run by its <dataset>/<model> directory and ``dataset`` (the input
+    file's stem, the summary's "dataset" column), which may be left out when the store or
+    the summary knows a single dataset for the run. Outputs older than the store get every
+    stage's shard seeded from ``df`` first, so their summary row keeps all metrics.
+    """
+    store = SummaryStore()
+    run = f"{run_path.parent.name}/{run_path.name}"
+    summary_path = run_path / "summary_scores.csv"
+    if dataset is None:
+        known = list(store.read(run))
+        if not known and summary_path.exists():
+            known = pd.read_csv(summary_path)["dataset"].astype(str).tolist()
+        dataset = known[0] if len(known) == 1 else None
+    if dataset is None:
+        print(f"Warning: cannot tell which dataset {run} scored, leaving its summary unchanged")
+        return
+    stages = ["medical", "medical_2"] if store.read(run, dataset) else list(STAGE_METRICS)
+    for stage in stages:
+        store.replace_shard(run, dataset, stage, df)
+    estimates = {}
+    for key, stage, column in MEDICAL_STAGES:
+        estimate_path = run_path / "partitions" / "estimates" / f"{stage}.json"
+        if estimate_path.exists():
+            estimates[key] = _refresh_estimate(estimate_path, df, column)
+    write_summary_csv(store, run, str(summary_path), current=dataset, rows=len(df), estimates=estimates)
+
+
+def recompute_run_dir(run_dir: str, m1_weights: Dict[str, float] = M1_AXIS_WEIGHTS,
+                      m2_weights: Dict[str, float] = M2_AXIS_WEIGHTS,
+                      m2_cap: int = M2_GENERATED_RUBRICS_PER_AXIS,
+                      axis_map: Optional[Dict[str, str]] = None,
+                      dry_run: bool = False, summary_dataset: Optional[str] = None) -> Dict[str, int]:
+    """Recompute both medical scores for one dataset/model output directory.
+
+    Reads the Parquet dataset when present (rewriting it and the CSV), else the CSV. The
+    medical partitions, summary store, saved estimates and results warehouse are updated
+    too, so the next pipeline run re-assembles and summarizes the recomputed scores.
+    ``summary_dataset`` names the input dataset whose summary is refreshed (see
+    ``_update_summary``).
+    """
+    run_path = Path(run_dir)
+    parquet_path = run_path / "scored_final_dataset.parquet"
+    csv_path = run_path / "scored_final_dataset.csv"
+    if parquet_path.exists():
+        df = load_scored_dataset(str(parquet_path))
+    elif csv_path.exists():
+        df = pd.read_csv(csv_path)
+    else:
+        return {}
+    result = {
+        "rows": len(df),
+        "m1_changed": recompute_m1(df, m1_weights, axis_map),
+        "m2_changed": recompute_m2(df, m2_weights, m2_cap, axis_map),
+    }
+    if dry_run:
+        return result
+    if parquet_path.exists():
+        save_scored_dataset(df, str(parquet_path), str(csv_path))
+    else:
+        atomic_write_csv(df, str(csv_path))
+    _update_partitions(run_path / "partitions", m1_weights, m2_weights, m2_cap, axis_map)
+    _update_warehouse(run_path, df)
+    _update_summary(run_path, df, summary_dataset)
+    return result
+
+
+def recompute_all(datasets_root: str, **kwargs) -> Dict[str, Dict[str, int]]:
+    """Run ``recompute_run_dir`` for every <dataset>/<model> directory under the root."""
+    results = {}
+    for run_dir in sorted(p for p in Path(datasets_root).glob("*/*") if p.is_dir()):
+        result = recompute_run_dir(str(run_dir), **kwargs)
+        if result:
+            results[f"{run_dir.parent.name}/{run_dir.name}"] = result
+    return results
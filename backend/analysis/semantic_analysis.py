@@ -2,7 +2,6 @@ import os
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
-from langdetect import detect
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from transformers import logging
@@ -11,6 +10,13 @@ from bert_score import score as bert_score
 import cohere
 import voyageai
 from openai import OpenAI
+from config import SBERT_MODEL_NAME
+from utils.embedding_utils import get_sbert_model
+from utils.language_utils import detect_language_code
+from utils.rate_limiter import api_key_fingerprint, get_rate_limiter
+from utils.token_utils import estimate_tokens
+from utils.embedding_cache import cached_embeddings
+from utils.file_utils import read_csv_cached
 load_dotenv()
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 import warnings
@@ -19,13 +25,18 @@ warnings.filterwarnings("ignore")
 
 
 class SemanticAnalyzer:
+    OUTPUT_COLUMNS = [
+        "language", "sbert_similarity", "cohere_similarity",
+        "voyage_similarity", "openai_similarity", "bert_score_f1"
+    ]
+
     def __init__(self, dataset_path: str):
-        self.df = pd.read_csv(dataset_path)
+        self.df = read_csv_cached(dataset_path)
         self.references = self.df["Answer"].fillna("").tolist()
         self.responses = self.df["llm_response"].fillna("").tolist()
         self.models_by_lang = {}
         self.model_configs = {
-            'en': 'all-mpnet-base-v2',
+            'en': SBERT_MODEL_NAME,
             'hi': 'l3cube-pune/hindi-sentence-similarity-sbert',
             'mr': 'l3cube-pune/marathi-sentence-similarity-sbert'
         }
@@ -38,16 +49,21 @@ class SemanticAnalyzer:
 
 
     def _detect_language(self, text: str) -> str:
-        try:
-            return detect(text)
-        except:
-            return 'en'
+        return detect_language_code(text)
+
+
+    def _wait_for_rate_limit(self, provider: str, api_key_env: str, texts: list[str], requests: int = 1):
+        # Embedding keys are shared by every pipeline process, so draw from the host-wide budget
+        get_rate_limiter().acquire(
+            provider, api_key_fingerprint(os.getenv(api_key_env)),
+            requests=requests, tokens=sum(estimate_tokens(t, provider) for t in texts)
+        )
 
 
     def _get_sbert_model(self, lang: str) -> SentenceTransformer:
         if lang not in self.models_by_lang:
-            model_name = self.model_configs.get(lang, 'all-mpnet-base-v2')
-            self.models_by_lang[lang] = SentenceTransformer(model_name)
+            model_name = self.model_configs.get(lang, SBERT_MODEL_NAME)
+            self.models_by_lang[lang] = get_sbert_model(model_name)
         return self.models_by_lang[lang]
 
 
@@ -124,14 +140,14 @@ class SemanticAnalyzer:
             return 0.0
         try:
             client = self._get_cohere_client()
-            inputs = [
-                {"content": [{"type": "text", "text": ref}]},
-                {"content": [{"type": "text", "text": resp}]}
-            ]
-            result = client.embed(inputs=inputs, model="embed-multilingual-v3.0",
-                                input_type="search_document", embedding_types=["float"])
-            emb1 = np.array(result.embeddings.float[0])
-            emb2 = np.array(result.embeddings.float[1])
+
+            def embed(texts):
+                self._wait_for_rate_limit("cohere", "COHERE_API_KEY", texts)
+                inputs = [{"content": [{"type": "text", "text": text}]} for text in texts]
+                return client.embed(inputs=inputs, model="embed-multilingual-v3.0",
+                                    input_type="search_document", embedding_types=["float"]).embeddings.float
+            # Gold answers recur across model runs, so they usually come from the cache
+            emb1, emb2 = cached_embeddings("cohere", "embed-multilingual-v3.0", [ref, resp], embed)
             similarity = cosine_similarity([emb1], [emb2])[0][0]
             # extra check to avoid NaN/inf values caused by zero or bad embeddings
             if np.isnan(similarity) or np.isinf(similarity):
@@ -147,9 +163,11 @@ class SemanticAnalyzer:
             return 0.0
         try:
             client = self._get_voyage_client()
-            result = client.embed([ref, resp], model="voyage-3.5", input_type="document")
-            emb1 = np.array(result.embeddings[0])
-            emb2 = np.array(result.embeddings[1])
+
+            def embed(texts):
+                self._wait_for_rate_limit("voyage", "VOYAGE_API_KEY", texts)
+                return client.embed(texts, model="voyage-3.5", input_type="document").embeddings
+            emb1, emb2 = cached_embeddings("voyage", "voyage-3.5", [ref, resp], embed)
             similarity = cosine_similarity([emb1], [emb2])[0][0]
             # extra check to avoid NaN/inf values caused by zero or bad embeddings
             if np.isnan(similarity) or np.isinf(similarity):
@@ -165,8 +183,12 @@ class SemanticAnalyzer:
             return 0.0
         try:
             client = self._get_openai_client()
-            emb1 = client.embeddings.create(input=ref, model="text-embedding-3-small").data[0].embedding
-            emb2 = client.embeddings.create(input=resp, model="text-embedding-3-small").data[0].embedding
+
+            def embed(texts):
+                self._wait_for_rate_limit("openai", "OPENAI_API_KEY", texts)
+                data = client.embeddings.create(input=texts, model="text-embedding-3-small").data
+                return [d.embedding for d in sorted(data, key=lambda d: d.index)]
+            emb1, emb2 = cached_embeddings("openai", "text-embedding-3-small", [ref, resp], embed)
             similarity = cosine_similarity([emb1], [emb2])[0][0]
             # extra check to avoid NaN/inf values caused by zero or bad embeddings
             if np.isnan(similarity) or np.isinf(similarity):
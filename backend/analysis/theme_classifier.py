@@ -0,0 +1,266 @@
+import glob
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from config import (
+    THEME_CLASSIFIER_METHOD,
+    THEME_JUDGE_LABELS_PATH,
+    THEME_KNN_K,
+    THEME_LABELED_PATHS,
+    THEME_LLM_BATCH_SIZE,
+    THEME_MARGIN_THRESHOLD,
+    THEME_MIN_EXAMPLES,
+)
+from utils.embedding_utils import cosine_top_k, embed_texts
+from utils.file_utils import atomic_write_csv
+from utils.rubric_scoring import parse_json_response
+
+
+def load_labeled_questions(paths: List[str], themes: List[str]) -> pd.DataFrame:
+    """(Questions, Theme) pairs from CSVs with both columns; paths may be glob patterns.
+
+    Rows labelled with anything outside ``themes`` (e.g. "unclassified") are dropped, and a
+    question labelled in several files keeps its first label.
+    """
+    frames = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            header = pd.read_csv(path, nrows=0).columns
+            if "Questions" not in header or "Theme" not in header:
+                continue
+            frames.append(pd.read_csv(path, usecols=["Questions", "Theme"]))
+    if not frames:
+        return pd.DataFrame(columns=["Questions", "Theme"])
+    labeled = pd.concat(frames, ignore_index=True).dropna()
+    labeled["Questions"] = labeled["Questions"].astype(str).str.strip()
+    labeled = labeled[labeled["Theme"].isin(themes) & (labeled["Questions"] != "")]
+    return labeled.drop_duplicates("Questions").reset_index(drop=True)
+
+
+class ThemeClassifier:
+    """Assigns questions to themes from SBERT embeddings of already-themed questions.
+
+    ``method`` "centroid" compares a question with each theme's mean embedding; "knn" takes
+    similarity-weighted votes of the nearest labelled questions. The margin is the gap
+    between the best and second-best theme; questions under ``margin_threshold`` are sent to
+    the judge, several per call. A theme with fewer than ``min_examples`` labelled questions
+    also counts its own name as an example, and a question with such a theme among its top
+    two goes to the judge too. The judge's themes are appended to ``labels_path`` (one of
+    THEME_LABELED_PATHS), so every theme gathers labelled questions over time.
+    """
+
+    def __init__(self, themes: List[str], method: str = THEME_CLASSIFIER_METHOD,
+                 k: int = THEME_KNN_K, margin_threshold: float = THEME_MARGIN_THRESHOLD,
+                 min_examples: int = THEME_MIN_EXAMPLES,
+                 labels_path: Optional[str] = THEME_JUDGE_LABELS_PATH):
+        self.themes = list(themes)
+        self.method = method
+        self.k = k
+        self.margin_threshold = margin_threshold
+        self.min_examples = min_examples
+        self.labels_path = labels_path
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.centroids: Optional[np.ndarray] = None
+        self._anchors: Optional[np.ndarray] = None
+        self._vectors = self.embeddings
+        self._vector_labels = self.labels
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "llm": 0, "llm_failed": 0, "llm_calls": 0, "agree_with_llm": 0}
+
+    @classmethod
+    def from_labeled(cls, themes: List[str], paths: Optional[List[str]] = None, **kwargs) -> "ThemeClassifier":
+        classifier = cls(themes, **kwargs)
+        labeled = load_labeled_questions(THEME_LABELED_PATHS if paths is None else paths, themes)
+        classifier.fit(labeled["Questions"].tolist(), labeled["Theme"].tolist())
+        print(f"Theme classifier: {len(labeled)} labelled questions over "
+              f"{labeled['Theme'].nunique()} of {len(themes)} themes")
+        uncovered = classifier.uncovered_themes()
+        if uncovered:
+            print(f"Warning: fewer than {classifier.min_examples} labelled questions for {uncovered}, "
+                  f"questions near them will be themed by the judge")
+        return classifier
+
+    def fit(self, questions: List[str], themes: List[str]) -> "ThemeClassifier":
+        index = {theme: i for i, theme in enumerate(self.themes)}
+        self._fit_vectors(embed_texts(questions), np.asarray([index[t] for t in themes], dtype=np.int64))
+        return self
+
+    def _fit_vectors(self, embeddings: np.ndarray, labels: np.ndarray) -> None:
+        self.embeddings, self.labels = embeddings, labels
+        if self._anchors is None:
+            self._anchors = embed_texts(self.themes)
+        # Thin themes also count their name as an example, so they can still rank as candidates
+        thin = np.asarray([self.themes.index(t) for t in self.uncovered_themes()], dtype=np.int64)
+        self._vectors = np.vstack([embeddings.reshape(-1, self._anchors.shape[1]), self._anchors[thin]])
+        self._vector_labels = np.concatenate([labels, thin])
+        centroids = np.zeros((len(self.themes), self._anchors.shape[1]), dtype=np.float32)
+        for i in range(len(self.themes)):
+            mean = self._vectors[self._vector_labels == i].mean(axis=0)
+            centroids[i] = mean / (np.linalg.norm(mean) or 1.0)
+        self.centroids = centroids
+
+    def uncovered_themes(self) -> List[str]:
+        """Themes with fewer than ``min_examples`` labelled questions."""
+        counts = np.bincount(self.labels, minlength=len(self.themes))
+        return [theme for theme, n in zip(self.themes, counts) if n < self.min_examples]
+
+    def _theme_scores(self, vectors: np.ndarray) -> np.ndarray:
+        """Score per (question, theme)."""
+        if self.method == "centroid":
+            return vectors @ self.centroids.T
+        if self.method == "knn":
+            indices, sims = cosine_top_k(vectors, self._vectors, self.k)
+            weights = np.clip(sims, 0.0, None)
+            scores = np.zeros((len(vectors), len(self.themes)), dtype=np.float32)
+            np.add.at(scores, (np.repeat(np.arange(len(vectors)), indices.shape[1]),
+                               self._vector_labels[indices].ravel()), weights.ravel())
+            totals = scores.sum(axis=1, keepdims=True)
+            return np.divide(scores, totals, out=np.zeros_like(scores), where=totals > 0)
+        raise ValueError(f"Unknown theme classifier method: {self.method}")
+
+    def _top_two(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Best and runner-up theme indices per question (runner-up -1 for a single theme),
+        and the score margin between them."""
+        scores = self._theme_scores(vectors)
+        order = np.argsort(-scores, axis=1)
+        rows = np.arange(len(order))
+        best = scores[rows, order[:, 0]]
+        if scores.shape[1] < 2:
+            return np.stack([order[:, 0], np.full(len(order), -1)], axis=1), best
+        return order[:, :2], best - scores[rows, order[:, 1]]
+
+    def _best_with_margin(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        top, margins = self._top_two(vectors)
+        return top[:, 0], margins
+
+    def predict(self, questions: List[str]) -> Tuple[List[Optional[str]], np.ndarray]:
+        """Best theme and margin per question."""
+        if not questions or self.centroids is None:
+            return [None] * len(questions), np.zeros(len(questions))
+        best, margins = self._best_with_margin(embed_texts(questions))
+        return [self.themes[i] for i in best], margins
+
+    def _record_labels(self, questions: List[str], vectors: np.ndarray, themes: List[str]) -> None:
+        """Keep judge-assigned themes: in the fitted data now and in ``labels_path`` for later runs."""
+        keep = [i for i, q in enumerate(questions) if q.strip()]
+        if not keep:
+            return
+        labels = np.asarray([self.themes.index(themes[i]) for i in keep], dtype=np.int64)
+        with self._lock:
+            self._fit_vectors(np.vstack([self.embeddings.reshape(-1, vectors.shape[1]), vectors[keep]]),
+                              np.concatenate([self.labels, labels]))
+            if not self.labels_path:
+                return
+            path = Path(self.labels_path)
+            new = pd.DataFrame({"Questions": [questions[i].strip() for i in keep],
+                                "Theme": [themes[i] for i in keep]})
+            stored = pd.concat([pd.read_csv(path), new]) if path.exists() else new
+            atomic_write_csv(stored.drop_duplicates("Questions"), str(path))
+
+    def _llm_batch(self, judge, questions: List[str]) -> Dict[int, str]:
+        """Classify several questions in one judge call; returns position -> theme."""
+        ids = [f"q{i}" for i in range(1, len(questions) + 1)]
+        theme_list = "\n".join(f"- {t}" for t in self.themes)
+        listed = "\n".join(f"{qid}: \"\"\"{q}\"\"\"" for qid, q in zip(ids, questions))
+        prompt = (
+            f"Classify each medical question below into one of these themes:\n{theme_list}\n\n"
+            f"Questions (ID: question):\n{listed}\n\n"
+            "Return ONLY a JSON object mapping every question ID to its exact theme name."
+        )
+        schema = {
+            "type": "object",
+            "properties": {qid: {"type": "string", "enum": self.themes} for qid in ids},
+            "required": ids,
+            "additionalProperties": False,
+        }
+        with self._lock:
+            self.stats["llm_calls"] += 1
+        response = judge.complete(prompt, max_tokens=40 * len(questions) + 50, temperature=0.0,
+                                  response_schema=schema)
+        parsed = parse_json_response(response)
+        if not isinstance(parsed, dict):
+            return {}
+        return {i: parsed[qid].strip() for i, qid in enumerate(ids)
+                if isinstance(parsed.get(qid), str) and parsed[qid].strip() in self.themes}
+
+    def classify(self, questions: List[str], judge=None, batch_size: int = THEME_LLM_BATCH_SIZE,
+                 max_retries: int = 3) -> List[Optional[str]]:
+        """Theme per question: local when confident, otherwise batched judge calls.
+
+        A question goes to the judge when its margin is under the threshold or one of its
+        top two themes is short of labelled questions. Questions the judge could not place
+        after ``max_retries`` get None. The judge's answers are recorded as labels and
+        compared with the local guess for them (see ``report``).
+        """
+        vectors = embed_texts(questions)
+        top, margins = self._top_two(vectors)
+        predicted: List[Optional[str]] = [self.themes[i] for i in top[:, 0]]
+        result: List[Optional[str]] = list(predicted)
+        thin = [self.themes.index(t) for t in self.uncovered_themes()]
+        uncertain = [i for i, m in enumerate(margins)
+                     if m < self.margin_threshold or np.isin(top[i], thin).any()]
+        with self._lock:
+            self.stats["local"] += len(questions) - len(uncertain)
+        if judge is None:
+            return result
+        pending = uncertain
+        for _ in range(max_retries):
+            if not pending:
+                break
+            answered: Dict[int, str] = {}
+            for start in range(0, len(pending), batch_size):
+                chunk = pending[start:start + batch_size]
+                for pos, theme in self._llm_batch(judge, [questions[i] for i in chunk]).items():
+                    answered[chunk[pos]] = theme
+            for i, theme in answered.items():
+                result[i] = theme
+            pending = [i for i in pending if i not in answered]
+        for i in pending:
+            result[i] = None
+        judged = [i for i in uncertain if result[i] is not None]
+        self._record_labels([questions[i] for i in judged], vectors[judged], [result[i] for i in judged])
+        agree = sum(1 for i in uncertain if result[i] is not None and result[i] == predicted[i])
+        with self._lock:
+            self.stats["llm"] += len(uncertain) - len(pending)
+            self.stats["llm_failed"] += len(pending)
+            self.stats["agree_with_llm"] += agree
+        return result
+
+    def holdout_accuracy(self, folds: int = 5, seed: int = 0) -> Dict[str, float]:
+        """k-fold accuracy against the stored (LLM-produced) labels, overall and above the margin."""
+        n = len(self.labels)
+        if n < 2:
+            return {}
+        full = (self.embeddings, self.labels)
+        fold_of = np.random.default_rng(seed).permutation(n) % min(folds, n)
+        hits = confident = confident_hits = 0
+        try:
+            for fold in np.unique(fold_of):
+                train, test = fold_of != fold, fold_of == fold
+                self._fit_vectors(full[0][train], full[1][train])
+                if self.centroids is None:
+                    continue
+                best, margins = self._best_with_margin(full[0][test])
+                correct = best == full[1][test]
+                sure = margins >= self.margin_threshold
+                hits += int(correct.sum())
+                confident += int(sure.sum())
+                confident_hits += int((correct & sure).sum())
+        finally:
+            self._fit_vectors(*full)
+        return {
+            "accuracy": round(hits / n, 3),
+            "confident_fraction": round(confident / n, 3),
+            "confident_accuracy": round(confident_hits / confident, 3) if confident else 0.0,
+        }
+
+    def report(self) -> Dict[str, float]:
+        """Routing counts, and how often the local guess matched the judge on routed questions."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["local_accuracy_vs_llm"] = round(stats["agree_with_llm"] / stats["llm"], 3) if stats["llm"] else None
+        stats.update(self.holdout_accuracy())
+        return stats
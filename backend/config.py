@@ -14,17 +14,182 @@ QUESTION_COLUMN = "Questions"
 # JUDGE_MODEL = "gpt-4o-mini-2024-07-18"
 JUDGE_MODEL = "gemini-2.5-flash"
 MAX_TOKENS = 1000
+# Shared judge client: per-call deadline (all retries included) and AIMD concurrency bounds
+JUDGE_DEADLINE_SECONDS = 120
+JUDGE_INITIAL_CONCURRENCY = 4
+JUDGE_MAX_CONCURRENCY = 16
+JUDGE_LATENCY_TARGET_SECONDS = 20
+# Cascaded judging: error/empty responses are scored deterministically, a cheap judge scores
+# the rest, and rows it is unsure about (its two scoring passes disagree on too many rubrics,
+# or its score is far from the SBERT similarity) are re-judged by JUDGE_MODEL.
+CASCADE_ENABLED = False
+CHEAP_JUDGE_MODEL = "gemini-2.5-flash-lite"
+CASCADE_MAX_DISAGREEMENT = 0.15
+CASCADE_MAX_SEMANTIC_GAP = 0.35
+# USD per million tokens, used to report what the cascade saved
+JUDGE_PRICES_PER_MTOK = {
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.5-flash-lite": {"input": 0.10, "output": 0.40},
+    "gpt-4o-mini-2024-07-18": {"input": 0.15, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+}
+# Hedged requests: once a call runs past this percentile of recent latency, send a duplicate
+# (to the fallback judge model if set) and take whichever answers first.
+HEDGE_ENABLED = True
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_FALLBACK_JUDGE_MODEL = None
+# Judge prompt prefix caching: static instructions and rubrics are sent as a cached prefix.
+# "gemini" uses Gemini cached content (prefixes below the minimum size rely on implicit
+# caching), "local" is an in-process stand-in for tests, None disables explicit caching.
+CONTEXT_CACHE_BACKEND = "gemini"
+CONTEXT_CACHE_TTL_SECONDS = 3600
+CONTEXT_CACHE_MIN_TOKENS = 1024
+# Per-request timeout for answer generation calls
+GENERATION_TIMEOUT_SECONDS = 90
+
+# Host-wide rate limiting shared by every pipeline process (SQLite token buckets).
+# Budgets are per API key: requests (rpm) and tokens (tpm) per minute, scaled by the headroom.
+RATE_LIMIT_DB_PATH = os.getenv(
+    "RATE_LIMIT_DB_PATH", os.path.expanduser("~/.cache/medical-eval/rate_limits.sqlite")
+)
+RATE_LIMIT_HEADROOM = 0.9
+RATE_LIMITS = {
+    "gemini": {"rpm": 1000, "tpm": 1000000},
+    "openai": {"rpm": 500, "tpm": 200000},
+    "cohere": {"rpm": 500, "tpm": 500000},
+    "together": {"rpm": 600, "tpm": 180000},
+    "voyage": {"rpm": 300, "tpm": 1000000},
+}
+# Axis weights behind medical_quality_score (m1) and medical_quality_score_2 (m2), and how many
+# generated rubrics m2 keeps per generated axis. scripts/recompute_scores.py re-applies
+# changes to stored rubric scores without calling the judge.
+M1_AXIS_WEIGHTS = {
+    "Completeness": 0.25,
+    "Accuracy": 0.30,
+    "Context Awareness": 0.20,
+    "Communication": 0.15,
+    "Terminology Accessibility": 0.10,
+}
+M2_AXIS_WEIGHTS = dict(M1_AXIS_WEIGHTS)
+M2_GENERATED_RUBRICS_PER_AXIS = 4
+# English SBERT model shared by semantic similarity and the rubric bank / local classifiers
+SBERT_MODEL_NAME = "all-mpnet-base-v2"
+# Reusable rubric bank (scripts/build_rubric_bank.py): medoids of clustered historical rubrics.
+# With RUBRIC_SOURCE = "bank", m1 takes rubrics from the bank for questions close enough to a
+# banked question and generates them only otherwise.
+RUBRIC_SOURCE = "generate"
+RUBRIC_BANK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rubric_bank")
+RUBRIC_BANK_MIN_SIMILARITY = 0.75
+RUBRIC_BANK_NEIGHBORS = 5
+RUBRIC_BANK_MAX_RUBRICS = 15
+# Local question-theme classifier (centroid or kNN over SBERT embeddings of already-themed
+# questions). Questions whose best theme beats the runner-up by less than the margin go to
+# the judge, THEME_LLM_BATCH_SIZE per call, as do questions with a theme that has fewer than
+# THEME_MIN_EXAMPLES labelled questions among their top two. The judge's themes are appended
+# to THEME_JUDGE_LABELS_PATH, which is one of the labelled sources, so thin themes fill up.
+_FRONTEND_PUBLIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "public")
+THEME_JUDGE_LABELS_PATH = os.getenv("THEME_JUDGE_LABELS_PATH", os.path.expanduser("~/.cache/medical-eval/theme_labels.csv"))
+THEME_LABELED_PATHS = [
+    os.path.join(_FRONTEND_PUBLIC, "medical_3", "sample_15_themed.csv"),
+    os.path.join(_FRONTEND_PUBLIC, "datasets", "*", "*", "scored_final_dataset.csv"),
+    THEME_JUDGE_LABELS_PATH,
+]
+THEME_CLASSIFIER_METHOD = "centroid"
+THEME_KNN_K = 7
+THEME_MARGIN_THRESHOLD = 0.05
+THEME_LLM_BATCH_SIZE = 10
+THEME_MIN_EXAMPLES = 5
+# Local rubric -> axis classifier for both medical evaluators, trained on the judge's past
+# placements (m1_classification / m2 generated classification) under the datasets root and
+# cached at AXIS_CLASSIFIER_PATH (delete it or run scripts/train_axis_classifier.py to retrain).
+# "centroid" or "logreg"; rubrics whose top axis probability is under the threshold are
+# classified by the judge in one call per row.
+AXIS_CLASSIFIER_ENABLED = True
+AXIS_CLASSIFIER_METHOD = "logreg"
+AXIS_CLASSIFIER_MIN_CONFIDENCE = 0.6
+AXIS_CLASSIFIER_TEMPERATURE = 0.05  # centroid only: softmax temperature over cosine similarities
+AXIS_CLASSIFIER_DATASETS_ROOT = os.path.join(_FRONTEND_PUBLIC, "datasets")
+AXIS_CLASSIFIER_PATH = os.getenv(
+    "AXIS_CLASSIFIER_PATH", os.path.expanduser("~/.cache/medical-eval/axis_classifier.npz")
+)
+# Estimation mode for the medical judge stages: judge a sample stratified by Theme and
+# language, ESTIMATE_BATCH_SIZE rows at a time, and stop once the bootstrap CI half-width of
+# the stage's score is at most ESTIMATE_TARGET_HALF_WIDTH (after at least ESTIMATE_MIN_ROWS
+# scored rows). Each stratum's first ESTIMATE_MIN_STRATUM_ROWS rows (or all of a smaller
+# stratum) are judged before the proportional sample, and the stage does not stop until they
+# are; strata short of that are pooled for the CI. Unsampled rows are left unscored; the
+# summary records n and the CI.
+ESTIMATION_ENABLED = False
+ESTIMATE_TARGET_HALF_WIDTH = 0.02
+ESTIMATE_BATCH_SIZE = 32
+ESTIMATE_MIN_ROWS = 64
+ESTIMATE_MIN_STRATUM_ROWS = 5
+ESTIMATE_CONFIDENCE = 0.95
+ESTIMATE_BOOTSTRAP_SAMPLES = 2000
+ESTIMATE_SEED = 0
+# Cross-model comparison (scripts/compare_models.py): paired bootstrap resamples of the
+# shared questions, and the significance level for the per-pair CIs and p-values
+COMPARISON_BOOTSTRAP_SAMPLES = 10000
+COMPARISON_ALPHA = 0.05
+COMPARISON_SEED = 0
+# Streaming summary statistics: each stage adds its rows' scores to running per-metric stats
+# (count, mean, variance, min/max, histogram) as they finish and stores them per stage in
+# SQLite every SUMMARY_FLUSH_ROWS rows; summary_scores.csv is written from that store.
+SUMMARY_STORE_PATH = os.getenv(
+    "SUMMARY_STORE_PATH", os.path.expanduser("~/.cache/medical-eval/summary_stats.sqlite")
+)
+SUMMARY_FLUSH_ROWS = 25
+SUMMARY_HISTOGRAM_BINS = 20
+# Histogram range per summary metric; metrics not listed use (0, 1)
+SUMMARY_HISTOGRAM_RANGES = {"perplexity": (0.0, 200.0)}
+# Results warehouse: every stage also writes its columns for the run's rows into one SQLite
+# file keyed by (dataset, model, row_id), with indexed metric and per-rubric score tables
+# for cross-model queries. scripts/build_warehouse.py imports existing outputs and can
+# export the per-run CSVs back out of it.
+RESULTS_WAREHOUSE_ENABLED = True
+RESULTS_WAREHOUSE_PATH = os.getenv(
+    "RESULTS_WAREHOUSE_PATH", os.path.expanduser("~/.cache/medical-eval/results_warehouse.sqlite")
+)
+RESULTS_DATASETS_ROOT = os.path.join(_FRONTEND_PUBLIC, "datasets")
+MEDICAL_3_RESULTS_DIR = os.path.join(_FRONTEND_PUBLIC, "medical_3")
+# Persistent per-rubric judge scores keyed by (question + response, rubric, judge model,
+# prompt version), so reruns only send rubrics that were never scored for a response.
+RUBRIC_SCORE_MEMO_ENABLED = True
+RUBRIC_SCORE_MEMO_PATH = os.getenv(
+    "RUBRIC_SCORE_MEMO_PATH", os.path.expanduser("~/.cache/medical-eval/rubric_scores.sqlite")
+)
+# Persistent embedding vectors keyed by (provider, model, text), so gold answers and
+# responses embedded for one model's run are not sent to the embedding APIs again.
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.expanduser("~/.cache/medical-eval/embeddings.sqlite")
+)
+# Arrow IPC copies of parsed CSV inputs (utils.file_utils.load_arrow_table), one file per
+# source path, rebuilt whenever the CSV's size or mtime changes.
+ARROW_CACHE_DIR = os.getenv("ARROW_CACHE_DIR", os.path.expanduser("~/.cache/medical-eval/arrow"))
 TEMPERATURE = 0.1
 dataset_name = "usercontext1"
 
 
-FINAL_DATASET_PATH = f"/Users/vrn/Work/medical-eval/frontend/public/datasets/{dataset_name}/{model_name}/scored_final_dataset.csv"
-SUMMARY_DATASET_PATH = f"/Users/vrn/Work/medical-eval/frontend/public/datasets/{dataset_name}/{model_name}/summary_scores.csv"
-LLM_RESPONSES_OUTPUT_PATH = FINAL_DATASET_PATH
-LINGUISTIC_SCORED_DATASET_PATH = FINAL_DATASET_PATH
-SEMANTIC_SCORED_DATASET_PATH = FINAL_DATASET_PATH
-MEDICAL_SCORED_DATASET_PATH = FINAL_DATASET_PATH
-MEDICAL_2_SCORED_DATASET_PATH = FINAL_DATASET_PATH
+RUN_OUTPUT_DIR = f"/Users/vrn/Work/medical-eval/frontend/public/datasets/{dataset_name}/{model_name}"
+FINAL_DATASET_PATH = f"{RUN_OUTPUT_DIR}/scored_final_dataset.csv"
+FINAL_PARQUET_PATH = f"{RUN_OUTPUT_DIR}/scored_final_dataset.parquet"
+SUMMARY_DATASET_PATH = f"{RUN_OUTPUT_DIR}/summary_scores.csv"
+# Each stage writes its own columns to PARTITION_DIR/<stage>.csv keyed by row_id;
+# the final dataset is assembled from them, so stages never share an output file.
+PARTITION_DIR = f"{RUN_OUTPUT_DIR}/partitions"
+LLM_RESPONSES_OUTPUT_PATH = f"{PARTITION_DIR}/responses.csv"
+RUN_STAGES_IN_PARALLEL = False
+# Offline batch mode for generation and judge stages: requests are written to JSONL and
+# submitted as provider batch jobs. BATCH_PROVIDER None uses the model's own provider;
+# "local" uses the file-based stand-in, which answers through the interactive clients;
+# "echo" (the prompt back) and "canned" (schema-shaped placeholders) answer locally, so the
+# generation and judge batch flow runs offline without credentials.
+USE_BATCH_MODE = False
+BATCH_PROVIDER = None
+BATCH_WORK_DIR = f"{PARTITION_DIR}/batches"
+BATCH_POLL_SECONDS = 60
 
 
 RUBRIC_GENERATION_PROMPT = """You are analyzing a set of high-quality, gold-standard medical answers.  
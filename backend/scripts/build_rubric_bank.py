@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from dotenv import load_dotenv
+from config import JUDGE_MODEL, RUBRIC_BANK_DIR
+from analysis.rubric_bank import RubricBank, collect_rubric_history
+from utils.judge_client import get_judge_client
+load_dotenv()
+
+# Builds the rubric bank used with RUBRIC_SOURCE = "bank" from every scored run's rubrics.
+DATASETS_ROOT = str(Path(__file__).resolve().parents[2] / "frontend" / "public" / "datasets")
+METHOD = "hdbscan"  # or "kmedoids"
+MIN_CLUSTER_SIZE = 3
+N_CLUSTERS = None  # kmedoids only; defaults to a quarter of the distinct rubrics
+# Classify medoids that were never placed on an axis with one judge call
+CLASSIFY_UNPLACED = True
+
+
+if __name__ == "__main__":
+    history = collect_rubric_history(DATASETS_ROOT)
+    print(f"Collected {len(history)} rubric uses ({history['rubric'].nunique()} distinct)")
+    bank = RubricBank.build(
+        history, method=METHOD, min_cluster_size=MIN_CLUSTER_SIZE, n_clusters=N_CLUSTERS,
+        judge=get_judge_client(JUDGE_MODEL) if CLASSIFY_UNPLACED else None,
+    )
+    bank.save(RUBRIC_BANK_DIR)
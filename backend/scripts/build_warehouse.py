@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import MEDICAL_3_RESULTS_DIR, RESULTS_DATASETS_ROOT, RESULTS_WAREHOUSE_PATH
+from utils.results_warehouse import MEDICAL_3_FILES, ResultsWarehouse
+
+# Loads every existing <dataset>/<model> scored_final_dataset (Parquet or CSV) and the
+# medical_3/<model>/ results into the results warehouse. With VERIFY, each imported CSV is
+# compared against the same run exported back out of the warehouse. With EXPORT_DIR set,
+# every run is then written as <EXPORT_DIR>/<dataset>/<model>/<file>.csv from the warehouse.
+DATASETS_ROOT = RESULTS_DATASETS_ROOT
+MEDICAL_3_DIR = MEDICAL_3_RESULTS_DIR
+VERIFY = True
+EXPORT_DIR = None  # e.g. "exports"; None skips the export
+
+
+def source_csv(dataset: str, model: str) -> Path:
+    if dataset in MEDICAL_3_FILES:
+        return Path(MEDICAL_3_DIR) / model / f"{MEDICAL_3_FILES[dataset]}.csv"
+    return Path(DATASETS_ROOT) / dataset / model / "scored_final_dataset.csv"
+
+
+if __name__ == "__main__":
+    warehouse = ResultsWarehouse(RESULTS_WAREHOUSE_PATH)
+    written = warehouse.import_all(DATASETS_ROOT)
+    if Path(MEDICAL_3_DIR).exists():
+        written.update(warehouse.import_medical_3(MEDICAL_3_DIR))
+    for run, count in written.items():
+        print(f"{run}: {count} rows")
+    print(f"Imported {len(written)} runs into {RESULTS_WAREHOUSE_PATH}")
+    if VERIFY:
+        failed = 0
+        for dataset, model in warehouse.runs():
+            path = source_csv(dataset, model)
+            if not path.exists():
+                continue
+            mismatches = warehouse.round_trip_mismatches(dataset, model, str(path))
+            for mismatch in mismatches:
+                print(f"✗ {dataset}/{model}: {mismatch}")
+            failed += bool(mismatches)
+        print(f"Round trip: {failed} run(s) differ from their source CSV")
+    if EXPORT_DIR:
+        for dataset, model in warehouse.runs():
+            file_name = MEDICAL_3_FILES.get(dataset, "scored_final_dataset")
+            path = Path(EXPORT_DIR) / dataset / model / f"{file_name}.csv"
+            count = warehouse.export_run(dataset, model, str(path))
+            print(f"Exported {count} rows to {path}")
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import COMPARISON_ALPHA, COMPARISON_BOOTSTRAP_SAMPLES
+from analysis.model_comparison import write_comparisons
+
+# Writes <dataset>/model_comparison.json for the dashboard: per metric, model means and for
+# every model pair the win/tie/loss rates and a paired bootstrap CI and p-value.
+DATASETS_ROOT = str(Path(__file__).resolve().parents[2] / "frontend" / "public" / "datasets")
+DATASETS = None  # e.g. ["sakhi"]; None compares every dataset
+N_BOOT = COMPARISON_BOOTSTRAP_SAMPLES
+ALPHA = COMPARISON_ALPHA
+
+
+if __name__ == "__main__":
+    written = write_comparisons(DATASETS_ROOT, datasets=DATASETS, n_boot=N_BOOT, alpha=ALPHA)
+    for dataset, path in written.items():
+        print(f"{dataset}: {path}")
+    print(f"Wrote {len(written)} model comparisons")
@@ -8,10 +8,23 @@ from google import genai
 from google.genai import types
 from pathlib import Path
 from dotenv import load_dotenv
-from langdetect import detect
 from typing import Optional
-from config import model_name as DEFAULT_MODEL_NAME
+from config import model_name as DEFAULT_MODEL_NAME, GENERATION_TIMEOUT_SECONDS
+from utils.language_utils import detect_language_code
+from utils.file_utils import atomic_write_csv, read_csv_cached
+from utils.journal import StageJournal
+from utils.batch_jobs import BatchProvider, run_batch
+from utils.partition_utils import ROW_ID_COLUMN, assign_row_ids
+from utils.rate_limiter import api_key_fingerprint, get_rate_limiter
+from utils.hedging import get_latency_tracker
+from utils.token_utils import estimate_tokens, record_usage, reported_prompt_tokens
 from prompts import *
+
+
+class GenerationError(Exception):
+    """A "⚠️ ..." error response, raised while racing hedged generation calls."""
+
+
 PROMPT_MAP = {
     "sakhi": SAKHI_PROMPT,
     "user_history1": USER_HISTORY1_PROMPT,
@@ -31,11 +44,8 @@ class LanguageDetector:
     }
     @staticmethod
     def detect_language(text: str) -> str:
-        try:
-            code = detect(text)
-            return LanguageDetector.LANGUAGE_MAP.get(code, 'English')
-        except:
-            return "English"
+        code = detect_language_code(text)
+        return LanguageDetector.LANGUAGE_MAP.get(code, 'English')
 
 
 class PregnancyHealthLLM:
@@ -44,29 +54,39 @@ class PregnancyHealthLLM:
             raise ValueError("model_name must be provided to initialize PregnancyHealthLLM.")
         self.model_name = model_name
         self.prompt_type = prompt_type
+        self.key_id = api_key_fingerprint(api_key)
+        self.rate_limiter = get_rate_limiter()
         model_lower = model_name.lower()
         if "gpt" in model_lower or "o1" in model_lower:
             self.provider = "openai"
-            self.client = OpenAI(api_key=api_key)
+            self.client = OpenAI(api_key=api_key, timeout=GENERATION_TIMEOUT_SECONDS)
         elif "c4ai-aya-expanse-32b" in model_lower or "command-a-03-2025" in model_lower:
             self.provider = "cohere"
-            self.client = cohere.Client(api_key=api_key)
+            self.client = cohere.Client(api_key=api_key, timeout=GENERATION_TIMEOUT_SECONDS)
         elif "llama" in model_lower or "together" in model_lower:
             self.provider = "together"
-            self.client = Together(api_key=api_key)
+            self.client = Together(api_key=api_key, timeout=GENERATION_TIMEOUT_SECONDS)
             if not self.model_name.startswith("meta-llama/"):
                 self.together_model_name = f"meta-llama/{self.model_name}"
             else:
                 self.together_model_name = self.model_name
         elif "gemini" in model_lower:
             self.provider = "gemini"
-            self.client = genai.Client(api_key=api_key)
+            self.client = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(timeout=GENERATION_TIMEOUT_SECONDS * 1000)
+            )
         else:
             raise ValueError(f"Unsupported model name: {model_name}")
         self.prompt_template = USER_HISTORY1_PROMPT
+        self.latency = get_latency_tracker(f"generation:{model_name}")
 
 
-    def generate_response(self, row: dict, detected_language: str) -> str:
+    def _record_usage(self, prompt_tokens: int, response) -> None:
+        record_usage(self.provider, self.model_name, prompt_tokens, reported_prompt_tokens(response))
+
+
+    def build_prompt(self, row: dict, detected_language: str) -> str:
         if self.prompt_type == "test1":
             prompt = self.prompt_template.format(
                 user_history=row.get("User History", "No history provided"),
@@ -88,6 +108,44 @@ class PregnancyHealthLLM:
                 question=row["Questions"],
                 detected_language=detected_language
             )
+        return prompt
+
+
+    def batch_request(self, prompt: str) -> dict:
+        """Same settings as the interactive call, in the form batch providers expect"""
+        if self.provider == "gemini" or self.uses_responses_api:
+            return {"prompt": prompt, "max_tokens": None, "temperature": None}
+        return {"prompt": prompt, "max_tokens": 150, "temperature": 0.7}
+
+
+    @property
+    def uses_responses_api(self) -> bool:
+        return self.provider == "openai" and any(m in self.model_name for m in ["gpt-5", "gpt-4.1", "gpt-4o"])
+
+
+    def generate_response(self, row: dict, detected_language: str) -> str:
+        prompt = self.build_prompt(row, detected_language)
+        return self._hedged_generate(prompt)
+
+
+    def _hedged_generate(self, prompt: str) -> str:
+        # "⚠️" error strings are raised inside the hedged call so a fast failure cannot win
+        # over (and cancel) a request that is still running; the caller still gets the string
+        def attempt() -> str:
+            response = self._generate(prompt)
+            if response.startswith("⚠️"):
+                raise GenerationError(response)
+            return response
+        try:
+            return self.latency.call(attempt)
+        except GenerationError as e:
+            return str(e)
+
+
+    def _generate(self, prompt: str) -> str:
+        # Shared host-wide budget for this provider and key
+        prompt_tokens = estimate_tokens(prompt, self.provider)
+        self.rate_limiter.acquire(self.provider, self.key_id, tokens=prompt_tokens + 150)
 
         # if self.provider == "openai":
         #     response = self.client.chat.completions.create(
@@ -99,7 +157,7 @@ class PregnancyHealthLLM:
         #     return response.choices[0].message.content.strip()
 
         if self.provider == "openai":
-            if any(m in self.model_name for m in ["gpt-5", "gpt-4.1", "gpt-4o"]):
+            if self.uses_responses_api:
                 try:
                     response = self.client.responses.create(
                         model=self.model_name,
@@ -107,6 +165,7 @@ class PregnancyHealthLLM:
                         text={"verbosity": "low"},  # Optional: control response length
                         reasoning={"effort": "low"}  # Optional: control reasoning effort
                     )
+                    self._record_usage(prompt_tokens, response)
                     
                     # Handle the response structure correctly
                     if hasattr(response, "output_text") and response.output_text:
@@ -137,6 +196,7 @@ class PregnancyHealthLLM:
                     max_tokens=150,
                     temperature=0.7
                 )
+                self._record_usage(prompt_tokens, response)
                 return response.choices[0].message.content.strip()
 
         elif self.provider == "cohere":
@@ -146,6 +206,7 @@ class PregnancyHealthLLM:
                 max_tokens=150,
                 temperature=0.7
             )
+            self._record_usage(prompt_tokens, response)
             return response.text.strip()
 
         elif self.provider == "together":
@@ -155,6 +216,7 @@ class PregnancyHealthLLM:
                 max_tokens=150,
                 temperature=0.7
             )
+            self._record_usage(prompt_tokens, response)
             if hasattr(response, "choices"):
                 return response.choices[0].message.content.strip()
             elif hasattr(response, "text"):
@@ -171,12 +233,15 @@ class PregnancyHealthLLM:
                     thinking_config=types.ThinkingConfig(thinking_budget=0)  # optional
                 )
             )
+            self._record_usage(prompt_tokens, response)
             return response.text.strip()
         
         return "No response generated."
 
 
 class PregnancyLLMResponder:
+    OUTPUT_COLUMNS = ["llm_response"]
+
     def __init__(self, model_name: Optional[str] = None, api_key: Optional[str] = None):
         load_dotenv()
         self.model_name = (model_name or DEFAULT_MODEL_NAME)
@@ -203,17 +268,49 @@ class PregnancyLLMResponder:
         self.detector = LanguageDetector()
 
 
-    def generate_llm_responses(self, csv_path: str, output_path: str, question_column: str = "Questions") -> pd.DataFrame:
-        df = pd.read_csv(csv_path)
+    def generate_llm_responses(self, csv_path: str, output_path: str, question_column: str = "Questions",
+                               journal_path: Optional[str] = None) -> pd.DataFrame:
+        df = read_csv_cached(csv_path)
         if question_column not in df.columns:
             raise ValueError(f"Column '{question_column}' not found in CSV.")
+        assign_row_ids(df)
+        journal = StageJournal(journal_path) if journal_path else None
+        completed = journal.load() if journal else {}
+        if completed:
+            print(f"Resuming from journal: {len(completed)} responses already generated")
         responses = []
         for _, row in df.iterrows():
+            row_id = row[ROW_ID_COLUMN]
+            if row_id in completed:
+                responses.append(completed[row_id]["llm_response"])
+                continue
             question = row[question_column]
             lang = self.detector.detect_language(question)
             response = self.llm.generate_response(row, lang)
             responses.append(response)
+            # API errors come back as "⚠️ ..." strings; leave them out so a restart retries them
+            if journal and not response.startswith("⚠️"):
+                journal.record(row_id, {"llm_response": response})
         df['llm_response'] = responses
-        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-        df.to_csv(output_path, index=False)
-        return df
\ No newline at end of file
+        atomic_write_csv(df, output_path)
+        return df
+
+
+    def generate_llm_responses_batch(self, csv_path: str, output_path: str, batch_provider: BatchProvider,
+                                     batch_dir: str, question_column: str = "Questions") -> pd.DataFrame:
+        """Generate every response through one provider batch job, merged back by row_id"""
+        df = read_csv_cached(csv_path)
+        if question_column not in df.columns:
+            raise ValueError(f"Column '{question_column}' not found in CSV.")
+        assign_row_ids(df)
+        requests = {}
+        for _, row in df.iterrows():
+            lang = self.detector.detect_language(row[question_column])
+            prompt = self.llm.build_prompt(row, lang)
+            requests[row[ROW_ID_COLUMN]] = self.llm.batch_request(prompt)
+        results = run_batch(batch_provider, requests, batch_dir)
+        df['llm_response'] = [
+            results.get(row_id) or "⚠️ Batch request returned no text" for row_id in df[ROW_ID_COLUMN]
+        ]
+        atomic_write_csv(df, output_path)
+        return df
@@ -1,11 +1,10 @@
-import os
-import json
 from pathlib import Path
 from typing import List
-import pandas as pd
 from dotenv import load_dotenv
-from openai import OpenAI
 from config import JUDGE_MODEL
+from analysis.theme_classifier import ThemeClassifier
+from utils.file_utils import read_csv_cached
+from utils.judge_client import get_judge_client
 load_dotenv()
 
 
@@ -28,52 +27,35 @@ THEMES: List[str] = [
 
 def classify_themes(
     csv_path: str,
-    api_key_env: str = "OPENAI_API_KEY",
     model=JUDGE_MODEL,
     output_path: str = None,
     max_retries: int = 3
 ) -> None:
     """
-    Reads a CSV containing a 'Questions' column, classifies each question
-    into one of the predefined THEMES via OpenAI. Validates that each
-    classification matches a theme, retrying up to max_retries per question.
+    Reads a CSV containing a 'Questions' column and classifies each question
+    into one of the predefined THEMES. A local embedding classifier built from
+    already-themed questions decides the clear cases; the rest go to the judge
+    model in batches, retried up to max_retries times.
     Writes a 'Theme' column back to the same file or to output_path.
     """
     path = Path(csv_path)
     if not path.exists():
         raise FileNotFoundError(f"CSV not found: {csv_path}")
 
-    df = pd.read_csv(path)
+    df = read_csv_cached(path)
     if "Questions" not in df.columns:
         raise ValueError("Input CSV must contain a 'Questions' column")
 
-    client = OpenAI(api_key=os.getenv(api_key_env))
-    theme_list_str = "\n".join(f"- {t}" for t in THEMES)
+    judge = get_judge_client(model)
+    classifier = ThemeClassifier.from_labeled(THEMES)
+    questions = df["Questions"].fillna("").astype(str).tolist()
+    themes = classifier.classify(questions, judge=judge, max_retries=max_retries)
+    failed = [q for q, theme in zip(questions, themes) if theme is None]
+    if failed:
+        raise RuntimeError(f"Failed to classify {len(failed)} question(s) after {max_retries} attempts: '{failed[0]}'")
+    print(f"Theme classifier: {classifier.report()}")
 
-
-    def classify(question: str) -> str:
-        """Call LLM until a valid theme is returned or raise RuntimeError."""
-        prompt = (
-            f"Classify this medical question into one theme:\n"
-            f"{theme_list_str}\n\nQuestion:\n\"\"\"{question}\"\"\"\n"
-            "Return only the exact theme name."
-        )
-        for attempt in range(max_retries):
-            try:
-                resp = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.3,
-                    max_tokens=50,
-                )
-                theme = resp.choices[0].message.content.strip()
-                if theme in THEMES:
-                    return theme
-            except Exception:
-                pass
-        raise RuntimeError(f"Failed to classify question after {max_retries} attempts: '{question}'")
-
-    df["Theme"] = df["Questions"].fillna("").apply(classify)
+    df["Theme"] = themes
 
     save_path = Path(output_path or csv_path)
     df.to_csv(save_path, index=False)
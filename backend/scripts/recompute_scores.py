@@ -0,0 +1,30 @@
+import json
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import M1_AXIS_WEIGHTS, M2_AXIS_WEIGHTS, M2_GENERATED_RUBRICS_PER_AXIS
+from analysis.score_recompute import recompute_all
+
+# Recomputes medical_quality_score / medical_quality_score_2, the axis score columns, the
+# summary store and summary_scores.csv for every dataset and model from the stored rubric
+# scores; no judge calls.
+DATASETS_ROOT = str(Path(__file__).resolve().parents[2] / "frontend" / "public" / "datasets")
+M1_WEIGHTS = M1_AXIS_WEIGHTS
+M2_WEIGHTS = M2_AXIS_WEIGHTS
+M2_CAP = M2_GENERATED_RUBRICS_PER_AXIS
+# Optional renames/merges of axes before weighting, e.g. {"Communication": "Context Awareness"}
+AXIS_MAP = None
+DRY_RUN = False
+# Input dataset (the "dataset" column of summary_scores.csv) whose summary row is refreshed;
+# only needed where a summary lists more than one dataset
+SUMMARY_DATASET = None
+
+
+if __name__ == "__main__":
+    results = recompute_all(
+        DATASETS_ROOT, m1_weights=M1_WEIGHTS, m2_weights=M2_WEIGHTS,
+        m2_cap=M2_CAP, axis_map=AXIS_MAP, dry_run=DRY_RUN, summary_dataset=SUMMARY_DATASET,
+    )
+    for run, result in results.items():
+        print(f"{run}: {json.dumps(result)}")
+    print(f"Recomputed {len(results)} runs{' (dry run)' if DRY_RUN else ''}")
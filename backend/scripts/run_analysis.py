@@ -1,4 +1,5 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pandas as pd
 sys.path.append(str(Path(__file__).resolve().parent.parent))
@@ -6,18 +7,53 @@ from config import (
     INPUT_DATASET_PATH,
     LLM_RESPONSES_OUTPUT_PATH,
     QUESTION_COLUMN,
-    LINGUISTIC_SCORED_DATASET_PATH,
-    SEMANTIC_SCORED_DATASET_PATH,
-    MEDICAL_SCORED_DATASET_PATH,
-    MEDICAL_2_SCORED_DATASET_PATH,
+    FINAL_DATASET_PATH,
+    FINAL_PARQUET_PATH,
+    PARTITION_DIR,
+    RUN_STAGES_IN_PARALLEL,
     SUMMARY_DATASET_PATH,
+    USE_BATCH_MODE,
+    BATCH_PROVIDER,
+    BATCH_WORK_DIR,
+    JUDGE_MODEL,
+    CASCADE_ENABLED,
+    ESTIMATION_ENABLED,
+    RUN_OUTPUT_DIR,
 )
 from generate_llm_response import PregnancyLLMResponder
 from analysis.linguistic_analysis import LinguisticAnalyzer
 from analysis.semantic_analysis import SemanticAnalyzer
 from analysis.medical_analysis import MedicalQualityEvaluator
 from analysis.new_med_analysis import MedicalQualityEvaluator as NewMedicalQualityEvaluator
+from analysis.axis_classifier import axis_classifier_stats
+from utils.file_utils import load_arrow_table, read_csv_cached
+from utils.journal import StageJournal
+from utils.judge_client import all_judge_metrics, get_judge_client
+from utils.batch_jobs import OFFLINE_API_KEY, OFFLINE_RESPONDERS, get_batch_provider
+from utils.token_utils import usage_summary
+from utils.single_flight import single_flight_stats
+from utils.hedging import hedging_stats
+from utils.score_memo import score_memo_stats
+from utils.embedding_cache import embedding_cache_stats
+from utils.context_cache import release_context_caches
+from utils.parquet_utils import save_scored_dataset
+from utils.cascade import JudgeCascade
+from utils.estimation import AdaptiveEstimate, load_estimate, row_strata
+from utils.summary_stats import STAGE_METRICS, SUMMARY_METRICS, SummaryAggregator, SummaryStore, write_summary_csv
+from utils.results_warehouse import get_results_warehouse
+from utils.partition_utils import ROW_ID_COLUMN, assemble_partitions, partition_exists, read_partition, write_partition
 
+# Analysis stages in the column order they appear in the final dataset.
+ANALYSIS_STAGES = ["linguistic", "semantic", "medical", "medical_2"]
+
+# Summary store keys: this <dataset>/<model> output directory and the input dataset name
+SUMMARY_RUN = f"{Path(RUN_OUTPUT_DIR).parent.name}/{Path(RUN_OUTPUT_DIR).name}"
+SUMMARY_DATASET = Path(INPUT_DATASET_PATH).stem
+# Batch jobs answered locally: no credentials needed, clients only build the prompts
+OFFLINE_BATCH = USE_BATCH_MODE and BATCH_PROVIDER in OFFLINE_RESPONDERS
+# Results warehouse keys: the <dataset>/<model> output directory
+WAREHOUSE_DATASET = Path(RUN_OUTPUT_DIR).parent.name
+WAREHOUSE_MODEL = Path(RUN_OUTPUT_DIR).name
 
 
 def file_exists(path: str) -> bool:
@@ -25,20 +61,112 @@ def file_exists(path: str) -> bool:
     return Path(path).exists()
 
 
+def stage_journal_path(stage: str) -> str:
+    """Row-level journal for a stage, replayed if the stage is restarted after a crash."""
+    return str(Path(PARTITION_DIR) / "journals" / f"{stage}.jsonl")
+
+
+def batch_dir(stage: str) -> str:
+    return str(Path(BATCH_WORK_DIR) / stage)
+
+
+def judge_batch_provider():
+    """Batch backend for the judge stages, or None when running interactively."""
+    if not USE_BATCH_MODE:
+        return None
+    return get_batch_provider(
+        JUDGE_MODEL, kind=BATCH_PROVIDER, root_dir=batch_dir("local"),
+        responder=lambda r: get_judge_client(JUDGE_MODEL).complete(
+            r["prompt"], max_tokens=r["max_tokens"], temperature=r["temperature"],
+            response_schema=r.get("response_schema"),
+        ),
+    )
+
+
+def judge_cascade():
+    """Cheap-first judge cascade for a medical stage, or None (batch mode sends every row anyway)."""
+    if not CASCADE_ENABLED or USE_BATCH_MODE:
+        return None
+    return JudgeCascade()
+
+
+def estimate_path(stage: str) -> str:
+    return str(Path(PARTITION_DIR) / "estimates" / f"{stage}.json")
+
+
+def stage_estimate(df: pd.DataFrame):
+    """Stratified early-stopping sample for a medical stage, or None to judge every row."""
+    if not ESTIMATION_ENABLED or USE_BATCH_MODE:
+        return None
+    return AdaptiveEstimate(row_strata(df))
+
+
+def stage_aggregator(stage: str) -> SummaryAggregator:
+    """Streaming summary stats for the summary metrics a stage produces."""
+    metrics = {key: SUMMARY_METRICS[key] for key in STAGE_METRICS[stage]}
+    return SummaryAggregator(SummaryStore(), SUMMARY_RUN, SUMMARY_DATASET, stage, metrics)
+
+
+def store_in_warehouse(df: pd.DataFrame, columns, backfill: bool = False) -> None:
+    """Write ``columns`` of the run's rows to the results warehouse in one transaction.
+
+    With ``backfill`` nothing is written if the warehouse already has every column
+    (outputs produced before the warehouse existed).
+    """
+    warehouse = get_results_warehouse()
+    if warehouse is None:
+        return
+    if backfill and warehouse.has_columns(WAREHOUSE_DATASET, WAREHOUSE_MODEL, list(columns)):
+        return
+    count = warehouse.write_frame(WAREHOUSE_DATASET, WAREHOUSE_MODEL, df, list(columns))
+    print(f"Results warehouse: {count} rows of {WAREHOUSE_DATASET}/{WAREHOUSE_MODEL} written")
+
+
+def semantic_reference_scores():
+    """row_id -> SBERT similarity, if the semantic stage has finished."""
+    if not partition_exists(PARTITION_DIR, "semantic"):
+        return None
+    semantic = read_partition(PARTITION_DIR, "semantic")
+    scores = pd.to_numeric(semantic["sbert_similarity"], errors="coerce")
+    return {row_id: float(s) for row_id, s in zip(semantic[ROW_ID_COLUMN], scores) if pd.notna(s)}
+
+
 def run_llm_generation() -> bool:
     """Step 1: Generate or load LLM responses."""
     print("=== Step 1: LLM Response Generation ===")
     if file_exists(LLM_RESPONSES_OUTPUT_PATH):
         print(f"✓ Responses already at {LLM_RESPONSES_OUTPUT_PATH}, skipping step.")
+        responses = read_csv_cached(LLM_RESPONSES_OUTPUT_PATH)
+        store_in_warehouse(responses, [c for c in responses.columns if c != ROW_ID_COLUMN], backfill=True)
         return True
 
     try:
-        responder = PregnancyLLMResponder()
-        responder.generate_llm_responses(
-            csv_path=INPUT_DATASET_PATH,
-            output_path=LLM_RESPONSES_OUTPUT_PATH,
-            question_column=QUESTION_COLUMN,
-        )
+        responder = PregnancyLLMResponder(api_key=OFFLINE_API_KEY if OFFLINE_BATCH else None)
+        if USE_BATCH_MODE:
+            llm = responder.llm
+            provider = get_batch_provider(
+                llm.model_name, kind=BATCH_PROVIDER, root_dir=batch_dir("local"),
+                responder=lambda r: llm._generate(r["prompt"]),
+                use_responses_api=llm.uses_responses_api,
+            )
+            responder.generate_llm_responses_batch(
+                csv_path=INPUT_DATASET_PATH,
+                output_path=LLM_RESPONSES_OUTPUT_PATH,
+                batch_provider=provider,
+                batch_dir=batch_dir("generation"),
+                question_column=QUESTION_COLUMN,
+            )
+        else:
+            journal_path = stage_journal_path("generation")
+            responder.generate_llm_responses(
+                csv_path=INPUT_DATASET_PATH,
+                output_path=LLM_RESPONSES_OUTPUT_PATH,
+                question_column=QUESTION_COLUMN,
+                journal_path=journal_path,
+            )
+            StageJournal(journal_path).clear()
+        responses = read_csv_cached(LLM_RESPONSES_OUTPUT_PATH)
+        store_in_warehouse(responses, [c for c in responses.columns if c != ROW_ID_COLUMN])
         print("✓ LLM responses generated successfully.")
         return True
     except Exception as err:
@@ -46,125 +174,173 @@ def run_llm_generation() -> bool:
         return False
 
 
-def run_linguistic_analysis() -> bool:
-    """Step 2: Score responses for linguistic quality."""
-    print("\n=== Step 2: Linguistic Analysis ===")
+def _run_analysis_stage(stage: str, title: str, analyzer_cls, journaled: bool = False) -> bool:
+    """Run one analyzer over the responses and write only its columns to its partition.
+
+    Journaled stages record each finished row so a crash mid-stage only loses the row in flight.
+    """
+    print(f"\n=== {title} ===")
+    if partition_exists(PARTITION_DIR, stage):
+        print(f"✓ Partition '{stage}' already exists, skipping step.")
+        if not SummaryStore().has_shard(SUMMARY_RUN, SUMMARY_DATASET, stage):
+            # Partitions written before the summary store existed
+            SummaryStore().replace_shard(SUMMARY_RUN, SUMMARY_DATASET, stage, read_partition(PARTITION_DIR, stage))
+        store_in_warehouse(read_partition(PARTITION_DIR, stage), analyzer_cls.OUTPUT_COLUMNS, backfill=True)
+        return True
     try:
-        linguist = LinguisticAnalyzer(LLM_RESPONSES_OUTPUT_PATH)
-        linguist.run_and_update_scores()
-        linguist.save_updated_dataset(LINGUISTIC_SCORED_DATASET_PATH)
-        print("✓ Linguistic analysis complete.")
+        analyzer = analyzer_cls(LLM_RESPONSES_OUTPUT_PATH)
+        aggregator = stage_aggregator(stage)
+        if journaled:
+            journal_path = stage_journal_path(stage)
+            cascade = judge_cascade()
+            estimate = stage_estimate(analyzer.df)
+            analyzer.run_and_update_scores(
+                journal_path=journal_path, batch_provider=judge_batch_provider(), batch_dir=batch_dir(stage),
+                cascade=cascade, reference_scores=semantic_reference_scores() if cascade else None,
+                estimate=estimate, aggregator=aggregator,
+            )
+            if cascade is not None:
+                print(f"Judge cascade [{stage}]: {cascade.summary()}")
+            if estimate is not None:
+                estimate.save(estimate_path(stage))
+                print(f"Estimate [{stage}]: {estimate.summary()}")
+            else:
+                Path(estimate_path(stage)).unlink(missing_ok=True)
+            write_partition(analyzer.df, PARTITION_DIR, stage, analyzer_cls.OUTPUT_COLUMNS)
+            store_in_warehouse(analyzer.df, analyzer_cls.OUTPUT_COLUMNS)
+            StageJournal(journal_path).clear()
+        else:
+            analyzer.run_and_update_scores()
+            aggregator.add_frame(analyzer.df)
+            write_partition(analyzer.df, PARTITION_DIR, stage, analyzer_cls.OUTPUT_COLUMNS)
+            store_in_warehouse(analyzer.df, analyzer_cls.OUTPUT_COLUMNS)
+        print(f"✓ {title} complete.")
         return True
     except Exception as err:
-        print(f"✗ Linguistic analysis error: {err}")
+        print(f"✗ {title} error: {err}")
         return False
 
 
+def run_linguistic_analysis() -> bool:
+    """Step 2: Score responses for linguistic quality."""
+    return _run_analysis_stage("linguistic", "Step 2: Linguistic Analysis", LinguisticAnalyzer)
+
+
 def run_semantic_analysis() -> bool:
     """Step 3: Score responses for semantic similarity."""
-    print("\n=== Step 3: Semantic Analysis ===")
-    try:
-        semantic = SemanticAnalyzer(LINGUISTIC_SCORED_DATASET_PATH)
-        semantic.run_and_update_scores()
-        semantic.save_updated_dataset(SEMANTIC_SCORED_DATASET_PATH)
-        print("✓ Semantic analysis complete.")
-        return True
-    except Exception as err:
-        print(f"✗ Semantic analysis error: {err}")
-        return False
+    return _run_analysis_stage("semantic", "Step 3: Semantic Analysis", SemanticAnalyzer)
 
 
 def run_medical_evaluation_old() -> bool:
     """Step 4: Evaluate medical quality with legacy evaluator."""
-    print("\n=== Step 4: Medical Quality Evaluation (Legacy) ===")
-    try:
-        legacy_eval = MedicalQualityEvaluator(SEMANTIC_SCORED_DATASET_PATH)
-        legacy_eval.run_and_update_scores()
-        legacy_eval.save_updated_dataset(MEDICAL_SCORED_DATASET_PATH)
-        print("✓ Legacy medical evaluation complete.")
-        return True
-    except Exception as err:
-        print(f"✗ Legacy medical evaluation error: {err}")
-        return False
+    return _run_analysis_stage(
+        "medical", "Step 4: Medical Quality Evaluation (Legacy)", MedicalQualityEvaluator, journaled=True
+    )
 
 
 def run_medical_evaluation_new() -> bool:
     """Step 5: Evaluate medical quality with updated evaluator."""
-    print("\n=== Step 5: Medical Quality Evaluation (Updated) ===")
+    return _run_analysis_stage(
+        "medical_2", "Step 5: Medical Quality Evaluation (Updated)", NewMedicalQualityEvaluator, journaled=True
+    )
+
+
+def assemble_final_dataset() -> bool:
+    """Join the responses with every stage partition into the final scored dataset."""
+    print("\n=== Assembling final dataset ===")
     try:
-        new_eval = NewMedicalQualityEvaluator(MEDICAL_SCORED_DATASET_PATH)
-        new_eval.run_and_update_scores()
-        new_eval.save_updated_dataset(MEDICAL_2_SCORED_DATASET_PATH)
-        print("✓ Updated medical evaluation complete.")
+        base = read_csv_cached(LLM_RESPONSES_OUTPUT_PATH)
+        final_df = assemble_partitions(base, PARTITION_DIR, ANALYSIS_STAGES)
+        save_scored_dataset(final_df, FINAL_PARQUET_PATH, csv_path=FINAL_DATASET_PATH)
+        print(f"✓ Final dataset saved to: {FINAL_PARQUET_PATH} (CSV: {FINAL_DATASET_PATH})")
         return True
     except Exception as err:
-        print(f"✗ Updated medical evaluation error: {err}")
+        print(f"✗ Final dataset assembly error: {err}")
         return False
 
 
+def write_summary_scores() -> None:
+    """Write summary_scores.csv (one row per input dataset) from the summary store.
+
+    Only this run's dataset has a responses file and saved estimates; the other datasets'
+    rows are rebuilt from the store alone.
+    """
+    estimates = {key: load_estimate(estimate_path(stage))
+                 for key, stage in (("med1", "medical"), ("med2", "medical_2"))}
+    write_summary_csv(
+        SummaryStore(), SUMMARY_RUN, SUMMARY_DATASET_PATH, current=SUMMARY_DATASET,
+        rows=load_arrow_table(LLM_RESPONSES_OUTPUT_PATH).num_rows,
+        estimates={key: e for key, e in estimates.items() if e is not None},
+    )
+
+
 def main() -> None:
-    """Execute the full evaluation pipeline in five sequential steps."""
+    """Generate responses, run the four analysis stages, then assemble the final dataset."""
     print("Starting Medical QA Evaluation Pipeline...")
     print("=" * 50)
-    steps = [
-        run_llm_generation,
+    if OFFLINE_BATCH:
+        # The evaluators share this client; offline it only ever serves as a prompt target
+        get_judge_client(JUDGE_MODEL, api_key=OFFLINE_API_KEY)
+        print(f"Offline batch mode: '{BATCH_PROVIDER}' answers every generation and judge request")
+    if not run_llm_generation():
+        print("Pipeline aborted at run_llm_generation.")
+        sys.exit(1)
+
+    analysis_steps = [
         run_linguistic_analysis,
         run_semantic_analysis,
         run_medical_evaluation_old,
         run_medical_evaluation_new,
     ]
-    for step in steps:
-        if not step():
-            print(f"Pipeline aborted at {step.__name__}.")
-            sys.exit(1)
+    if RUN_STAGES_IN_PARALLEL:
+        # Stages only read the responses file and write their own partition, so they can overlap.
+        with ThreadPoolExecutor(max_workers=len(analysis_steps)) as pool:
+            results = list(pool.map(lambda step: step(), analysis_steps))
+    else:
+        results = []
+        for step in analysis_steps:
+            results.append(step())
+            if not results[-1]:
+                break
+    failed = [step.__name__ for step, ok in zip(analysis_steps, results) if not ok]
+    if failed:
+        print(f"Pipeline aborted at {', '.join(failed)}.")
+        sys.exit(1)
+
+    if not assemble_final_dataset():
+        print("Pipeline aborted at assemble_final_dataset.")
+        sys.exit(1)
     print("\n" + "=" * 50)
     print("✓ Pipeline completed successfully.")
+    for model, metrics in all_judge_metrics().items():
+        print(f"Judge metrics [{model}]: {metrics}")
+    for provider, usage in usage_summary().items():
+        print(f"Token usage [{provider}]: {usage}")
+    for group, stats in single_flight_stats().items():
+        print(f"Coalesced requests [{group}]: {stats['coalesced']} of {stats['calls']}")
+    for name, stats in hedging_stats().items():
+        print(f"Hedging [{name}]: {stats}")
+    for model, stats in release_context_caches().items():
+        print(f"Context cache [{model}]: {stats}")
+    memo_stats = score_memo_stats()
+    if memo_stats:
+        print(f"Rubric score memo: {memo_stats}")
+    embedding_stats = embedding_cache_stats()
+    if embedding_stats:
+        print(f"Embedding cache: {embedding_stats}")
+    classifier_stats = axis_classifier_stats()
+    if classifier_stats:
+        print(f"Axis classifier: {classifier_stats}")
     print("=" * 50)
 
-    # After pipeline, compute and upsert summary averages (one row per dataset)
+    # Summary averages come from the streaming stats the stages stored, so the final
+    # dataset is never read again
     try:
-        final_path = MEDICAL_2_SCORED_DATASET_PATH
-        df = pd.read_csv(final_path)
-
-        def num_mean(frame: pd.DataFrame, col: str) -> float:
-            if col not in frame.columns:
-                return 0.0
-            s = pd.to_numeric(frame[col], errors="coerce")
-            return float(s.mean()) if len(s) else 0.0
-
-        summary_row = {
-            "dataset": Path(INPUT_DATASET_PATH).stem,
-            "rows": int(len(df)),
-            "med1": num_mean(df, "medical_quality_score"),
-            "med2": num_mean(df, "medical_quality_score_2"),
-            # "semantic": num_mean(df, "semantic_similarity"),
-            "sbert": num_mean(df, "sbert_similarity"),
-            # "vyakyarth": num_mean(df, "vyakyarth_similarity"),
-            "cohere": num_mean(df, "cohere_similarity"),
-            "voyage": num_mean(df, "voyage_similarity"),
-            "openai":num_mean(df, "openai_similarity"),
-            "bert": num_mean(df, "bert_score_f1"),
-            "bleu": num_mean(df, "bleu_score"),
-            "meteor": num_mean(df, "meteor_score"),
-            "rouge_l": num_mean(df, "rouge_l_score"),
-            "perplexity": num_mean(df, "perplexity"),
-            "ling": num_mean(df, "linguistic_quality_score"),
-        }
-
-        if Path(SUMMARY_DATASET_PATH).exists():
-            s = pd.read_csv(SUMMARY_DATASET_PATH)
-            if (s["dataset"] == summary_row["dataset"]).any():
-                for k, v in summary_row.items():
-                    s.loc[s["dataset"] == summary_row["dataset"], k] = v
-            else:
-                s = pd.concat([s, pd.DataFrame([summary_row])], ignore_index=True)
-        else:
-            s = pd.DataFrame([summary_row])
-
-        Path(SUMMARY_DATASET_PATH).parent.mkdir(parents=True, exist_ok=True)
-        s.to_csv(SUMMARY_DATASET_PATH, index=False)
+        write_summary_scores()
         print(f"✓ Summary scores updated at: {SUMMARY_DATASET_PATH}")
     except Exception as err:
         print(f"✗ Failed to update summary scores: {err}")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
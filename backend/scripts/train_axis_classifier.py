@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import AXIS_CLASSIFIER_DATASETS_ROOT, AXIS_CLASSIFIER_METHOD, AXIS_CLASSIFIER_PATH
+from analysis.axis_classifier import AXES, AxisClassifier
+from analysis.rubric_bank import collect_rubric_history
+
+# Retrains the local rubric -> axis classifier from every scored run and reports how well it
+# agrees with the judge's own placements on held-out rubrics.
+METHOD = AXIS_CLASSIFIER_METHOD  # "centroid" or "logreg"
+HOLDOUT_FOLDS = 5
+
+
+if __name__ == "__main__":
+    history = collect_rubric_history(AXIS_CLASSIFIER_DATASETS_ROOT).dropna(subset=["axis"])
+    history = history[history["axis"].isin(AXES)].drop_duplicates("rubric")
+    if history.empty:
+        print(f"No classified rubrics under {AXIS_CLASSIFIER_DATASETS_ROOT}")
+        sys.exit(1)
+    rubrics, labels = history["rubric"].tolist(), history["axis"].tolist()
+    classifier = AxisClassifier.fit(rubrics, labels, method=METHOD)
+    print(f"Trained on {len(rubrics)} rubrics: {history['axis'].value_counts().to_dict()}")
+    print(f"Holdout ({HOLDOUT_FOLDS}-fold): {classifier.holdout_accuracy(rubrics, labels, folds=HOLDOUT_FOLDS)}")
+    classifier.save(AXIS_CLASSIFIER_PATH)
@@ -0,0 +1,411 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+from openai import OpenAI
+from google import genai
+from google.genai import types
+from config import BATCH_POLL_SECONDS
+from utils.judge_client import openai_response_format, to_gemini_schema
+from utils.single_flight import request_key
+load_dotenv()
+
+# A request is {"prompt": str, "max_tokens": Optional[int], "temperature": Optional[float]}
+# plus an optional "response_schema" (JSON Schema) for structured output;
+# custom IDs are row IDs for generation and request hashes for judge prompts.
+BatchRequest = Dict[str, Any]
+
+
+class BatchProvider(ABC):
+    """Interface for batch backends: format request lines, submit a file, poll, fetch."""
+    name = "base"
+
+    @abstractmethod
+    def format_request(self, custom_id: str, request: BatchRequest) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def submit(self, requests_path: str) -> str:
+        ...
+
+    @abstractmethod
+    def status(self, job_id: str) -> str:
+        """One of "running", "completed" or "failed"."""
+
+    @abstractmethod
+    def fetch_results(self, job_id: str) -> Dict[str, Optional[str]]:
+        ...
+
+
+def _openai_output_text(body: Dict[str, Any]) -> Optional[str]:
+    if body.get("choices"):
+        content = body["choices"][0].get("message", {}).get("content")
+        return content.strip() if content else None
+    # Responses API: message items carry a list of output_text parts
+    texts = []
+    for item in body.get("output") or []:
+        for part in item.get("content") or []:
+            if part.get("text"):
+                texts.append(part["text"])
+    return "".join(texts).strip() or None
+
+
+class OpenAIBatchProvider(BatchProvider):
+    name = "openai"
+
+    def __init__(self, model: str, api_key: Optional[str] = None, use_responses_api: bool = False):
+        self.model = model
+        self.use_responses_api = use_responses_api
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+
+    @property
+    def endpoint(self) -> str:
+        return "/v1/responses" if self.use_responses_api else "/v1/chat/completions"
+
+    def format_request(self, custom_id: str, request: BatchRequest) -> Dict[str, Any]:
+        if self.use_responses_api:
+            body = {
+                "model": self.model, "input": request["prompt"],
+                "text": {"verbosity": "low"}, "reasoning": {"effort": "low"},
+            }
+        else:
+            body = {"model": self.model, "messages": [{"role": "user", "content": request["prompt"]}]}
+            if request.get("max_tokens") is not None:
+                body["max_tokens"] = request["max_tokens"]
+            if request.get("temperature") is not None:
+                body["temperature"] = request["temperature"]
+            if request.get("response_schema") is not None:
+                body["response_format"] = openai_response_format(request["response_schema"])
+        return {"custom_id": custom_id, "method": "POST", "url": self.endpoint, "body": body}
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, 'rb') as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=self.endpoint, completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, job_id: str) -> str:
+        batch = self.client.batches.retrieve(job_id)
+        if batch.status in ("completed", "expired", "cancelled"):
+            # Expired and cancelled jobs still return whatever finished
+            return "completed" if batch.output_file_id else "failed"
+        if batch.status == "failed":
+            return "failed"
+        return "running"
+
+    def fetch_results(self, job_id: str) -> Dict[str, Optional[str]]:
+        batch = self.client.batches.retrieve(job_id)
+        results: Dict[str, Optional[str]] = {}
+        if not batch.output_file_id:
+            return results
+        content = self.client.files.content(batch.output_file_id).text
+        for line in content.split("\n"):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") == 200:
+                results[entry["custom_id"]] = _openai_output_text(response.get("body") or {})
+            else:
+                results[entry["custom_id"]] = None
+        return results
+
+
+class GeminiBatchProvider(BatchProvider):
+    name = "gemini"
+
+    def __init__(self, model: str, api_key: Optional[str] = None):
+        self.model = model
+        api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        self.client = genai.Client(api_key=api_key)
+
+    def format_request(self, custom_id: str, request: BatchRequest) -> Dict[str, Any]:
+        generation_config: Dict[str, Any] = {"thinking_config": {"thinking_budget": 0}}
+        if request.get("max_tokens") is not None:
+            generation_config["max_output_tokens"] = request["max_tokens"]
+        if request.get("temperature") is not None:
+            generation_config["temperature"] = request["temperature"]
+        if request.get("response_schema") is not None:
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = to_gemini_schema(request["response_schema"])
+        return {
+            "key": custom_id,
+            "request": {
+                "contents": [{"role": "user", "parts": [{"text": request["prompt"]}]}],
+                "generation_config": generation_config,
+            },
+        }
+
+    def submit(self, requests_path: str) -> str:
+        uploaded = self.client.files.upload(
+            file=requests_path,
+            config=types.UploadFileConfig(display_name=Path(requests_path).parent.name, mime_type="jsonl"),
+        )
+        job = self.client.batches.create(
+            model=self.model, src=uploaded.name,
+            config={"display_name": Path(requests_path).parent.name},
+        )
+        return job.name
+
+    def status(self, job_id: str) -> str:
+        state = self.client.batches.get(name=job_id).state.name
+        if state == "JOB_STATE_SUCCEEDED":
+            return "completed"
+        if state in ("JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"):
+            return "failed"
+        return "running"
+
+    def fetch_results(self, job_id: str) -> Dict[str, Optional[str]]:
+        job = self.client.batches.get(name=job_id)
+        results: Dict[str, Optional[str]] = {}
+        if not job.dest or not job.dest.file_name:
+            return results
+        content = self.client.files.download(file=job.dest.file_name).decode("utf-8")
+        for line in content.split("\n"):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            text = None
+            candidates = (entry.get("response") or {}).get("candidates") or []
+            if candidates:
+                parts = (candidates[0].get("content") or {}).get("parts") or []
+                text = "".join(p.get("text", "") for p in parts).strip() or None
+            results[entry["key"]] = text
+        return results
+
+
+class LocalBatchProvider(BatchProvider):
+    """File-based stand-in: jobs live under ``root_dir`` and are answered by ``responder``.
+
+    The responder gets each request dict and returns text (or None): the interactive
+    client for real answers, or one of OFFLINE_RESPONDERS to run the whole
+    write/submit/poll/merge/resume flow without credentials or network calls.
+    """
+    name = "local"
+
+    def __init__(self, responder: Callable[[BatchRequest], Optional[str]], root_dir: str):
+        self.responder = responder
+        self.root_dir = Path(root_dir)
+
+    def format_request(self, custom_id: str, request: BatchRequest) -> Dict[str, Any]:
+        return {"custom_id": custom_id, **request}
+
+    def submit(self, requests_path: str) -> str:
+        job_id = uuid.uuid4().hex
+        job_dir = self.root_dir / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        (job_dir / "input.jsonl").write_bytes(Path(requests_path).read_bytes())
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        job_dir = self.root_dir / job_id
+        if not (job_dir / "input.jsonl").exists():
+            return "failed"
+        output_path = job_dir / "output.jsonl"
+        if not output_path.exists():
+            # Run the job on first poll, then publish the output in one rename
+            lines = []
+            with open(job_dir / "input.jsonl", 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    request = json.loads(line)
+                    try:
+                        text = self.responder(request)
+                    except Exception as e:
+                        print(f"Local batch request {request['custom_id']} failed: {e}")
+                        text = None
+                    lines.append(json.dumps({"custom_id": request["custom_id"], "text": text},
+                                            ensure_ascii=False))
+            tmp_path = job_dir / "output.jsonl.tmp"
+            tmp_path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+            os.replace(tmp_path, output_path)
+        return "completed"
+
+    def fetch_results(self, job_id: str) -> Dict[str, Optional[str]]:
+        results: Dict[str, Optional[str]] = {}
+        with open(self.root_dir / job_id / "output.jsonl", 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    results[entry["custom_id"]] = entry["text"]
+        return results
+
+
+def _schema_example(schema: Dict[str, Any]) -> Any:
+    """Smallest value of the schema's shape: first enum value, one array item, every property."""
+    if schema.get("enum"):
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _schema_example(value) for key, value in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return [_schema_example(schema.get("items") or {})]
+    return {"integer": 0, "number": 0.0, "boolean": False}.get(kind, "offline")
+
+
+def echo_responder(request: BatchRequest) -> str:
+    """Answers with the prompt itself."""
+    return request["prompt"]
+
+
+def canned_responder(request: BatchRequest) -> str:
+    """Answers with a fixed value that fits the request's response schema (or fixed text)."""
+    schema = request.get("response_schema")
+    if schema is None:
+        return "Offline batch response."
+    return json.dumps(_schema_example(schema), ensure_ascii=False)
+
+
+# BATCH_PROVIDER values that answer locally without calling any model
+OFFLINE_RESPONDERS: Dict[str, Callable[[BatchRequest], Optional[str]]] = {
+    "echo": echo_responder,
+    "canned": canned_responder,
+}
+# Stands in for API keys when clients are only built for their prompts in offline runs
+OFFLINE_API_KEY = "offline"
+
+
+def get_batch_provider(model: str, kind: Optional[str] = None,
+                       responder: Optional[Callable[[BatchRequest], Optional[str]]] = None,
+                       root_dir: Optional[str] = None, use_responses_api: bool = False) -> BatchProvider:
+    """Batch backend for a model; ``kind="local"`` selects the file-based stand-in, answered
+    by ``responder``, and an OFFLINE_RESPONDERS key the stand-in with that responder."""
+    if kind in OFFLINE_RESPONDERS:
+        if root_dir is None:
+            raise ValueError("The offline batch providers need a root_dir")
+        return LocalBatchProvider(OFFLINE_RESPONDERS[kind], root_dir)
+    if kind == "local":
+        if responder is None or root_dir is None:
+            raise ValueError("The local batch provider needs a responder and a root_dir")
+        return LocalBatchProvider(responder, root_dir)
+    model_lower = model.lower()
+    if "gemini" in model_lower:
+        return GeminiBatchProvider(model)
+    if "gpt" in model_lower or "o1" in model_lower:
+        return OpenAIBatchProvider(model, use_responses_api=use_responses_api)
+    raise ValueError(f"No batch provider for model: {model}")
+
+
+def run_batch(provider: BatchProvider, requests: Dict[str, BatchRequest], work_dir: str,
+              poll_interval: float = BATCH_POLL_SECONDS,
+              timeout: Optional[float] = None) -> Dict[str, Optional[str]]:
+    """Submit requests as one batch job, wait for it, and return text per custom ID.
+
+    The job ID is kept in ``work_dir/job.json`` next to the request file, so a restarted
+    process with the same requests polls the existing job instead of submitting again.
+    Failed or missing requests map to None.
+    """
+    work = Path(work_dir)
+    work.mkdir(parents=True, exist_ok=True)
+    if not requests:
+        return {}
+    payload = "".join(
+        json.dumps(provider.format_request(custom_id, request), ensure_ascii=False) + "\n"
+        for custom_id, request in requests.items()
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    job_file = work / "job.json"
+    job = json.loads(job_file.read_text(encoding='utf-8')) if job_file.exists() else None
+    if job and job.get("digest") == digest and job.get("provider") == provider.name:
+        job_id = job["job_id"]
+        print(f"Resuming {provider.name} batch {job_id}")
+    else:
+        requests_path = work / "requests.jsonl"
+        requests_path.write_text(payload, encoding='utf-8')
+        job_id = provider.submit(str(requests_path))
+        job_file.write_text(json.dumps({
+            "provider": provider.name, "job_id": job_id, "digest": digest,
+            "requests": len(requests), "submitted_at": time.time(),
+        }), encoding='utf-8')
+        print(f"Submitted {provider.name} batch {job_id} with {len(requests)} requests")
+
+    start = time.monotonic()
+    while True:
+        status = provider.status(job_id)
+        if status == "completed":
+            break
+        if status == "failed":
+            print(f"Batch {job_id} failed")
+            return {custom_id: None for custom_id in requests}
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {job_id} still running after {timeout}s")
+        time.sleep(poll_interval)
+
+    results = provider.fetch_results(job_id)
+    merged = {custom_id: results.get(custom_id) for custom_id in requests}
+    with open(work / "results.jsonl", 'w', encoding='utf-8') as f:
+        for custom_id, text in merged.items():
+            f.write(json.dumps({"custom_id": custom_id, "text": text}, ensure_ascii=False) + "\n")
+    answered = sum(1 for text in merged.values() if text)
+    print(f"Batch {job_id} complete: {answered}/{len(merged)} requests answered")
+    return merged
+
+
+class BatchPromptCollector:
+    """Stands in for a JudgeClient while an evaluator runs in batch phases.
+
+    Prompts with a batch answer are served from it; unseen prompts are queued and return
+    None, so each row stops at its first unanswered step. Prompts the batch failed to
+    answer fall back to the interactive client.
+    """
+
+    def __init__(self, judge):
+        self.judge = judge
+        self.model = judge.model
+        self.responses: Dict[str, str] = {}
+        self.pending: Dict[str, BatchRequest] = {}
+        self.submitted = set()
+        self.interactive_fallback = False
+        self._lock = threading.Lock()
+
+    def complete(self, prompt: str, max_tokens: int = 800, temperature: float = 0.1,
+                 response_schema: Optional[Dict[str, Any]] = None, prefix: Optional[str] = None,
+                 **kwargs) -> Optional[str]:
+        if prefix:
+            # Batch jobs have no context cache, so the static prefix is sent inline
+            prompt = prefix + prompt
+        key = request_key(prompt, max_tokens, temperature, response_schema)
+        with self._lock:
+            if key in self.responses:
+                return self.responses[key]
+            submitted = key in self.submitted or self.interactive_fallback
+            if not submitted:
+                self.pending[key] = {
+                    "prompt": prompt, "max_tokens": max_tokens, "temperature": temperature,
+                    "response_schema": response_schema,
+                }
+        if submitted:
+            return self.judge.complete(prompt, max_tokens=max_tokens, temperature=temperature,
+                                       response_schema=response_schema, **kwargs)
+        return None
+
+
+def run_in_phases(collector: BatchPromptCollector, run_pass: Callable[[], Any],
+                  provider: BatchProvider, work_dir: str, max_phases: int = 6) -> Any:
+    """Repeat ``run_pass`` and batch whatever prompts it queued, until nothing is queued.
+
+    Each pass gets one step further per row (e.g. rubric generation, then scoring, then
+    classification); the result of the final pass, fully served from batch answers, is returned.
+    """
+    for phase in range(1, max_phases + 1):
+        collector.pending.clear()
+        result = run_pass()
+        if not collector.pending:
+            return result
+        pending = dict(collector.pending)
+        print(f"Batch phase {phase}: {len(pending)} judge prompts")
+        answers = run_batch(provider, pending, str(Path(work_dir) / f"phase_{phase}"))
+        collector.submitted.update(pending)
+        collector.responses.update({key: text for key, text in answers.items() if text})
+    # Out of phases: whatever is still unanswered goes to the interactive client
+    collector.interactive_fallback = True
+    return run_pass()
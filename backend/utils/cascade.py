@@ -0,0 +1,141 @@
+import json
+import threading
+from typing import Any, Dict, Optional
+from config import (
+    JUDGE_MODEL,
+    CHEAP_JUDGE_MODEL,
+    CASCADE_MAX_DISAGREEMENT,
+    CASCADE_MAX_SEMANTIC_GAP,
+    JUDGE_PRICES_PER_MTOK,
+)
+from utils.judge_client import get_judge_client
+
+# Generation stores provider failures as "⚠️ ..." strings instead of raising
+ERROR_PREFIXES = ("⚠️",)
+PLACEHOLDER_RESPONSES = {"No response generated."}
+
+
+def prefilter_reason(llm_response: str) -> Optional[str]:
+    """Why a response can be scored without a judge, or None if it needs judging."""
+    text = (llm_response or "").strip()
+    if not text:
+        return "empty"
+    if text.startswith(ERROR_PREFIXES) or text in PLACEHOLDER_RESPONSES:
+        return "generation_error"
+    return None
+
+
+def rubric_disagreement(first: Dict[str, Optional[int]], second: Dict[str, Optional[int]]) -> float:
+    """Fraction of rubrics scored in both passes whose scores differ."""
+    both = [r for r in first if first[r] is not None and second.get(r) is not None]
+    if not both:
+        return 1.0
+    return sum(1 for r in both if first[r] != second[r]) / len(both)
+
+
+def token_cost(model: str, input_tokens: float, output_tokens: float) -> Optional[float]:
+    prices = JUDGE_PRICES_PER_MTOK.get(model)
+    if prices is None:
+        return None
+    return (input_tokens * prices["input"] + output_tokens * prices["output"]) / 1e6
+
+
+class JudgeCascade:
+    """Cheap-first judging for the medical evaluators.
+
+    Pre-filtered rows get deterministic zero scores. Everything else is scored by the cheap
+    judge, which then scores the same rubrics a second time; rows are escalated to the strong
+    judge when that pass fails, when the two passes disagree on more than
+    ``max_disagreement`` of the rubrics, or when the score is more than ``max_semantic_gap``
+    away from the row's SBERT similarity (if known). The evaluator supplies
+    ``using_judge``, ``evaluate_row``, ``agreement_scores`` and ``prefiltered_outputs``.
+    """
+
+    def __init__(self, cheap_model: str = CHEAP_JUDGE_MODEL, strong_model: str = JUDGE_MODEL,
+                 max_disagreement: float = CASCADE_MAX_DISAGREEMENT,
+                 max_semantic_gap: float = CASCADE_MAX_SEMANTIC_GAP):
+        self.cheap_model = cheap_model
+        self.strong_model = strong_model
+        self.cheap = get_judge_client(cheap_model)
+        self.strong = get_judge_client(strong_model)
+        self.max_disagreement = max_disagreement
+        self.max_semantic_gap = max_semantic_gap
+        self._lock = threading.Lock()
+        self.counts = {
+            "rows": 0, "prefiltered": 0, "cheap_only": 0, "escalated": 0,
+            "escalated_cheap_failed": 0, "escalated_disagreement": 0, "escalated_semantic": 0,
+        }
+        # Estimated tokens: the cheap judge's first pass (what a strong-only run would have
+        # sent), the cheap agreement pass, and the strong judge's escalations
+        self.tokens = {
+            "cheap_first": [0, 0], "cheap_agreement": [0, 0], "strong": [0, 0],
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _add_tokens(self, name: str, meter: Dict[str, int]) -> None:
+        with self._lock:
+            self.tokens[name][0] += meter["input"]
+            self.tokens[name][1] += meter["output"]
+
+    def evaluate(self, evaluator, question: str, gold_answer: str, llm_response: str,
+                 reference_score: Optional[float] = None) -> Dict[str, Any]:
+        self._count("rows")
+        reason = prefilter_reason(llm_response)
+        if reason:
+            self._count("prefiltered")
+            return evaluator.prefiltered_outputs(reason)
+
+        with evaluator.using_judge(self.cheap) as meter:
+            outputs = evaluator.evaluate_row(question, gold_answer, llm_response)
+        self._add_tokens("cheap_first", meter)
+
+        escalate = None
+        if outputs[evaluator.COMPLETE_COLUMN] is None:
+            escalate = "escalated_cheap_failed"
+        else:
+            with evaluator.using_judge(self.cheap) as meter:
+                second = evaluator.agreement_scores(question, llm_response, outputs)
+            self._add_tokens("cheap_agreement", meter)
+            first = json.loads(outputs[evaluator.RUBRIC_SCORES_COLUMN])
+            score = outputs[evaluator.SCORE_COLUMN]
+            if not second or rubric_disagreement(first, second) > self.max_disagreement:
+                escalate = "escalated_disagreement"
+            elif reference_score is not None and abs(score - reference_score) > self.max_semantic_gap:
+                escalate = "escalated_semantic"
+
+        if escalate is None:
+            self._count("cheap_only")
+            return outputs
+        self._count("escalated")
+        self._count(escalate)
+        with evaluator.using_judge(self.strong) as meter:
+            strong_outputs = evaluator.evaluate_row(question, gold_answer, llm_response)
+        self._add_tokens("strong", meter)
+        # Keep the cheap judge's result if the strong judge could not score the row either
+        if strong_outputs[evaluator.COMPLETE_COLUMN] is None and outputs[evaluator.COMPLETE_COLUMN] is not None:
+            return outputs
+        return strong_outputs
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+            tokens = {k: list(v) for k, v in self.tokens.items()}
+        judged = counts["rows"] - counts["prefiltered"]
+        summary: Dict[str, Any] = dict(counts)
+        summary["escalated_fraction"] = round(counts["escalated"] / judged, 3) if judged else 0.0
+        cheap_cost = token_cost(self.cheap_model, tokens["cheap_first"][0] + tokens["cheap_agreement"][0],
+                                tokens["cheap_first"][1] + tokens["cheap_agreement"][1])
+        strong_cost = token_cost(self.strong_model, *tokens["strong"])
+        # A strong-only run would have sent roughly the cheap judge's first-pass prompts to the
+        # strong judge, for the pre-filtered rows as well
+        per_row = [t / judged for t in tokens["cheap_first"]] if judged else [0, 0]
+        baseline = token_cost(self.strong_model, per_row[0] * counts["rows"], per_row[1] * counts["rows"])
+        if cheap_cost is not None and strong_cost is not None and baseline is not None:
+            summary["cost_usd"] = round(cheap_cost + strong_cost, 4)
+            summary["strong_only_cost_usd"] = round(baseline, 4)
+            summary["saved_usd"] = round(baseline - cheap_cost - strong_cost, 4)
+        summary["tokens"] = tokens
+        return summary
@@ -0,0 +1,171 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from itertools import count
+from typing import Dict, Optional, Tuple
+from google.genai import types
+from config import CONTEXT_CACHE_BACKEND, CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_TTL_SECONDS
+from utils.single_flight import get_single_flight, request_key
+from utils.token_utils import estimate_tokens
+
+
+class ContextCache(ABC):
+    """Provider-side cache of static prompt prefixes, managed with TTLs.
+
+    ``lookup`` returns a cache handle for (model, prefix): a live entry is reused, one close
+    to expiry has its TTL extended, and a missing or expired one is created. Prefixes too
+    short for the provider's minimum return None and are sent inline.
+    """
+    provider = "base"
+    # True when the handle is sent to the provider instead of the prefix text
+    remote = True
+
+    def __init__(self, ttl_s: float = CONTEXT_CACHE_TTL_SECONDS, min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+                 refresh_margin_s: float = 300.0):
+        self.ttl_s = ttl_s
+        self.min_tokens = min_tokens
+        self.refresh_margin_s = min(refresh_margin_s, ttl_s / 2)
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "hits": 0, "extended": 0, "too_small": 0, "failures": 0}
+
+    @abstractmethod
+    def _create(self, model: str, prefix: str, key: str) -> str:
+        """Create a cache for ``prefix`` living ``ttl_s`` seconds; returns its name."""
+
+    @abstractmethod
+    def _extend(self, name: str) -> None:
+        """Push the cache's expiry ``ttl_s`` seconds from now."""
+
+    @abstractmethod
+    def _delete(self, name: str) -> None:
+        ...
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def lookup(self, model: str, prefix: str) -> Optional[str]:
+        if estimate_tokens(prefix, self.provider) < self.min_tokens:
+            self._count("too_small")
+            return None
+        key = request_key(model, prefix)
+        with self._lock:
+            entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None:
+            name, expires_at = entry
+            if expires_at - now > self.refresh_margin_s:
+                self._count("hits")
+                return name
+            if expires_at > now:
+                try:
+                    self._extend(name)
+                    with self._lock:
+                        self._entries[key] = (name, now + self.ttl_s)
+                    self._count("extended")
+                    return name
+                except Exception as e:
+                    print(f"Could not extend context cache {name}: {e}")
+        # Concurrent first requests for the same prefix create one cache between them
+        return get_single_flight("context_cache").do(key, lambda: self._create_entry(model, prefix, key))
+
+    def _create_entry(self, model: str, prefix: str, key: str) -> Optional[str]:
+        try:
+            name = self._create(model, prefix, key)
+        except Exception as e:
+            self._count("failures")
+            print(f"Context cache creation failed for {model}: {e}")
+            return None
+        with self._lock:
+            self._entries[key] = (name, time.time() + self.ttl_s)
+        self._count("created")
+        return name
+
+    def release(self) -> None:
+        """Delete every cache this process created instead of waiting for the TTLs."""
+        with self._lock:
+            entries = dict(self._entries)
+            self._entries.clear()
+        for name, _ in entries.values():
+            try:
+                self._delete(name)
+            except Exception as e:
+                print(f"Could not delete context cache {name}: {e}")
+
+
+class GeminiContextCache(ContextCache):
+    provider = "gemini"
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+
+    def _create(self, model: str, prefix: str, key: str) -> str:
+        cache = self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=[prefix],
+                ttl=f"{int(self.ttl_s)}s",
+                display_name=f"judge-prefix-{key[:12]}",
+            ),
+        )
+        return cache.name
+
+    def _extend(self, name: str) -> None:
+        self.client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(self.ttl_s)}s"))
+
+    def _delete(self, name: str) -> None:
+        self.client.caches.delete(name=name)
+
+
+class LocalContextCache(ContextCache):
+    """In-process stand-in with the same TTL bookkeeping; prompts are still sent in full."""
+    provider = "local"
+    remote = False
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._ids = count(1)
+        self.deleted = []
+
+    def _create(self, model: str, prefix: str, key: str) -> str:
+        return f"local-cache/{next(self._ids)}"
+
+    def _extend(self, name: str) -> None:
+        pass
+
+    def _delete(self, name: str) -> None:
+        self.deleted.append(name)
+
+
+_caches: Dict[str, ContextCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_context_cache(provider: str, client, model: str) -> Optional[ContextCache]:
+    """Context cache for a judge client per CONTEXT_CACHE_BACKEND, or None.
+
+    OpenAI caches long prompt prefixes automatically, so only Gemini needs explicit caches.
+    """
+    if CONTEXT_CACHE_BACKEND == "local":
+        cache: ContextCache = LocalContextCache()
+    elif CONTEXT_CACHE_BACKEND == "gemini" and provider == "gemini":
+        cache = GeminiContextCache(client)
+    else:
+        return None
+    with _caches_lock:
+        _caches[model] = cache
+    return cache
+
+
+def release_context_caches() -> Dict[str, Dict[str, int]]:
+    """Delete this run's caches and return their stats per model."""
+    with _caches_lock:
+        caches = dict(_caches)
+        _caches.clear()
+    stats = {}
+    for model, cache in caches.items():
+        cache.release()
+        stats[model] = dict(cache.stats)
+    return stats
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+from config import EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH
+from utils.single_flight import request_key
+
+
+class EmbeddingCache:
+    """Persistent embedding vectors, one row per (provider, model, text).
+
+    Texts are keyed by ``request_key`` (whitespace-normalized), and vectors are stored as
+    float64 bytes so a cached vector gives exactly the similarity a fresh call did.
+    """
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_PATH):
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "text_key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT text_key, vector FROM embeddings WHERE text_key IN ({placeholders})", keys
+        ).fetchall()
+        return {key: np.frombuffer(vector, dtype=np.float64) for key, vector in rows}
+
+    def store(self, vectors: Dict[str, Sequence[float]]) -> None:
+        now = time.time()
+        rows = [(key, np.asarray(v, dtype=np.float64).tobytes(), now) for key, v in vectors.items()]
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def embed(self, provider: str, model: str, texts: List[str],
+              fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[np.ndarray]:
+        """Vectors for ``texts``; only the ones never embedded go to ``fn``, in one call."""
+        keys = [request_key(provider, model, text) for text in texts]
+        known = self.lookup(list(dict.fromkeys(keys)))
+        missing = {key: text for key, text in zip(keys, texts) if key not in known}
+        with self._lock:
+            self.stats["hits"] += sum(key not in missing for key in keys)
+            self.stats["misses"] += sum(key in missing for key in keys)
+        if missing:
+            fresh = dict(zip(missing, fn(list(missing.values()))))
+            self.store(fresh)
+            known.update({key: np.asarray(v, dtype=np.float64) for key, v in fresh.items()})
+        return [known[key] for key in keys]
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache, or None when EMBEDDING_CACHE_ENABLED is off."""
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+def cached_embeddings(provider: str, model: str, texts: List[str],
+                      fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> List[np.ndarray]:
+    """``fn(texts)`` as arrays, through the embedding cache when it is enabled."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return [np.asarray(v, dtype=np.float64) for v in fn(texts)]
+    return cache.embed(provider, model, texts, fn)
+
+
+def embedding_cache_stats() -> Dict[str, int]:
+    with _cache_lock:
+        return dict(_cache.stats) if _cache is not None else {}
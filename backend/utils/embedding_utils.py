@@ -0,0 +1,41 @@
+import threading
+from typing import Dict, List
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from config import SBERT_MODEL_NAME
+
+_models: Dict[str, SentenceTransformer] = {}
+_models_lock = threading.Lock()
+
+
+def get_sbert_model(model_name: str = SBERT_MODEL_NAME) -> SentenceTransformer:
+    """Process-wide SentenceTransformer per model name, loaded on first use."""
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = SentenceTransformer(model_name)
+        return _models[model_name]
+
+
+def embed_texts(texts: List[str], model_name: str = SBERT_MODEL_NAME, batch_size: int = 64) -> np.ndarray:
+    """Unit-normalized float32 embeddings, one row per text; repeated texts are encoded once."""
+    if not texts:
+        return np.zeros((0, get_sbert_model(model_name).get_sentence_embedding_dimension()), dtype=np.float32)
+    unique = list(dict.fromkeys(texts))
+    vectors = get_sbert_model(model_name).encode(
+        unique, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True
+    ).astype(np.float32)
+    position = {text: i for i, text in enumerate(unique)}
+    return vectors[[position[t] for t in texts]]
+
+
+def cosine_top_k(queries: np.ndarray, corpus: np.ndarray, k: int):
+    """(indices, similarities) of the k most similar corpus rows for each query row.
+
+    Both inputs must be unit-normalized, as ``embed_texts`` returns them.
+    """
+    k = min(k, len(corpus))
+    sims = queries @ corpus.T
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
@@ -0,0 +1,185 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from config import (
+    ESTIMATE_BATCH_SIZE,
+    ESTIMATE_BOOTSTRAP_SAMPLES,
+    ESTIMATE_CONFIDENCE,
+    ESTIMATE_MIN_ROWS,
+    ESTIMATE_MIN_STRATUM_ROWS,
+    ESTIMATE_SEED,
+    ESTIMATE_TARGET_HALF_WIDTH,
+)
+from utils.language_utils import detect_language_code
+
+
+def row_strata(df: pd.DataFrame) -> List[str]:
+    """"<Theme>/<language>" per row; datasets without a Theme column stratify by language only."""
+    themes = df["Theme"].fillna("unclassified").astype(str) if "Theme" in df.columns else pd.Series("all", index=df.index)
+    questions = df["Questions"].fillna("").astype(str) if "Questions" in df.columns else pd.Series("", index=df.index)
+    return [f"{theme}/{detect_language_code(q)}" for theme, q in zip(themes, questions)]
+
+
+def stratified_interval(values: Sequence[float], strata: Sequence[str],
+                        population: Optional[Dict[str, int]] = None,
+                        confidence: float = ESTIMATE_CONFIDENCE,
+                        n_boot: int = ESTIMATE_BOOTSTRAP_SAMPLES,
+                        seed: int = ESTIMATE_SEED,
+                        min_stratum_rows: int = ESTIMATE_MIN_STRATUM_ROWS) -> Tuple[float, float, float]:
+    """Stratified mean and percentile bootstrap interval (resampling within each stratum).
+
+    Strata are weighted by their share of ``population`` (stratum -> row count; defaults to
+    the sample itself). A stratum with fewer than ``min_stratum_rows`` values (or fewer than
+    its whole population) would add little or no bootstrap variance, so those strata and
+    any with no values yet are pooled: their combined weight goes to the pooled values, or
+    to the whole sample when the pool is itself too small. NaN values are left out.
+    Returns (mean, low, high), all NaN when there is nothing to estimate from.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    strata = np.asarray(strata, dtype=object)
+    valid = ~np.isnan(values)
+    values, strata = values[valid], strata[valid]
+    if len(values) == 0:
+        return float("nan"), float("nan"), float("nan")
+    counts = dict(pd.Series(strata, dtype=object).value_counts())
+    sizes = population or counts
+    total = sum(sizes.values())
+    groups: List[Tuple[float, np.ndarray]] = []
+    pooled_weight, pooled = 0.0, np.zeros(len(values), dtype=bool)
+    for name, size in sizes.items():
+        weight = size / total if total > 0 else 1.0 / len(sizes)
+        members = strata == name
+        if counts.get(name, 0) >= min(min_stratum_rows, size):
+            groups.append((weight, values[members]))
+        else:
+            pooled_weight += weight
+            pooled |= members
+    if pooled_weight > 0:
+        groups.append((pooled_weight, values[pooled] if pooled.sum() >= min_stratum_rows else values))
+    rng = np.random.default_rng(seed)
+    mean = 0.0
+    boot = np.zeros(n_boot)
+    for weight, members in groups:
+        mean += weight * members.mean()
+        draws = rng.integers(0, len(members), size=(n_boot, len(members)))
+        boot += weight * members[draws].mean(axis=1)
+    tail = (1.0 - confidence) / 2 * 100
+    low, high = np.percentile(boot, [tail, 100 - tail])
+    return float(mean), float(low), float(high)
+
+
+class AdaptiveEstimate:
+    """Judges a stratified random sample batch by batch until the score's CI is narrow enough.
+
+    Rows are ordered so the first ``min_stratum_rows`` of every stratum come first and every
+    later prefix of the order is close to proportional across strata; batches are taken from
+    that order. After each batch the stratified mean and bootstrap interval are updated, and
+    sampling stops once the half-width is at most ``target_half_width``, at least
+    ``min_rows`` rows are scored and every stratum has its first rows scored, or rows run
+    out. Failed rows count with the 0.0 score the full run gives them, so the estimate and a
+    full run agree. The order only depends on ``seed``, so a resumed stage picks the same
+    rows again.
+    """
+
+    def __init__(self, strata: List[str], target_half_width: float = ESTIMATE_TARGET_HALF_WIDTH,
+                 batch_size: int = ESTIMATE_BATCH_SIZE, min_rows: int = ESTIMATE_MIN_ROWS,
+                 confidence: float = ESTIMATE_CONFIDENCE, n_boot: int = ESTIMATE_BOOTSTRAP_SAMPLES,
+                 seed: int = ESTIMATE_SEED, min_stratum_rows: int = ESTIMATE_MIN_STRATUM_ROWS):
+        self.strata = list(strata)
+        self.target_half_width = target_half_width
+        self.batch_size = batch_size
+        self.min_rows = min_rows
+        self.confidence = confidence
+        self.n_boot = n_boot
+        self.seed = seed
+        self.min_stratum_rows = min_stratum_rows
+        self.population = dict(pd.Series(self.strata, dtype=object).value_counts())
+        self.scores = np.full(len(self.strata), np.nan)
+        self.sampled = np.zeros(len(self.strata), dtype=bool)
+        self.interval = (float("nan"), float("nan"), float("nan"))
+
+    def sample_order(self) -> np.ndarray:
+        """Row positions in sampling order: each stratum's first rows, then the rest interleaved
+        proportionally (shuffled within strata)."""
+        rng = np.random.default_rng(self.seed)
+        strata = pd.Series(self.strata, dtype=object)
+        # The k-th (shuffled) of a stratum's N_h rows is due at (k + u) / N_h, so any prefix of
+        # the order holds each stratum in proportion to its size
+        due = np.empty(len(strata))
+        for _, members in sorted(strata.groupby(strata).indices.items()):
+            shuffled = rng.permutation(members)
+            due[shuffled] = (np.arange(len(members)) + rng.random(len(members))) / len(members)
+            # The first rows of every stratum go ahead of the proportional order
+            due[shuffled[:self.min_stratum_rows]] -= 1.0
+        return np.argsort(due, kind="stable")
+
+    def update(self, positions: List[int], scores: List[Optional[float]]) -> None:
+        """Record a judged batch; None scores count as sampled but not scored."""
+        self.sampled[positions] = True
+        self.scores[positions] = [np.nan if s is None else float(s) for s in scores]
+        scored = ~np.isnan(self.scores)
+        self.interval = stratified_interval(
+            self.scores[scored], np.asarray(self.strata, dtype=object)[scored], self.population,
+            self.confidence, self.n_boot, self.seed, self.min_stratum_rows,
+        )
+
+    @property
+    def half_width(self) -> float:
+        _, low, high = self.interval
+        return (high - low) / 2
+
+    def strata_covered(self) -> bool:
+        """Whether every stratum, sampled or not yet, has its first rows scored."""
+        scored = pd.Series(self.strata, dtype=object)[~np.isnan(self.scores)].value_counts()
+        return all(scored.get(name, 0) >= min(self.min_stratum_rows, size)
+                   for name, size in self.population.items())
+
+    def converged(self) -> bool:
+        scored = int((~np.isnan(self.scores)).sum())
+        return (scored >= self.min_rows and self.half_width <= self.target_half_width
+                and self.strata_covered())
+
+    def run(self, process: Callable[[Any], Dict[str, Any]], rows: List[Any], score_column: str,
+            skipped: Callable[[], Dict[str, Any]], max_workers: int) -> List[Dict[str, Any]]:
+        """Apply ``process`` to sampled rows until converged; unsampled rows get ``skipped()``."""
+        outputs: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        order = self.sample_order().tolist()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                results = list(pool.map(process, [rows[i] for i in batch]))
+                for i, result in zip(batch, results):
+                    outputs[i] = result
+                self.update(batch, [r.get(score_column) for r in results])
+                mean, low, high = self.interval
+                print(f"Estimate after {int(self.sampled.sum())}/{len(rows)} rows: "
+                      f"{mean:.3f} [{low:.3f}, {high:.3f}]")
+                if self.converged():
+                    break
+        return [o if o is not None else skipped() for o in outputs]
+
+    def summary(self) -> Dict[str, Any]:
+        mean, low, high = self.interval
+        return {
+            "mean": mean,
+            "ci_low": low,
+            "ci_high": high,
+            "confidence": self.confidence,
+            "n": int((~np.isnan(self.scores)).sum()),
+            "sampled": int(self.sampled.sum()),
+            "population": len(self.strata),
+            "converged": self.converged(),
+        }
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(self.summary(), indent=2))
+
+
+def load_estimate(path: str) -> Optional[Dict[str, Any]]:
+    if not Path(path).exists():
+        return None
+    return json.loads(Path(path).read_text())
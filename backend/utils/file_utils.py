@@ -1,12 +1,118 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import hashlib
 import json
 import os
+import tempfile
+from pathlib import Path
 from typing import Dict, Any, List, Optional
+from config import ARROW_CACHE_DIR
+
+# Explicit Arrow types for the columns the pipeline knows; other columns are inferred once.
+_TEXT_COLUMNS = [
+    "row_id", "Theme", "Questions", "Answer", "Hindi", "Marathi", "References",
+    "User History", "Condition", "Symptoms", "Past Medical History",
+    "Past Surgical History", "Past Social History", "llm_response", "language",
+    "m1_rubrics", "m1_rubric_scores", "m1_classification", "m1_axis_scores",
+    "m2_generated_rubrics", "m2_fixed_rubrics", "m2_all_rubrics",
+    "m2_rubric_scores", "m2_classification", "m2_axis_scores", "m2_generated_classification",
+]
+_SCORE_COLUMNS = [
+    "bleu_score", "meteor_score", "rouge_l_score", "perplexity", "linguistic_quality_score",
+    "sbert_similarity", "cohere_similarity", "voyage_similarity", "openai_similarity",
+    "bert_score_f1", "medical_quality_score", "medical_quality_score_2",
+]
+KNOWN_COLUMN_TYPES: Dict[str, pa.DataType] = {
+    **{col: pa.string() for col in _TEXT_COLUMNS},
+    **{col: pa.float64() for col in _SCORE_COLUMNS},
+}
+
+
+def _arrow_cache_path(file_path: str) -> Path:
+    path = Path(file_path).resolve()
+    digest = hashlib.sha1(str(path).encode("utf-8")).hexdigest()[:16]
+    return Path(ARROW_CACHE_DIR) / f"{path.stem}-{digest}.arrow"
+
+
+def _source_signature(file_path: str) -> Dict[bytes, bytes]:
+    stat = os.stat(file_path)
+    return {
+        b"source_size": str(stat.st_size).encode(),
+        b"source_mtime_ns": str(stat.st_mtime_ns).encode(),
+    }
+
+
+def _read_arrow_cache(cache_path: Path, signature: Dict[bytes, bytes]) -> Optional[pa.Table]:
+    if not cache_path.exists():
+        return None
+    try:
+        with pa.memory_map(str(cache_path), 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+    except Exception as e:
+        print(f"Warning: ignoring unreadable Arrow cache {cache_path}: {e}")
+        return None
+    metadata = table.schema.metadata or {}
+    if any(metadata.get(k) != v for k, v in signature.items()):
+        return None
+    return table
+
+
+def _write_arrow_cache(table: pa.Table, cache_path: Path) -> None:
+    # Uncompressed IPC file so later opens can memory-map it without copying.
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{cache_path.name}.", suffix=".tmp", dir=cache_path.parent)
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_arrow_table(file_path: str) -> pa.Table:
+    """Return the CSV as an Arrow table, memory-mapped from a cached IPC file when fresh.
+
+    The cache lives under ARROW_CACHE_DIR (one file per CSV path) and is rebuilt whenever
+    the CSV's size or mtime changes. Mapped pages are shared between processes.
+    """
+    cache_path = _arrow_cache_path(file_path)
+    signature = _source_signature(file_path)
+    table = _read_arrow_cache(cache_path, signature)
+    if table is not None:
+        return table
+
+    table = pacsv.read_csv(
+        file_path,
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(column_types=KNOWN_COLUMN_TYPES, strings_can_be_null=True),
+    )
+    table = table.replace_schema_metadata(signature)
+    try:
+        _write_arrow_cache(table, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write Arrow cache {cache_path}: {e}")
+    return table
+
+
+def read_csv_cached(file_path: str) -> pd.DataFrame:
+    """Drop-in for ``pd.read_csv`` backed by the memory-mapped Arrow cache.
+
+    Callers mutate the frame they get, so each call converts afresh. Numeric columns are
+    consolidated into pandas-owned blocks; zero-copy columns would point into the read-only
+    mapping. Callers that only need the shape should use ``load_arrow_table``.
+    """
+    return load_arrow_table(file_path).to_pandas()
+
 
 def load_csv_dataset(file_path: str) -> pd.DataFrame:
     """Load CSV dataset with error handling."""
     try:
-        df = pd.read_csv(file_path)
+        df = read_csv_cached(file_path)
         print(f"Loaded dataset with {len(df)} rows and columns: {list(df.columns)}")
         return df
     except FileNotFoundError:
@@ -32,6 +138,29 @@ def save_results_to_json(results: Dict[str, Any], file_path: str) -> bool:
         print(f"Error saving results: {e}")
         return False
 
+def _atomic_write(file_path: str, write) -> None:
+    """Call ``write(f)`` on a temp file in the target directory and rename it into place."""
+    target = Path(file_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_write_csv(df: pd.DataFrame, file_path: str) -> None:
+    """Write CSV to a temp file in the target directory and rename it into place."""
+    _atomic_write(file_path, lambda f: df.to_csv(f, index=False))
+
+def atomic_write_text(text: str, file_path: str) -> None:
+    _atomic_write(file_path, lambda f: f.write(text))
+
 def validate_dataset_format(df: pd.DataFrame, required_columns: List[str]) -> bool:
     """Validate that dataset has required columns."""
     if df.empty:
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+from config import HEDGE_ENABLED, HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE
+
+# Hedged calls run on these threads while the caller waits; losers finish in the
+# background and are bounded by the per-request SDK timeouts.
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LatencyTracker:
+    """Recent call latencies for one endpoint, plus hedged-request wrapping.
+
+    ``call`` runs the primary request; if it is still running after the configured
+    percentile of recent primary latency, a hedge is sent and the first successful
+    result wins. The loser is cancelled if it has not started, otherwise abandoned.
+    Primary latencies are recorded even when the hedge wins, so the primary p99 shows
+    what the tail would have been without hedging.
+    """
+
+    def __init__(self, name: str, window: int = 200, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, enabled: bool = HEDGE_ENABLED):
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.enabled = enabled
+        self._recent = deque(maxlen=window)
+        self._primary = deque(maxlen=10000)
+        self._effective = deque(maxlen=10000)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0}
+
+    def threshold(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        with self._lock:
+            if not self.enabled or len(self._recent) < self.min_samples:
+                return None
+            return _percentile(self._recent, self.percentile)
+
+    def _record_primary(self, latency: float) -> None:
+        with self._lock:
+            self._recent.append(latency)
+            self._primary.append(latency)
+
+    def _record_effective(self, latency: float) -> None:
+        with self._lock:
+            self._effective.append(latency)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _timed_primary(self, fn: Callable[[], Any]) -> Any:
+        start = time.monotonic()
+        result = fn()
+        self._record_primary(time.monotonic() - start)
+        return result
+
+    def call(self, primary: Callable[[], Any], hedge: Optional[Callable[[], Any]] = None) -> Any:
+        """Run ``primary``, hedging with ``hedge`` (default: primary again) if it is slow."""
+        self._count("calls")
+        start = time.monotonic()
+        threshold = self.threshold()
+        if threshold is None:
+            try:
+                return self._timed_primary(primary)
+            finally:
+                self._record_effective(time.monotonic() - start)
+
+        first = _executor.submit(self._timed_primary, primary)
+        pending = {first}
+        done, _ = wait(pending, timeout=threshold)
+        if not done:
+            self._count("hedged")
+            pending.add(_executor.submit(hedge or primary))
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        for other in pending:
+                            other.cancel()
+                        if future is not first:
+                            self._count("hedge_wins")
+                        return future.result()
+                    # Keep the primary's error if both fail; a failed hedge is just ignored
+                    if error is None or future is first:
+                        error = future.exception()
+            raise error
+        finally:
+            self._record_effective(time.monotonic() - start)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            summary: Dict[str, Any] = dict(self.stats)
+            summary["p99_primary_s"] = _percentile(self._primary, 99)
+            summary["p99_effective_s"] = _percentile(self._effective, 99)
+        for key in ("p99_primary_s", "p99_effective_s"):
+            if summary[key] is not None:
+                summary[key] = round(summary[key], 2)
+        return summary
+
+
+_trackers: Dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    """Process-wide tracker per endpoint, e.g. "judge:gemini-2.5-flash"."""
+    with _trackers_lock:
+        if name not in _trackers:
+            _trackers[name] = LatencyTracker(name)
+        return _trackers[name]
+
+
+def hedging_stats() -> Dict[str, Dict[str, Any]]:
+    with _trackers_lock:
+        trackers = dict(_trackers)
+    return {name: tracker.summary() for name, tracker in trackers.items()}
@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+
+class StageJournal:
+    """Append-only JSONL record of finished rows for one pipeline stage.
+
+    Each line is ``{"row_id": ..., "outputs": {...}}`` and is fsynced as soon as the
+    row completes, so a restarted stage can replay it and only process missing rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Return outputs per row_id; later entries win and a torn last line is ignored."""
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not self.path.exists():
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for line_no, line in enumerate(content.split("\n"), start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                entries[entry["row_id"]] = entry["outputs"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                print(f"Warning: skipping unreadable journal line {line_no} in {self.path}")
+        if content and not content.endswith("\n"):
+            # Terminate a line torn by a crash so the next record starts cleanly.
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write("\n")
+        return entries
+
+    def record(self, row_id: str, outputs: Dict[str, Any]) -> None:
+        line = json.dumps({"row_id": row_id, "outputs": outputs}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self) -> None:
+        """Remove the journal once the stage's output has been durably written."""
+        with self._lock:
+            if self.path.exists():
+                self.path.unlink()
@@ -0,0 +1,414 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from openai import OpenAI
+from google import genai
+from google.genai import types
+from config import (
+    JUDGE_MODEL,
+    JUDGE_DEADLINE_SECONDS,
+    JUDGE_INITIAL_CONCURRENCY,
+    JUDGE_MAX_CONCURRENCY,
+    JUDGE_LATENCY_TARGET_SECONDS,
+    HEDGE_FALLBACK_JUDGE_MODEL,
+)
+from utils.hedging import get_latency_tracker
+from utils.rate_limiter import api_key_fingerprint, get_rate_limiter
+from utils.single_flight import get_single_flight, request_key
+from utils.context_cache import get_context_cache
+from utils.token_utils import estimate_tokens, record_usage, reported_cached_tokens, reported_prompt_tokens
+load_dotenv()
+
+
+def is_rate_limit_error(err: Exception) -> bool:
+    """Recognise provider throttling (HTTP 429 / RESOURCE_EXHAUSTED) across SDKs."""
+    for attr in ("status_code", "code", "http_status"):
+        if getattr(err, attr, None) == 429:
+            return True
+    text = str(err)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "rate limit" in text.lower()
+
+
+def to_gemini_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Gemini's response schema is an OpenAPI subset: no additionalProperties, string-only enums."""
+    converted: Dict[str, Any] = {}
+    for key, value in schema.items():
+        if key == "additionalProperties":
+            continue
+        if key == "enum" and schema.get("type") != "string":
+            continue
+        if key == "properties":
+            converted[key] = {name: to_gemini_schema(sub) for name, sub in value.items()}
+        elif key == "items":
+            converted[key] = to_gemini_schema(value)
+        else:
+            converted[key] = value
+    return converted
+
+
+def openai_response_format(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": "judge_response", "schema": schema, "strict": True}}
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on in-flight requests.
+
+    The limit grows by roughly one slot per window of fast successes, shrinks gently when
+    latency exceeds the target, and halves on every throttling response.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 32,
+                 latency_target: float = 20.0, decrease_factor: float = 0.5,
+                 latency_backoff: float = 0.9):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.latency_backoff = latency_backoff
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            elif latency is not None:
+                if latency <= self.latency_target:
+                    self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+                else:
+                    self.limit = max(self.minimum, self.limit * self.latency_backoff)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Stops calling a failing provider for ``reset_timeout`` seconds after repeated failures."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.open_count = 0
+        self._half_open_probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open: let a single probe through until it reports back
+            if self._half_open_probe:
+                return False
+            self._half_open_probe = True
+            return True
+
+    def abort_probe(self) -> None:
+        """Give back a half-open probe slot that was granted but never used."""
+        with self._lock:
+            self._half_open_probe = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._half_open_probe = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._half_open_probe or self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None or self._half_open_probe:
+                    self.open_count += 1
+                self.opened_at = time.monotonic()
+                self._half_open_probe = False
+
+
+class JudgeClient:
+    """Single entry point for judge LLM calls (Gemini or OpenAI, picked from the model name).
+
+    Calls share an adaptive concurrency limit, a per-call deadline covering all retries,
+    jittered exponential backoff and a circuit breaker. ``complete`` returns None on failure.
+    """
+
+    def __init__(self, model: str = JUDGE_MODEL, api_key: Optional[str] = None,
+                 max_retries: int = 4, deadline_s: float = JUDGE_DEADLINE_SECONDS,
+                 initial_concurrency: int = JUDGE_INITIAL_CONCURRENCY,
+                 max_concurrency: int = JUDGE_MAX_CONCURRENCY,
+                 latency_target_s: float = JUDGE_LATENCY_TARGET_SECONDS,
+                 backoff_base_s: float = 2.0, backoff_cap_s: float = 60.0,
+                 hedge_model: Optional[str] = HEDGE_FALLBACK_JUDGE_MODEL):
+        self.model = model
+        self.hedge_model = hedge_model if hedge_model != model else None
+        self.latency = get_latency_tracker(f"judge:{model}")
+        self.max_retries = max_retries
+        self.deadline_s = deadline_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_cap_s = backoff_cap_s
+        model_lower = model.lower()
+        if "gemini" in model_lower:
+            self.provider = "gemini"
+            api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+            self.client = genai.Client(api_key=api_key)
+        elif "gpt" in model_lower or "o1" in model_lower:
+            self.provider = "openai"
+            api_key = api_key or os.getenv("OPENAI_API_KEY")
+            self.client = OpenAI(api_key=api_key)
+        else:
+            raise ValueError(f"Unsupported judge model: {model}")
+        self.key_id = api_key_fingerprint(api_key)
+        self.context_cache = get_context_cache(self.provider, self.client, model)
+        self.rate_limiter = get_rate_limiter()
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_concurrency, maximum=max_concurrency, latency_target=latency_target_s
+        )
+        self.breaker = CircuitBreaker()
+        self._metrics_lock = threading.Lock()
+        self._counters: Dict[str, float] = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "throttled": 0, "throttle_time_s": 0.0, "rate_limit_wait_s": 0.0,
+            "circuit_rejections": 0,
+        }
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._metrics_lock:
+            self._counters[name] += amount
+
+    def metrics(self) -> Dict[str, float]:
+        """Snapshot of call counters plus the current concurrency limit and circuit state."""
+        with self._metrics_lock:
+            snapshot = dict(self._counters)
+        snapshot["in_flight"] = self.limiter.in_flight
+        snapshot["concurrency_limit"] = round(self.limiter.limit, 2)
+        snapshot["circuit_state"] = self.breaker.state
+        snapshot["circuit_opens"] = self.breaker.open_count
+        return snapshot
+
+    def _resolve_prefix(self, prompt: str, prefix: Optional[str]):
+        """(text to send, remote cache handle, cached tokens to report for the local stand-in)"""
+        if not prefix:
+            return prompt, None, None
+        handle = self.context_cache.lookup(self.model, prefix) if self.context_cache else None
+        if handle and self.context_cache.remote:
+            return prompt, handle, None
+        simulated = estimate_tokens(prefix, self.provider) if handle else None
+        return prefix + prompt, None, simulated
+
+    def _request(self, prompt: str, max_tokens: int, temperature: float, timeout: float,
+                 estimated_tokens: int, response_schema: Optional[Dict[str, Any]] = None,
+                 prefix: Optional[str] = None) -> Optional[str]:
+        contents, cache_handle, cached_tokens = self._resolve_prefix(prompt, prefix)
+        if self.provider == "gemini":
+            config_options: Dict[str, Any] = {}
+            if response_schema is not None:
+                config_options["response_mime_type"] = "application/json"
+                config_options["response_schema"] = to_gemini_schema(response_schema)
+            if cache_handle:
+                config_options["cached_content"] = cache_handle
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    max_output_tokens=max_tokens,
+                    temperature=temperature,
+                    # Disable thinking to reduce costs and latency
+                    thinking_config=types.ThinkingConfig(thinking_budget=0),
+                    http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+                    **config_options,
+                )
+            )
+            self._record_usage(estimated_tokens, response, cached_tokens)
+            return response.text.strip() if response and response.text else None
+        extra = {}
+        if response_schema is not None:
+            extra["response_format"] = openai_response_format(response_schema)
+        # OpenAI caches long shared prefixes automatically, so the prefix just goes first
+        response = self.client.with_options(timeout=timeout).chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": contents}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **extra
+        )
+        self._record_usage(estimated_tokens, response, cached_tokens)
+        content = response.choices[0].message.content
+        return content.strip() if content else None
+
+    def _record_usage(self, estimated_tokens: int, response, cached_tokens: Optional[int]) -> None:
+        if cached_tokens is None:
+            cached_tokens = reported_cached_tokens(response)
+        record_usage(self.provider, self.model, estimated_tokens, reported_prompt_tokens(response),
+                     cached=cached_tokens)
+
+    def _hedge_request(self, prompt: str, max_tokens: int, temperature: float, timeout: float,
+                       estimated_tokens: int, response_schema: Optional[Dict[str, Any]] = None,
+                       prefix: Optional[str] = None) -> Optional[str]:
+        """One extra attempt through the same concurrency limiter, breaker and rate budget as
+        primary calls. Raises instead of waiting when any of them has no room right now, which
+        LatencyTracker treats as a failed hedge (the primary keeps running)."""
+        client = get_judge_client(self.hedge_model) if self.hedge_model else self
+        if not client.limiter.acquire(timeout=0):
+            raise RuntimeError(f"No concurrency left to hedge on {client.model}")
+        if not client.breaker.allow():
+            client.limiter.release()
+            raise RuntimeError(f"Judge circuit open for {client.model}, not hedging")
+        try:
+            client.rate_limiter.acquire(client.provider, client.key_id,
+                                        tokens=estimated_tokens + max_tokens, timeout=0)
+        except TimeoutError:
+            client.limiter.release()
+            client.breaker.abort_probe()
+            raise
+        start = time.monotonic()
+        try:
+            text = client._request(prompt, max_tokens, temperature, timeout, estimated_tokens,
+                                   response_schema, prefix)
+        except Exception as e:
+            client.limiter.release(throttled=is_rate_limit_error(e))
+            client.breaker.record_failure()
+            raise
+        client.limiter.release(latency=time.monotonic() - start)
+        if not text:
+            # An empty hedge must not win over a primary that may still answer
+            client.breaker.record_failure()
+            raise RuntimeError(f"Empty hedge response from {client.model}")
+        client.breaker.record_success()
+        return text
+
+    def _backoff(self, attempt: int, remaining: float) -> None:
+        # "Equal jitter": half the exponential step is fixed, half is random
+        step = min(self.backoff_cap_s, self.backoff_base_s * (2 ** attempt))
+        delay = min(step / 2 + random.uniform(0, step / 2), max(remaining, 0.0))
+        if delay > 0:
+            time.sleep(delay)
+
+    def complete(self, prompt: str, max_tokens: int = 800, temperature: float = 0.1,
+                 deadline_s: Optional[float] = None, max_retries: Optional[int] = None,
+                 coalesce: bool = True, response_schema: Optional[Dict[str, Any]] = None,
+                 prefix: Optional[str] = None) -> Optional[str]:
+        """Return the judge's text response, or None once retries or the deadline run out.
+
+        ``response_schema`` (JSON Schema) constrains the output to matching JSON via the
+        provider's structured-output mode. ``prefix`` is static text sent ahead of the
+        prompt; it is served from a provider context cache when one is configured.
+        Identical requests already in flight share one provider call unless ``coalesce``
+        is False (e.g. when deliberately sampling the same prompt more than once).
+        """
+        args = (prompt, max_tokens, temperature, deadline_s, max_retries, response_schema, prefix)
+        if not coalesce:
+            return self._complete(*args)
+        key = request_key(self.model, prefix or "", prompt, max_tokens, temperature, response_schema)
+        return get_single_flight("judge").do(key, lambda: self._complete(*args))
+
+    def _complete(self, prompt: str, max_tokens: int, temperature: float, deadline_s: Optional[float],
+                  max_retries: Optional[int], response_schema: Optional[Dict[str, Any]],
+                  prefix: Optional[str]) -> Optional[str]:
+        self._count("calls")
+        deadline = time.monotonic() + (deadline_s or self.deadline_s)
+        attempts = max_retries or self.max_retries
+        prompt_tokens = estimate_tokens((prefix or "") + prompt, self.provider)
+        for attempt in range(attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.limiter.acquire(timeout=remaining):
+                break
+            if not self.breaker.allow():
+                self.limiter.release()
+                self._count("circuit_rejections")
+                print(f"Judge circuit open for {self.model}, skipping call")
+                break
+            if attempt > 0:
+                self._count("retries")
+            try:
+                # Budget the prompt estimate plus the worst-case completion
+                waited = self.rate_limiter.acquire(
+                    self.provider, self.key_id, tokens=prompt_tokens + max_tokens,
+                    timeout=deadline - time.monotonic()
+                )
+            except TimeoutError as e:
+                self.limiter.release()
+                self.breaker.abort_probe()
+                print(f"LLM call skipped: {e}")
+                break
+            self._count("rate_limit_wait_s", waited)
+            start = time.monotonic()
+            throttled = False
+            try:
+                request_args = (prompt, max_tokens, temperature, max(remaining, 1.0), prompt_tokens,
+                                response_schema, prefix)
+                text = self.latency.call(
+                    lambda: self._request(*request_args),
+                    lambda: self._hedge_request(*request_args),
+                )
+                latency = time.monotonic() - start
+                self.limiter.release(latency=latency)
+                if text:
+                    self.breaker.record_success()
+                    self._count("successes")
+                    return text
+                print(f"Empty response received on attempt {attempt + 1}")
+                self.breaker.record_failure()
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                self.limiter.release(throttled=throttled)
+                self.breaker.record_failure()
+                print(f"LLM call attempt {attempt + 1} failed: {str(e)}")
+            if throttled:
+                self._count("throttled")
+            if attempt < attempts - 1:
+                wait_start = time.monotonic()
+                self._backoff(attempt, deadline - wait_start)
+                if throttled:
+                    self._count("throttle_time_s", time.monotonic() - wait_start)
+        self._count("failures")
+        print(f"LLM call failed for {self.model} after {attempts} attempts or deadline")
+        return None
+
+
+_clients: Dict[str, JudgeClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_judge_client(model: str = JUDGE_MODEL, api_key: Optional[str] = None) -> JudgeClient:
+    """Process-wide client per model, so every caller shares one concurrency budget.
+
+    ``api_key`` only applies to the call that creates the model's client.
+    """
+    with _clients_lock:
+        if model not in _clients:
+            _clients[model] = JudgeClient(model, api_key=api_key)
+        return _clients[model]
+
+
+def all_judge_metrics() -> Dict[str, Dict[str, float]]:
+    """Metrics for every judge client created in this process, keyed by model."""
+    with _clients_lock:
+        clients = dict(_clients)
+    return {model: client.metrics() for model, client in clients.items()}
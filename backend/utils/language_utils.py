@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from langdetect import DetectorFactory, detect_langs
+
+# langdetect is non-deterministic unless the factory is seeded before first use
+DetectorFactory.seed = 0
+
+DEFAULT_LANGUAGE = 'en'
+
+# Unicode blocks for scripts that identify a single supported language outright.
+SCRIPT_RANGES: List[Tuple[int, int, str]] = [
+    (0x0900, 0x097F, 'devanagari'),
+    (0x0980, 0x09FF, 'bengali'),
+    (0x0A00, 0x0A7F, 'gurmukhi'),
+    (0x0A80, 0x0AFF, 'gujarati'),
+    (0x0B00, 0x0B7F, 'oriya'),
+    (0x0B80, 0x0BFF, 'tamil'),
+    (0x0C00, 0x0C7F, 'telugu'),
+    (0x0C80, 0x0CFF, 'kannada'),
+    (0x0D00, 0x0D7F, 'malayalam'),
+    (0x0600, 0x06FF, 'arabic'),
+]
+
+SCRIPT_LANGUAGE = {
+    'bengali': 'bn',
+    'gurmukhi': 'pa',
+    'gujarati': 'gu',
+    'oriya': 'or',
+    'tamil': 'ta',
+    'telugu': 'te',
+    'kannada': 'kn',
+    'malayalam': 'ml',
+    'arabic': 'ur',
+}
+
+# Devanagari is shared by Hindi and Marathi, so the statistical detector decides between them.
+DEVANAGARI_LANGUAGES = ('hi', 'mr')
+
+_cache: Dict[str, str] = {}
+_cache_lock = threading.Lock()
+
+
+def _dominant_script(text: str) -> Optional[str]:
+    """Return the Indic/Arabic script covering most letters in text, if any."""
+    counts: Dict[str, int] = {}
+    latin = 0
+    for ch in text:
+        cp = ord(ch)
+        if cp < 0x0600:
+            if ch.isalpha():
+                latin += 1
+            continue
+        for start, end, script in SCRIPT_RANGES:
+            if start <= cp <= end:
+                counts[script] = counts.get(script, 0) + 1
+                break
+    if not counts:
+        return None
+    script, count = max(counts.items(), key=lambda kv: kv[1])
+    return script if count >= latin else None
+
+
+def _statistical_detect(text: str, allowed: Optional[Tuple[str, ...]] = None) -> Optional[str]:
+    try:
+        candidates = detect_langs(text)
+    except Exception:
+        return None
+    for candidate in candidates:
+        if allowed is None or candidate.lang in allowed:
+            return candidate.lang
+    return None
+
+
+def detect_language_code(text: str, default: str = DEFAULT_LANGUAGE) -> str:
+    """Detect an ISO 639-1 language code, using the script first and a seeded detector second.
+
+    Results are memoized by text hash so every pipeline stage agrees on the same answer.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return default
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    script = _dominant_script(text)
+    if script == 'devanagari':
+        code = _statistical_detect(text, DEVANAGARI_LANGUAGES) or 'hi'
+    elif script is not None:
+        code = SCRIPT_LANGUAGE[script]
+    else:
+        code = _statistical_detect(text) or default
+
+    with _cache_lock:
+        _cache[key] = code
+    return code
+
+
+def clear_language_cache() -> None:
+    """Drop all memoized detections."""
+    with _cache_lock:
+        _cache.clear()
@@ -1,43 +1,14 @@
-import openai
 import time
 from typing import Optional, List
-from config import OPENAI_API_KEY, JUDGE_MODEL, MAX_TOKENS, TEMPERATURE, ANSWER_GENERATION_PROMPT
-
-# Initialize OpenAI client
-openai.api_key = OPENAI_API_KEY
+from config import JUDGE_MODEL, MAX_TOKENS, TEMPERATURE, ANSWER_GENERATION_PROMPT
+from utils.judge_client import get_judge_client
 
 def call_judge_model(prompt: str, max_tokens: int = MAX_TOKENS, 
                temperature: float = TEMPERATURE, max_retries: int = 3) -> Optional[str]:
-    """Make API call to GPT-3.5 with retry logic."""
-    
-    for attempt in range(max_retries):
-        try:
-            response = openai.chat.completions.create(
-                model=JUDGE_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-            
-            return response.choices[0].message.content.strip()
-        
-        except openai.RateLimitError:
-            wait_time = (2 ** attempt) * 5  # Exponential backoff
-            print(f"Rate limit hit, waiting {wait_time} seconds...")
-            time.sleep(wait_time)
-        
-        except openai.APIError as e:
-            print(f"API error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-        
-        except Exception as e:
-            print(f"Unexpected error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-    
-    print(f"Failed to get response after {max_retries} attempts")
-    return None
+    """Make a judge call through the shared client (backoff, throttling and circuit breaking)."""
+    return get_judge_client(JUDGE_MODEL).complete(
+        prompt, max_tokens=max_tokens, temperature=temperature, max_retries=max_retries
+    )
 
 def generate_model_answer(question: str) -> str:
     """Generate model answer for a given question using GPT-3.5."""
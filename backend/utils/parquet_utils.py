@@ -0,0 +1,196 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.file_utils import atomic_write_csv
+from utils.rubric_store import INTERNED_COLUMN_TYPES, RubricDictionary
+
+# Schema metadata key naming the rubric dictionary file that interned columns point into
+RUBRIC_DICTIONARY_KEY = b"rubric_dictionary"
+
+# Rubric detail columns stored as JSON strings in the CSV output, with their native Arrow types.
+NESTED_COLUMN_TYPES: Dict[str, pa.DataType] = {
+    "m1_rubrics": pa.list_(pa.string()),
+    "m1_rubric_scores": pa.map_(pa.string(), pa.int8()),
+    "m1_classification": pa.map_(pa.string(), pa.list_(pa.string())),
+    "m1_axis_scores": pa.map_(pa.string(), pa.float64()),
+    "m2_generated_rubrics": pa.list_(pa.string()),
+    "m2_fixed_rubrics": pa.map_(pa.string(), pa.list_(pa.string())),
+    "m2_all_rubrics": pa.list_(pa.string()),
+    "m2_rubric_scores": pa.map_(pa.string(), pa.int8()),
+    "m2_classification": pa.map_(pa.string(), pa.list_(pa.string())),
+    "m2_axis_scores": pa.map_(pa.string(), pa.float64()),
+    "m2_generated_classification": pa.map_(pa.string(), pa.list_(pa.string())),
+}
+
+
+def _decode_json_cell(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if not isinstance(value, str):
+        return value
+    if not value.strip():
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        print(f"Warning: could not decode JSON cell: {value[:50]}...")
+        return None
+
+
+def _to_arrow_value(obj: Any, arrow_type: pa.DataType) -> Any:
+    """Shape a decoded JSON value so pyarrow accepts it for the given type."""
+    if obj is None:
+        return None
+    if pa.types.is_map(arrow_type):
+        if not isinstance(obj, dict):
+            return None
+        item_type = arrow_type.item_type
+        items = []
+        for k, v in obj.items():
+            if pa.types.is_integer(item_type):
+                v = None if v is None else int(v)
+            elif pa.types.is_floating(item_type):
+                v = None if v is None else float(v)
+            elif pa.types.is_list(item_type):
+                v = [str(x) for x in v] if isinstance(v, list) else []
+            items.append((str(k), v))
+        return items
+    if pa.types.is_list(arrow_type):
+        return [str(x) for x in obj] if isinstance(obj, list) else None
+    return obj
+
+
+def _from_arrow_value(value: Any, arrow_type: pa.DataType) -> Any:
+    """Turn a ``to_pylist`` nested value back into the JSON shape (lists and dicts)."""
+    if value is None:
+        return None
+    if pa.types.is_map(arrow_type):
+        return dict(value)
+    return value
+
+
+def scored_frame_to_table(df: pd.DataFrame, dictionary: Optional[RubricDictionary] = None) -> pa.Table:
+    """Convert a scored dataframe to Arrow, decoding JSON rubric columns into nested types.
+
+    With a ``dictionary``, rubric text columns are stored as IDs into it (see rubric_store).
+    """
+    arrays, fields = [], []
+    for col in df.columns:
+        if dictionary is not None and col in INTERNED_COLUMN_TYPES:
+            array = dictionary.encode_column(col, [_decode_json_cell(v) for v in df[col]])
+        elif col in NESTED_COLUMN_TYPES:
+            arrow_type = NESTED_COLUMN_TYPES[col]
+            values = [_to_arrow_value(_decode_json_cell(v), arrow_type) for v in df[col]]
+            array = pa.array(values, type=arrow_type)
+        else:
+            array = pa.Array.from_pandas(df[col])
+        arrays.append(array)
+        fields.append(pa.field(str(col), array.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _atomic_write_table(table: pa.Table, target: Path) -> None:
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{target.name}.", suffix=".tmp", dir=target.parent)
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_scored_dataset(df: pd.DataFrame, parquet_path: str, csv_path: Optional[str] = None,
+                        intern_rubrics: bool = True) -> None:
+    """Atomically write the scored dataset as Parquet, and optionally as the legacy CSV.
+
+    Rubric columns are interned: the texts go to a dictionary file next to the dataset
+    (``<name>.rubrics-<digest>.parquet``, written first and named in the dataset's schema
+    metadata), and rows keep rubric IDs and packed score bits.
+    """
+    target = Path(parquet_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    dictionary = RubricDictionary() if intern_rubrics else None
+    table = scored_frame_to_table(df, dictionary)
+    sidecar = None
+    if dictionary is not None and any(col in INTERNED_COLUMN_TYPES for col in table.column_names):
+        sidecar = target.with_name(f"{target.stem}.rubrics-{dictionary.digest()}.parquet")
+        _atomic_write_table(dictionary.to_table(), sidecar)
+        metadata = dict(table.schema.metadata or {})
+        metadata[RUBRIC_DICTIONARY_KEY] = sidecar.name.encode()
+        table = table.replace_schema_metadata(metadata)
+    _atomic_write_table(table, target)
+    for stale in target.parent.glob(f"{target.stem}.rubrics-*.parquet"):
+        if stale != sidecar:
+            stale.unlink()
+    print(f"Scored dataset saved to: {target}")
+    if csv_path:
+        atomic_write_csv(df, csv_path)
+
+
+def load_rubric_dictionary(parquet_path: str) -> Optional[RubricDictionary]:
+    """The rubric dictionary a scored dataset's interned columns refer to, if any."""
+    metadata = pq.read_schema(parquet_path).metadata or {}
+    name = metadata.get(RUBRIC_DICTIONARY_KEY)
+    if not name:
+        return None
+    return RubricDictionary.from_table(pq.read_table(Path(parquet_path).with_name(name.decode())))
+
+
+def load_scored_dataset(parquet_path: str, columns: Optional[List[str]] = None,
+                        decode_nested: bool = True, interned: bool = False) -> pd.DataFrame:
+    """Load only the requested columns; nested rubric data is never read unless asked for.
+
+    Requested columns missing from the file are ignored. With ``decode_nested`` the
+    rubric columns come back as Python lists/dicts instead of Arrow map entries. With
+    ``interned`` they stay as rubric IDs and packed scores; ``decode_rubric_column``
+    turns one into the JSON shape when it is needed.
+    """
+    if columns is not None:
+        available = set(pq.read_schema(parquet_path).names)
+        columns = [c for c in columns if c in available]
+    table = pq.read_table(parquet_path, columns=columns)
+    if not decode_nested:
+        return table.to_pandas()
+    nested = [c for c in table.column_names if c in NESTED_COLUMN_TYPES]
+    df = table.drop_columns(nested).to_pandas()
+    dictionary = None
+    for col in nested:
+        column = table.column(col)
+        if column.type == INTERNED_COLUMN_TYPES.get(col):
+            dictionary = dictionary or load_rubric_dictionary(parquet_path)
+            if interned:
+                df[col] = column.to_pandas()
+            else:
+                df[col] = dictionary.decode_column(col, column.to_pylist())
+        else:
+            arrow_type = NESTED_COLUMN_TYPES[col]
+            df[col] = [_from_arrow_value(v, arrow_type) for v in column.to_pylist()]
+    df = df[table.column_names]
+    if interned and dictionary is not None:
+        df.attrs["rubric_dictionary"] = dictionary
+    return df
+
+
+def decode_rubric_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """JSON-shaped values for a rubric column of a frame loaded with ``interned=True``."""
+    dictionary = df.attrs.get("rubric_dictionary")
+    if dictionary is None or col not in INTERNED_COLUMN_TYPES:
+        return df[col]
+    return pd.Series(dictionary.decode_column(col, list(df[col])), index=df.index, name=col)
+
+
+def export_csv(parquet_path: str, csv_path: str) -> None:
+    """Re-create the legacy CSV, with rubric columns serialized back to JSON strings."""
+    df = load_scored_dataset(parquet_path)
+    for col in df.columns:
+        if col in NESTED_COLUMN_TYPES:
+            df[col] = [None if v is None else json.dumps(v) for v in df[col]]
+    atomic_write_csv(df, csv_path)
+    print(f"CSV exported to: {csv_path}")
@@ -0,0 +1,80 @@
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+import pandas as pd
+from utils.file_utils import atomic_write_csv
+
+ROW_ID_COLUMN = "row_id"
+
+
+def _row_key(values: list) -> str:
+    parts = ["" if pd.isna(v) else str(v).strip() for v in values]
+    # Prefixed so that CSV readers never infer the column as numeric.
+    return "r" + hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def compute_row_ids(df: pd.DataFrame, key_columns: Optional[List[str]] = None) -> pd.Series:
+    """Derive a stable ID per row from its input content.
+
+    Identical rows get an occurrence suffix (``r<hash>-1``, ``r<hash>-2``...) so IDs stay unique.
+    """
+    columns = key_columns or [c for c in df.columns if c != ROW_ID_COLUMN]
+    base_ids = [_row_key(list(values)) for values in df[columns].itertuples(index=False, name=None)]
+    seen = {}
+    row_ids = []
+    for base in base_ids:
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        row_ids.append(base if n == 0 else f"{base}-{n}")
+    return pd.Series(row_ids, index=df.index, name=ROW_ID_COLUMN)
+
+
+def assign_row_ids(df: pd.DataFrame, key_columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Add a ``row_id`` column as the first column if the frame does not have one yet."""
+    if ROW_ID_COLUMN not in df.columns:
+        df.insert(0, ROW_ID_COLUMN, compute_row_ids(df, key_columns))
+    return df
+
+
+def partition_path(partition_dir: str, stage: str) -> Path:
+    return Path(partition_dir) / f"{stage}.csv"
+
+
+def partition_exists(partition_dir: str, stage: str) -> bool:
+    return partition_path(partition_dir, stage).exists()
+
+
+def write_partition(df: pd.DataFrame, partition_dir: str, stage: str, columns: List[str]) -> Path:
+    """Atomically write only ``row_id`` plus the stage's own columns."""
+    if ROW_ID_COLUMN not in df.columns:
+        raise ValueError(f"Cannot write partition '{stage}': dataframe has no '{ROW_ID_COLUMN}' column")
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Cannot write partition '{stage}': missing columns {missing}")
+    path = partition_path(partition_dir, stage)
+    atomic_write_csv(df[[ROW_ID_COLUMN] + columns], str(path))
+    print(f"Partition '{stage}' saved to: {path}")
+    return path
+
+
+def read_partition(partition_dir: str, stage: str) -> pd.DataFrame:
+    return pd.read_csv(partition_path(partition_dir, stage), dtype={ROW_ID_COLUMN: str})
+
+
+def assemble_partitions(base_df: pd.DataFrame, partition_dir: str, stages: List[str]) -> pd.DataFrame:
+    """Left-join every available stage partition onto the base rows by ``row_id``.
+
+    Columns already present in the base frame are replaced by the partition's version,
+    so re-running a single stage and re-assembling never leaves stale values behind.
+    """
+    if ROW_ID_COLUMN not in base_df.columns:
+        raise ValueError(f"Base dataframe has no '{ROW_ID_COLUMN}' column")
+    result = base_df.set_index(ROW_ID_COLUMN)
+    for stage in stages:
+        if not partition_exists(partition_dir, stage):
+            print(f"Warning: partition '{stage}' not found in {partition_dir}, skipping")
+            continue
+        part = read_partition(partition_dir, stage).set_index(ROW_ID_COLUMN)
+        result = result.drop(columns=[c for c in part.columns if c in result.columns])
+        result = result.join(part, how="left")
+    return result.reset_index()
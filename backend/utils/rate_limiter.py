@@ -0,0 +1,130 @@
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from config import RATE_LIMIT_DB_PATH, RATE_LIMIT_HEADROOM, RATE_LIMITS
+
+
+def api_key_fingerprint(api_key: Optional[str]) -> str:
+    """Short stable ID for an API key so budgets are per key without storing the secret."""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class SharedRateLimiter:
+    """Host-wide token buckets kept in SQLite, shared by every pipeline process.
+
+    Each (provider, API key) pair has two buckets: requests per minute and tokens per
+    minute. ``acquire`` takes from both atomically under an IMMEDIATE transaction, so
+    concurrent processes drawing on the same key together stay just under the quota.
+    """
+
+    def __init__(self, db_path: str = RATE_LIMIT_DB_PATH,
+                 limits: Optional[Dict[str, Dict[str, int]]] = None,
+                 headroom: float = RATE_LIMIT_HEADROOM):
+        self.db_path = db_path
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.headroom = headroom
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _bucket_specs(self, provider: str, key_id: str) -> Dict[str, Tuple[float, float]]:
+        """Bucket name -> (capacity, refill per second) for the provider's configured limits."""
+        limits = self.limits.get(provider, {})
+        specs = {}
+        for unit in ("rpm", "tpm"):
+            per_minute = limits.get(unit)
+            if per_minute:
+                capacity = per_minute * self.headroom
+                specs[f"{provider}:{key_id}:{unit}"] = (capacity, capacity / 60.0)
+        return specs
+
+    def acquire(self, provider: str, key_id: str = "default", requests: int = 1,
+                tokens: int = 0, timeout: Optional[float] = None) -> float:
+        """Block until both budgets allow the call; returns seconds spent waiting.
+
+        Providers without configured limits pass straight through. Raises TimeoutError
+        if ``timeout`` elapses first.
+        """
+        specs = self._bucket_specs(provider, key_id)
+        if not specs:
+            return 0.0
+        wanted = {}
+        for name, (capacity, _) in specs.items():
+            amount = requests if name.endswith(":rpm") else tokens
+            # Never ask for more than a full bucket, or the call could never proceed
+            wanted[name] = min(float(amount), capacity)
+
+        start = time.monotonic()
+        conn = self._conn()
+        while True:
+            wait = self._try_take(conn, specs, wanted)
+            if wait <= 0:
+                return time.monotonic() - start
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise TimeoutError(f"Rate limit wait for {provider} exceeded {timeout}s")
+            # Jitter avoids every waiting process retrying the transaction at the same instant
+            time.sleep(min(wait, 5.0) + random.uniform(0, 0.05))
+
+    def _try_take(self, conn: sqlite3.Connection, specs: Dict[str, Tuple[float, float]],
+                  wanted: Dict[str, float]) -> float:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = {}
+            for name, (capacity, rate) in specs.items():
+                row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    levels[name] = capacity
+                else:
+                    level, updated = row
+                    levels[name] = min(capacity, level + max(0.0, now - updated) * rate)
+            wait = max(
+                (wanted[name] - levels[name]) / specs[name][1]
+                for name in specs
+            )
+            if wait <= 0:
+                for name in specs:
+                    levels[name] -= wanted[name]
+            for name, level in levels.items():
+                conn.execute(
+                    "INSERT INTO buckets (name, level, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated = excluded.updated",
+                    (name, level, now),
+                )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+_limiter: Optional[SharedRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> SharedRateLimiter:
+    """Process-wide limiter backed by the host-wide SQLite database."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = SharedRateLimiter()
+        return _limiter
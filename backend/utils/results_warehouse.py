@@ -0,0 +1,520 @@
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+from config import RESULTS_WAREHOUSE_ENABLED, RESULTS_WAREHOUSE_PATH
+from utils.file_utils import KNOWN_COLUMN_TYPES, atomic_write_csv, read_csv_cached
+from utils.parquet_utils import NESTED_COLUMN_TYPES, load_scored_dataset
+from utils.partition_utils import ROW_ID_COLUMN, compute_row_ids
+
+# Per evaluator, the rubric columns it writes: the rubric list (if any; otherwise the keys of
+# the score map), the rubric -> score map and where rubrics sit on the axes, either as a
+# classification (axis -> rubrics) or with a score per placement (axis -> rubric -> score).
+EVALUATOR_COLUMNS = {
+    "m1": {"rubrics": "m1_rubrics", "scores": "m1_rubric_scores", "classification": "m1_classification"},
+    "m2": {"rubrics": "m2_all_rubrics", "scores": "m2_rubric_scores", "classification": "m2_classification"},
+    # medical_3/<model>/scored_dataset_detailed.csv
+    "m3": {"scores": "all_rubric_scores_flat", "axis_scores": "rubric_scores_by_axis"},
+}
+# Rubric column -> evaluator whose rubric list its texts are stored as positions into
+COLUMN_EVALUATOR = {
+    **{c: c.split("_", 1)[0] for c in NESTED_COLUMN_TYPES if c.split("_", 1)[0] in EVALUATOR_COLUMNS},
+    **{c: e for e, spec in EVALUATOR_COLUMNS.items() for c in spec.values()},
+}
+# Axis -> score maps, stored as one metric per axis ("m1_axis_scores.Accuracy")
+AXIS_SCORE_COLUMNS = ["m1_axis_scores", "m2_axis_scores"]
+AXIS_METRIC_SEPARATOR = "."
+RUBRIC_COLUMNS = set(NESTED_COLUMN_TYPES) | set(COLUMN_EVALUATOR)
+# Question text is kept in its own column of the rows table
+QUESTION_COLUMNS = ["Questions", "question"]
+# rubric_scores.axis of the evaluator's own per-rubric score (one row per listed rubric)
+OVERALL_AXIS = ""
+# medical_3/<model>/ result files (without .csv) per warehouse dataset
+MEDICAL_3_FILES = {"medical_3": "scored_dataset_updated", "medical_3_detailed": "scored_dataset_detailed"}
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS runs ("
+    "dataset TEXT NOT NULL, model TEXT NOT NULL, columns TEXT NOT NULL, "
+    "integer_columns TEXT NOT NULL DEFAULT '[]', updated REAL NOT NULL, PRIMARY KEY (dataset, model))",
+    "CREATE TABLE IF NOT EXISTS rows ("
+    "dataset TEXT NOT NULL, model TEXT NOT NULL, row_id TEXT NOT NULL, position INTEGER, "
+    "question TEXT, fields TEXT NOT NULL DEFAULT '{}', PRIMARY KEY (dataset, model, row_id))",
+    "CREATE TABLE IF NOT EXISTS metrics ("
+    "dataset TEXT NOT NULL, model TEXT NOT NULL, row_id TEXT NOT NULL, metric TEXT NOT NULL, value REAL, "
+    "PRIMARY KEY (dataset, metric, row_id, model))",
+    "CREATE INDEX IF NOT EXISTS metrics_by_run ON metrics (dataset, model, row_id)",
+    "CREATE TABLE IF NOT EXISTS rubrics (rubric_id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE)",
+    # One row per (rubric, axis) placement with its own score, plus one OVERALL_AXIS row per
+    # listed rubric; position is the rubric's place in the evaluator's rubric list
+    "CREATE TABLE IF NOT EXISTS rubric_scores ("
+    "dataset TEXT NOT NULL, model TEXT NOT NULL, row_id TEXT NOT NULL, evaluator TEXT NOT NULL, "
+    "position INTEGER NOT NULL, axis TEXT NOT NULL, rubric_id INTEGER NOT NULL REFERENCES rubrics, score NUMERIC, "
+    "PRIMARY KEY (dataset, model, row_id, evaluator, position, axis))",
+    "CREATE INDEX IF NOT EXISTS rubric_scores_by_axis ON rubric_scores (dataset, evaluator, axis, rubric_id)",
+    "CREATE INDEX IF NOT EXISTS rubric_scores_by_rubric ON rubric_scores (rubric_id)",
+    # Layout of the rubric and axis-score JSON columns (axis order, empty axes, missing
+    # values), with rubric text replaced by positions in the evaluator's list
+    "CREATE TABLE IF NOT EXISTS details ("
+    "dataset TEXT NOT NULL, model TEXT NOT NULL, row_id TEXT NOT NULL, column_name TEXT NOT NULL, "
+    "value TEXT, PRIMARY KEY (dataset, model, row_id, column_name))",
+]
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return None
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and pd.isna(value))
+
+
+def _score(value: Any) -> Any:
+    if _is_missing(value) or isinstance(value, (dict, list, str)):
+        return None
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _is_metric(df: pd.DataFrame, column: str) -> bool:
+    known = KNOWN_COLUMN_TYPES.get(column)
+    if known is not None:
+        return known == pa.float64()
+    return column not in RUBRIC_COLUMNS and pd.api.types.is_numeric_dtype(df[column])
+
+
+def _to_positions(value: Any, index: Dict[str, int]) -> Any:
+    """Replace rubric texts by their position in the evaluator's rubric list."""
+    if isinstance(value, list):
+        return [index.get(v, v) if isinstance(v, str) else v for v in value]
+    if isinstance(value, dict):
+        return {k: _to_positions(v, index) for k, v in value.items()}
+    return value
+
+
+def _from_positions(value: Any, texts: Dict[int, str]) -> Any:
+    if isinstance(value, list):
+        return [texts.get(v, v) if isinstance(v, int) else v for v in value]
+    if isinstance(value, dict):
+        return {k: _from_positions(v, texts) for k, v in value.items()}
+    return value
+
+
+def _rubric_positions(evaluator: str, decoded: Dict[str, Any]) -> Tuple[List[str], Dict[str, int]]:
+    """One row's rubric list for the evaluator, and a position for every rubric text it uses.
+
+    Texts that only appear in other columns (e.g. a placement outside the list) are
+    numbered after the list.
+    """
+    spec = EVALUATOR_COLUMNS[evaluator]
+    listed = decoded.get(spec.get("rubrics", spec["scores"]))
+    listed = [t for t in listed or [] if isinstance(t, str)]
+    index: Dict[str, int] = {}
+    for i, text in enumerate(listed):
+        index.setdefault(text, i)
+    for column, value in decoded.items():
+        if COLUMN_EVALUATOR.get(column) != evaluator:
+            continue
+        for texts in (value.values() if isinstance(value, dict) else [value]):
+            for text in texts if isinstance(texts, (list, dict)) else []:
+                if isinstance(text, str) and text not in index:
+                    index[text] = len(listed) + len(index) - len(set(listed))
+    return listed, index
+
+
+class ResultsWarehouse:
+    """SQLite warehouse of every scored row across datasets and models.
+
+    Rows, numeric metrics (including per-axis scores), interned rubrics and per-rubric
+    judge scores are keyed by (dataset, model, row_id) and indexed for cross-model lookups.
+    Each ``write_frame`` call is one transaction, and ``export_run`` rebuilds the
+    scored_final_dataset.csv layout the frontend reads.
+    """
+
+    def __init__(self, db_path: str = RESULTS_WAREHOUSE_PATH):
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _rubric_ids(self, conn: sqlite3.Connection, texts: List[str]) -> Dict[str, int]:
+        unique = list(dict.fromkeys(texts))
+        conn.executemany("INSERT OR IGNORE INTO rubrics (text) VALUES (?)", [(t,) for t in unique])
+        ids = {}
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = conn.execute(
+                f"SELECT text, rubric_id FROM rubrics WHERE text IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            ids.update(rows)
+        return ids
+
+    def _layout(self, dataset: str, model: str) -> Tuple[List[str], List[str]]:
+        """(column order, integer metric columns) of a run."""
+        row = self._conn().execute(
+            "SELECT columns, integer_columns FROM runs WHERE dataset = ? AND model = ?", (dataset, model)
+        ).fetchone()
+        return (json.loads(row[0]), json.loads(row[1])) if row else ([], [])
+
+    def columns(self, dataset: str, model: str) -> List[str]:
+        return self._layout(dataset, model)[0]
+
+    def runs(self) -> List[Tuple[str, str]]:
+        return self._conn().execute("SELECT dataset, model FROM runs ORDER BY dataset, model").fetchall()
+
+    def has_columns(self, dataset: str, model: str, columns: List[str]) -> bool:
+        known = set(self.columns(dataset, model))
+        return all(c in known for c in columns)
+
+    def write_frame(self, dataset: str, model: str, df: pd.DataFrame,
+                    columns: Optional[List[str]] = None) -> int:
+        """Upsert ``columns`` (default: all) of every row of ``df`` in one transaction.
+
+        ``df`` needs a row_id column. Values already stored for other columns are kept.
+        Returns the number of rows written.
+        """
+        if ROW_ID_COLUMN not in df.columns:
+            raise ValueError(f"Cannot write to the warehouse: dataframe has no '{ROW_ID_COLUMN}' column")
+        columns = [c for c in (columns or list(df.columns)) if c in df.columns and c != ROW_ID_COLUMN]
+        axis_cols = [c for c in columns if c in AXIS_SCORE_COLUMNS]
+        rubric_cols = [c for c in columns if c in RUBRIC_COLUMNS and c not in axis_cols]
+        metric_cols = [c for c in columns if c not in axis_cols + rubric_cols and _is_metric(df, c)]
+        field_cols = [c for c in columns if c not in metric_cols + axis_cols + rubric_cols]
+        integer_cols = [c for c in metric_cols if pd.api.types.is_integer_dtype(df[c])]
+        evaluators = list(dict.fromkeys(COLUMN_EVALUATOR[c] for c in rubric_cols if c in COLUMN_EVALUATOR))
+
+        rows, metrics, placements, details, texts = [], [], [], [], []
+        for position, record in enumerate(df[[ROW_ID_COLUMN] + columns].to_dict("records")):
+            row_id = record[ROW_ID_COLUMN]
+            fields = {c: None if _is_missing(record[c]) else str(record[c]) for c in field_cols}
+            question = next((fields.pop(c) for c in QUESTION_COLUMNS if c in fields), None)
+            rows.append((dataset, model, row_id, position, question, json.dumps(fields, ensure_ascii=False)))
+            for c in metric_cols:
+                value = pd.to_numeric(record[c], errors="coerce")
+                metrics.append((dataset, model, row_id, c, None if pd.isna(value) else float(value)))
+            for c in axis_cols:
+                axis_scores = _decode(record[c])
+                # The axis order (or a missing value) goes to details, the scores to metrics
+                layout = list(axis_scores) if isinstance(axis_scores, dict) else None
+                details.append((dataset, model, row_id, c, json.dumps(layout, ensure_ascii=False)))
+                for axis, value in (axis_scores or {}).items() if layout is not None else []:
+                    metrics.append((dataset, model, row_id, f"{c}{AXIS_METRIC_SEPARATOR}{axis}", _score(value)))
+            decoded = {c: _decode(record[c]) for c in rubric_cols}
+            for evaluator in evaluators:
+                spec = EVALUATOR_COLUMNS[evaluator]
+                listed, index = _rubric_positions(evaluator, decoded)
+                texts.extend(index)
+                scores = decoded.get(spec["scores"])
+                scores = scores if isinstance(scores, dict) else {}
+                placements.extend(
+                    (row_id, evaluator, i, OVERALL_AXIS, text, _score(scores.get(text)))
+                    for i, text in enumerate(listed)
+                )
+                if spec.get("classification") in decoded:
+                    for axis, placed in (decoded[spec["classification"]] or {}).items():
+                        placements.extend((row_id, evaluator, index[text], axis, text, _score(scores.get(text)))
+                                          for text in placed or [] if isinstance(text, str))
+                if spec.get("axis_scores") in decoded:
+                    for axis, placed in (decoded[spec["axis_scores"]] or {}).items():
+                        placements.extend((row_id, evaluator, index[text], axis, text, _score(score))
+                                          for text, score in (placed or {}).items())
+                for c in rubric_cols:
+                    if COLUMN_EVALUATOR.get(c) != evaluator:
+                        continue
+                    if c in (spec.get("rubrics"), spec["scores"]):
+                        # Rebuilt from rubric_scores; only a missing value needs recording
+                        layout = None if decoded[c] is None else "rubric_scores"
+                    elif c == spec.get("axis_scores"):
+                        layout = None if decoded[c] is None else {
+                            axis: [index[text] for text in placed or {}] for axis, placed in decoded[c].items()
+                        }
+                    else:
+                        layout = _to_positions(decoded[c], index)
+                    details.append((dataset, model, row_id, c, json.dumps(layout, ensure_ascii=False)))
+            for c in rubric_cols:
+                if c not in COLUMN_EVALUATOR:
+                    details.append((dataset, model, row_id, c, json.dumps(decoded[c], ensure_ascii=False)))
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rubric_ids = self._rubric_ids(conn, texts)
+            conn.executemany(
+                "INSERT INTO rows (dataset, model, row_id, position, question, fields) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (dataset, model, row_id) DO UPDATE SET "
+                "position = COALESCE(rows.position, excluded.position), "
+                "question = COALESCE(excluded.question, rows.question), "
+                "fields = json_patch(rows.fields, excluded.fields)",
+                rows,
+            )
+            row_keys = [(dataset, model, r[2]) for r in rows]
+            for c in axis_cols:
+                # Replace the whole axis map so axes dropped since the last write do not linger
+                conn.executemany(
+                    "DELETE FROM metrics WHERE dataset = ? AND model = ? AND row_id = ? AND metric LIKE ?",
+                    [key + (f"{c}{AXIS_METRIC_SEPARATOR}%",) for key in row_keys],
+                )
+            conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)", metrics)
+            for evaluator in evaluators:
+                conn.executemany(
+                    "DELETE FROM rubric_scores WHERE dataset = ? AND model = ? AND row_id = ? AND evaluator = ?",
+                    [key + (evaluator,) for key in row_keys],
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO rubric_scores VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(dataset, model, row_id, evaluator, i, axis, rubric_ids[text], score)
+                 for row_id, evaluator, i, axis, text, score in placements],
+            )
+            conn.executemany("INSERT OR REPLACE INTO details VALUES (?, ?, ?, ?, ?)", details)
+            known, known_integers = self._layout(dataset, model)
+            merged = known + [c for c in [ROW_ID_COLUMN] + columns if c not in known]
+            integers = [c for c in known_integers if c not in metric_cols] + integer_cols
+            conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                         (dataset, model, json.dumps(merged), json.dumps(integers), time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def import_run_dir(self, run_dir: str, dataset: Optional[str] = None, model: Optional[str] = None,
+                       file_name: str = "scored_final_dataset") -> int:
+        """Load a <dataset>/<model> output directory (Parquet if present, else CSV)."""
+        run_path = Path(run_dir)
+        parquet_path = run_path / f"{file_name}.parquet"
+        csv_path = run_path / f"{file_name}.csv"
+        if parquet_path.exists():
+            df = load_scored_dataset(str(parquet_path))
+        elif csv_path.exists():
+            df = read_csv_cached(str(csv_path))
+        else:
+            return 0
+        if ROW_ID_COLUMN not in df.columns:
+            df.insert(0, ROW_ID_COLUMN, input_row_ids(df))
+        return self.write_frame(dataset or run_path.parent.name, model or run_path.name, df)
+
+    def import_all(self, datasets_root: str) -> Dict[str, int]:
+        """Import every <dataset>/<model> directory under the root."""
+        written = {}
+        for run_dir in sorted(p for p in Path(datasets_root).glob("*/*") if p.is_dir()):
+            count = self.import_run_dir(str(run_dir))
+            if count:
+                written[f"{run_dir.parent.name}/{run_dir.name}"] = count
+        return written
+
+    def import_medical_3(self, results_dir: str) -> Dict[str, int]:
+        """Import medical_3/<model>/ results as datasets "medical_3" and "medical_3_detailed".
+
+        Detailed rows take the row IDs of the updated file's rows at the same position.
+        """
+        written = {}
+        for model_dir in sorted(p for p in Path(results_dir).iterdir() if p.is_dir()):
+            updated_path = model_dir / f"{MEDICAL_3_FILES['medical_3']}.csv"
+            if not updated_path.exists():
+                continue
+            updated = read_csv_cached(str(updated_path))
+            updated.insert(0, ROW_ID_COLUMN, input_row_ids(updated))
+            written[f"medical_3/{model_dir.name}"] = self.write_frame("medical_3", model_dir.name, updated)
+            detailed_path = model_dir / f"{MEDICAL_3_FILES['medical_3_detailed']}.csv"
+            if detailed_path.exists():
+                detailed = read_csv_cached(str(detailed_path))
+                row_ids = updated[ROW_ID_COLUMN].tolist()
+                positions = detailed["index"] if "index" in detailed.columns else range(len(detailed))
+                detailed.insert(0, ROW_ID_COLUMN, [row_ids[int(p)] for p in positions])
+                written[f"medical_3_detailed/{model_dir.name}"] = self.write_frame(
+                    "medical_3_detailed", model_dir.name, detailed
+                )
+        return written
+
+    def load_run(self, dataset: str, model: str) -> pd.DataFrame:
+        """The run's rows with every stored column, in the original row and column order.
+
+        Rubric and axis-score columns come back as JSON strings, as in the CSV outputs.
+        """
+        conn = self._conn()
+        columns, integers = self._layout(dataset, model)
+        base = conn.execute(
+            "SELECT row_id, question, fields FROM rows WHERE dataset = ? AND model = ? ORDER BY position",
+            (dataset, model),
+        ).fetchall()
+        question_column = next((c for c in columns if c in QUESTION_COLUMNS), QUESTION_COLUMNS[0])
+        records = {row_id: {ROW_ID_COLUMN: row_id, question_column: question, **json.loads(fields)}
+                   for row_id, question, fields in base}
+        metrics: Dict[Tuple[str, str], Any] = {}
+        for row_id, metric, value in conn.execute(
+            "SELECT row_id, metric, value FROM metrics WHERE dataset = ? AND model = ?", (dataset, model)
+        ):
+            metrics[row_id, metric] = value
+            if metric in columns:
+                records.setdefault(row_id, {ROW_ID_COLUMN: row_id})[metric] = value
+        # (row_id, evaluator) -> position -> text, listed (position, text, score), (position, axis) -> score
+        texts: Dict[Tuple[str, str], Dict[int, str]] = {}
+        listed: Dict[Tuple[str, str], List[Tuple[str, Any]]] = {}
+        placed: Dict[Tuple[str, str], Dict[Tuple[int, str], Any]] = {}
+        for row_id, evaluator, position, axis, text, score in conn.execute(
+            "SELECT s.row_id, s.evaluator, s.position, s.axis, r.text, s.score "
+            "FROM rubric_scores s JOIN rubrics r USING (rubric_id) WHERE s.dataset = ? AND s.model = ? "
+            "ORDER BY s.row_id, s.evaluator, s.position", (dataset, model)
+        ):
+            key = (row_id, evaluator)
+            texts.setdefault(key, {})[position] = text
+            if axis == OVERALL_AXIS:
+                listed.setdefault(key, []).append((text, score))
+            else:
+                placed.setdefault(key, {})[position, axis] = score
+        for row_id, column, value in conn.execute(
+            "SELECT row_id, column_name, value FROM details WHERE dataset = ? AND model = ?", (dataset, model)
+        ):
+            layout = json.loads(value) if value is not None else None
+            record = records.setdefault(row_id, {ROW_ID_COLUMN: row_id})
+            evaluator = COLUMN_EVALUATOR.get(column)
+            if layout is None:
+                record[column] = None
+            elif column in AXIS_SCORE_COLUMNS:
+                record[column] = {axis: metrics.get((row_id, f"{column}{AXIS_METRIC_SEPARATOR}{axis}"))
+                                  for axis in layout}
+            elif evaluator is None:
+                record[column] = layout
+            else:
+                spec, key = EVALUATOR_COLUMNS[evaluator], (row_id, evaluator)
+                if column == spec.get("rubrics"):
+                    record[column] = [text for text, _ in listed.get(key, [])]
+                elif column == spec["scores"]:
+                    record[column] = {text: score for text, score in listed.get(key, [])}
+                elif column == spec.get("axis_scores"):
+                    record[column] = {
+                        axis: {texts[key][p]: placed.get(key, {}).get((p, axis)) for p in positions}
+                        for axis, positions in layout.items()
+                    }
+                else:
+                    record[column] = _from_positions(layout, texts.get(key, {}))
+        df = pd.DataFrame(list(records.values()))
+        for column in RUBRIC_COLUMNS:
+            if column in df.columns:
+                df[column] = [None if _is_missing(v) else json.dumps(v) for v in df[column]]
+        for column in integers:
+            if column in df.columns:
+                df[column] = df[column].astype("Int64")
+        return df.reindex(columns=columns or list(df.columns))
+
+    def export_run(self, dataset: str, model: str, csv_path: str, include_row_id: bool = False) -> int:
+        """Write the run back out in the layout it was written with; returns rows written."""
+        df = self.load_run(dataset, model)
+        if not include_row_id:
+            df = df.drop(columns=[ROW_ID_COLUMN])
+        atomic_write_csv(df, csv_path)
+        return len(df)
+
+    def round_trip_mismatches(self, dataset: str, model: str, source_csv: str) -> List[str]:
+        """Differences between ``source_csv`` and the run exported from the warehouse.
+
+        Both files are read back as CSV; JSON columns compare as parsed values and numbers
+        with NaN equal to NaN. Returns one message per differing column (empty if identical).
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            exported_path = str(Path(tmp) / "export.csv")
+            self.export_run(dataset, model, exported_path)
+            exported = pd.read_csv(exported_path)
+        source = pd.read_csv(source_csv)
+        if list(source.columns) != list(exported.columns):
+            return [f"columns differ: {list(source.columns)} vs {list(exported.columns)}"]
+        if len(source) != len(exported):
+            return [f"row count differs: {len(source)} vs {len(exported)}"]
+        mismatches = []
+        for column in source.columns:
+            left, right = source[column], exported[column]
+            if column in RUBRIC_COLUMNS or column in AXIS_SCORE_COLUMNS:
+                same = [(_is_missing(a) and _is_missing(b)) or _decode(a) == _decode(b) for a, b in zip(left, right)]
+            elif pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+                same = ((left == right) | (left.isna() & right.isna())).tolist()
+            else:
+                same = [(_is_missing(a) and _is_missing(b)) or a == b for a, b in zip(left, right)]
+            if not all(same):
+                rows = [i for i, ok in enumerate(same) if not ok]
+                mismatches.append(f"{column}: {len(rows)} row(s) differ, first at row {rows[0]}")
+        return mismatches
+
+    # Cross-model queries: index range scans on (dataset, metric) / (dataset, evaluator, axis)
+
+    def metric_matrix(self, dataset: str, metric: str) -> pd.DataFrame:
+        """row_id x model values of one metric (e.g. "medical_quality_score" or "m1_axis_scores.Accuracy")."""
+        rows = self._conn().execute(
+            "SELECT row_id, model, value FROM metrics WHERE dataset = ? AND metric = ?", (dataset, metric)
+        ).fetchall()
+        return pd.DataFrame(rows, columns=[ROW_ID_COLUMN, "model", "value"]).pivot(
+            index=ROW_ID_COLUMN, columns="model", values="value"
+        )
+
+    def failed_by_all_models(self, dataset: str, metric: str, threshold: float) -> pd.DataFrame:
+        """Questions where every model in the dataset scored below ``threshold`` on ``metric``."""
+        conn = self._conn()
+        n_models = conn.execute(
+            "SELECT COUNT(DISTINCT model) FROM metrics WHERE dataset = ? AND metric = ? AND value IS NOT NULL",
+            (dataset, metric),
+        ).fetchone()[0]
+        rows = conn.execute(
+            "SELECT m.row_id, MAX(r.question), MAX(m.value) FROM metrics m "
+            "LEFT JOIN rows r ON r.dataset = m.dataset AND r.model = m.model AND r.row_id = m.row_id "
+            "WHERE m.dataset = ? AND m.metric = ? AND m.value IS NOT NULL GROUP BY m.row_id "
+            "HAVING COUNT(DISTINCT m.model) = ? AND MAX(m.value) < ?",
+            (dataset, metric, n_models, threshold),
+        ).fetchall()
+        return pd.DataFrame(rows, columns=[ROW_ID_COLUMN, "question", "best_score"])
+
+    def rubric_failure_rates(self, dataset: str, evaluator: str = "m1", axis: Optional[str] = None,
+                             min_uses: int = 1) -> pd.DataFrame:
+        """Per rubric: how often each model's responses failed it, on one axis or (by default) overall."""
+        query = ("SELECT r.text, s.model, COUNT(*) AS uses, AVG(1 - s.score) AS failure_rate "
+                 "FROM rubric_scores s JOIN rubrics r USING (rubric_id) "
+                 "WHERE s.dataset = ? AND s.evaluator = ? AND s.axis = ? AND s.score IS NOT NULL")
+        params: List[Any] = [dataset, evaluator, OVERALL_AXIS if axis is None else axis]
+        query += " GROUP BY r.rubric_id, s.model HAVING COUNT(*) >= ? ORDER BY failure_rate DESC"
+        params.append(min_uses)
+        return pd.DataFrame(self._conn().execute(query, params).fetchall(),
+                            columns=["rubric", "model", "uses", "failure_rate"])
+
+
+def input_row_ids(df: pd.DataFrame) -> pd.Series:
+    """Row IDs for results saved without them: the hash the pipeline gives the input row
+    (every column before llm_response)."""
+    columns = list(df.columns)
+    key_columns = columns[:columns.index("llm_response")] if "llm_response" in columns else None
+    return compute_row_ids(df, key_columns)
+
+
+_warehouse: Optional[ResultsWarehouse] = None
+_warehouse_lock = threading.Lock()
+
+
+def get_results_warehouse() -> Optional[ResultsWarehouse]:
+    """Process-wide warehouse, or None when RESULTS_WAREHOUSE_ENABLED is off."""
+    global _warehouse
+    if not RESULTS_WAREHOUSE_ENABLED:
+        return None
+    with _warehouse_lock:
+        if _warehouse is None:
+            _warehouse = ResultsWarehouse()
+        return _warehouse
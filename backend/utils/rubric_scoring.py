@@ -0,0 +1,169 @@
+import json
+from typing import Any, Callable, Dict, List, Optional
+from config import CONTEXT_CACHE_MIN_TOKENS
+from utils.token_utils import estimate_tokens
+
+STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+# Static 0/1 scoring instructions shared by both medical evaluators; they lead the prompt
+SCORING_INSTRUCTIONS = """You are an expert medical evaluator assessing AI-generated responses against specific quality criteria.
+
+Scoring Task:
+For each criterion, determine if the LLM response fully satisfies that requirement:
+- Score 1: The response clearly and adequately meets this criterion
+- Score 0: The response fails to meet this criterion, is insufficient, or is ambiguous
+
+Scoring Guidelines:
+- Be thorough but fair in your evaluation
+- Consider the medical context and patient needs
+- Look for evidence that each criterion is specifically addressed
+- If a criterion is partially met but not completely, score it as 0
+
+IMPORTANT: Return ONLY a JSON object where:
+- Keys are the criterion IDs listed under "Criterion IDs to score"
+- Values are either 0 or 1
+- Include every one of those IDs
+"""
+
+
+def rubric_ids(rubrics: List[str]) -> List[str]:
+    """Short IDs r1..rN so judges answer with IDs instead of echoing rubric text."""
+    return [f"r{i}" for i in range(1, len(rubrics) + 1)]
+
+
+def format_rubrics(ids: List[str], rubrics: List[str]) -> str:
+    return "\n".join(f"{rubric_id}: {rubric}" for rubric_id, rubric in zip(ids, rubrics))
+
+
+def binary_score_schema(ids: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {rubric_id: {"type": "integer", "enum": [0, 1]} for rubric_id in ids},
+        "required": list(ids),
+        "additionalProperties": False,
+    }
+
+
+def classification_schema(axes: List[str], ids: List[str]) -> Dict[str, Any]:
+    id_list = {"type": "array", "items": {"type": "string", "enum": list(ids)}}
+    keys = list(axes) + ["unclassified"]
+    return {
+        "type": "object",
+        "properties": {key: id_list for key in keys},
+        "required": keys,
+        "additionalProperties": False,
+    }
+
+
+def parse_json_response(response: Optional[str], opening: str = "{") -> Optional[Any]:
+    """Parse a structured-output response; falls back to the outermost bracket pair."""
+    if not response:
+        return None
+    try:
+        return json.loads(response)
+    except json.JSONDecodeError:
+        pass
+    closing = "}" if opening == "{" else "]"
+    start, end = response.find(opening), response.rfind(closing) + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(response[start:end])
+    except json.JSONDecodeError:
+        return None
+
+
+def score_rubrics_by_id(complete: Callable[..., Optional[str]],
+                        build_prompt: Callable[[str, List[str]], str], rubrics: List[str],
+                        max_tokens: int = 800, temperature: float = 0.1, rescore_rounds: int = 1,
+                        prefix: Optional[str] = None, static_count: int = 0,
+                        known: Optional[Dict[str, int]] = None) -> Dict[str, Optional[int]]:
+    """Score rubrics 0/1 with schema-constrained output keyed by rubric ID.
+
+    ``build_prompt(criteria, ids)`` receives the "rN: text" block for the rubrics not in the
+    prefix and the IDs to score. With a ``prefix`` (static instructions, sent first so it
+    can be cached), the first ``static_count`` rubrics are listed there already, as
+    ``static_rubric_block`` renders them. A prefix shorter than CONTEXT_CACHE_MIN_TOKENS
+    could never be cached, so it is simply sent inline ahead of the prompt. IDs missing
+    from the answer are re-requested on their own (up to ``rescore_rounds`` times) when the
+    reply parsed but left them out; an unparseable or failed reply is not retried here (the
+    client already retries transport errors). Rubrics still missing are returned as None
+    rather than 0. Rubrics in ``known`` (text -> score, e.g. from the score memo) keep their
+    IDs but are not sent. Returns {} if nothing could be scored.
+    """
+    ids = rubric_ids(rubrics)
+    text_by_id = dict(zip(ids, rubrics))
+    static_ids = set(ids[:static_count]) if prefix else set()
+    cacheable = bool(prefix) and estimate_tokens(prefix) >= CONTEXT_CACHE_MIN_TOKENS
+    extra = {"prefix": prefix} if cacheable else {}
+    inline = prefix if prefix and not cacheable else ""
+    known = known or {}
+    scores: Dict[str, int] = {i: known[text_by_id[i]] for i in ids if text_by_id[i] in known}
+    pending = [i for i in ids if i not in scores]
+    for round_no in range(rescore_rounds + 1):
+        if not pending:
+            break
+        if round_no > 0:
+            print(f"Re-requesting scores for {len(pending)} rubric(s): {', '.join(pending)}")
+            # Follow-ups only need room for the missing IDs
+            max_tokens = min(max_tokens, 16 * len(pending) + 64)
+        listed = [i for i in pending if i not in static_ids]
+        response = complete(
+            inline + build_prompt(format_rubrics(listed, [text_by_id[i] for i in listed]), pending),
+            max_tokens=max_tokens, temperature=temperature,
+            response_schema=binary_score_schema(pending), **extra
+        )
+        parsed = parse_json_response(response)
+        if not isinstance(parsed, dict):
+            # Re-asking for every rubric with a smaller budget would only queue a second,
+            # likely truncated copy of the same prompt
+            break
+        for rubric_id in pending:
+            value = parsed.get(rubric_id)
+            if value in (0, 1) and not isinstance(value, bool):
+                scores[rubric_id] = int(value)
+        pending = [i for i in pending if i not in scores]
+    if not scores:
+        return {}
+    if pending:
+        print(f"Warning: {len(pending)}/{len(ids)} rubrics left unscored")
+    return {text_by_id[i]: scores.get(i) for i in ids}
+
+
+def static_rubric_block(rubrics: List[str]) -> str:
+    """The "rN: text" block for rubrics that live in a cached prompt prefix."""
+    return format_rubrics(rubric_ids(rubrics), rubrics)
+
+
+def classify_rubrics_by_id(complete: Callable[..., Optional[str]],
+                           build_prompt: Callable[[str], str], rubrics: List[str],
+                           axes: List[str], max_tokens: int = 1000,
+                           temperature: float = 0.1) -> Dict[str, List[str]]:
+    """Assign rubrics to axes with schema-constrained output keyed by rubric ID.
+
+    A rubric listed under several axes keeps its first placement; rubrics the judge left
+    out go to "unclassified". Returns {} if the call failed.
+    """
+    ids = rubric_ids(rubrics)
+    text_by_id = dict(zip(ids, rubrics))
+    response = complete(
+        build_prompt(format_rubrics(ids, rubrics)),
+        max_tokens=max_tokens, temperature=temperature,
+        response_schema=classification_schema(axes, ids),
+    )
+    parsed = parse_json_response(response)
+    if not isinstance(parsed, dict):
+        return {}
+    classification: Dict[str, List[str]] = {}
+    placed = set()
+    for axis in list(axes) + ["unclassified"]:
+        classification[axis] = []
+        for rubric_id in parsed.get(axis) or []:
+            if rubric_id in text_by_id and rubric_id not in placed:
+                placed.add(rubric_id)
+                classification[axis].append(text_by_id[rubric_id])
+    missing = [text_by_id[i] for i in ids if i not in placed]
+    if missing:
+        print(f"Warning: {len(missing)} rubrics were not classified, adding to unclassified")
+        classification["unclassified"].extend(missing)
+    return classification
@@ -0,0 +1,114 @@
+import hashlib
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pyarrow as pa
+
+# Rubric columns stored as IDs into a per-dataset rubric dictionary instead of repeated text.
+# Lists become ID lists, axis maps become axis -> ID lists, and score maps become the rubric
+# IDs plus packed bits (score, and whether a score exists at all).
+RUBRIC_LIST_COLUMNS = ["m1_rubrics", "m2_generated_rubrics", "m2_all_rubrics"]
+RUBRIC_MAP_COLUMNS = ["m1_classification", "m2_fixed_rubrics", "m2_classification", "m2_generated_classification"]
+RUBRIC_SCORE_COLUMNS = ["m1_rubric_scores", "m2_rubric_scores"]
+
+ID_LIST_TYPE = pa.list_(pa.int32())
+PACKED_SCORES_TYPE = pa.struct([("ids", ID_LIST_TYPE), ("bits", pa.binary()), ("known", pa.binary())])
+INTERNED_COLUMN_TYPES: Dict[str, pa.DataType] = {
+    **{col: ID_LIST_TYPE for col in RUBRIC_LIST_COLUMNS},
+    **{col: pa.map_(pa.string(), ID_LIST_TYPE) for col in RUBRIC_MAP_COLUMNS},
+    **{col: PACKED_SCORES_TYPE for col in RUBRIC_SCORE_COLUMNS},
+}
+
+
+def pack_bits(values: List[int]) -> bytes:
+    return np.packbits(np.asarray(values, dtype=np.uint8)).tobytes()
+
+
+def unpack_bits(data: bytes, count: int) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count)
+
+
+class RubricDictionary:
+    """Rubric text <-> integer ID, with the axis each rubric was first classified under."""
+
+    def __init__(self, texts: Optional[List[str]] = None, axes: Optional[List[Optional[str]]] = None):
+        self.texts: List[str] = list(texts or [])
+        self.axes: List[Optional[str]] = list(axes or [None] * len(self.texts))
+        self._ids = {text: i for i, text in enumerate(self.texts)}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def intern(self, text: str, axis: Optional[str] = None) -> int:
+        rubric_id = self._ids.get(text)
+        if rubric_id is None:
+            rubric_id = len(self.texts)
+            self._ids[text] = rubric_id
+            self.texts.append(text)
+            self.axes.append(None)
+        if axis and axis != "unclassified" and self.axes[rubric_id] is None:
+            self.axes[rubric_id] = axis
+        return rubric_id
+
+    def digest(self) -> str:
+        return hashlib.sha256("\x1f".join(self.texts).encode("utf-8")).hexdigest()[:12]
+
+    def to_table(self) -> pa.Table:
+        return pa.table({
+            "rubric_id": pa.array(range(len(self.texts)), type=pa.int32()),
+            "text": pa.array(self.texts, type=pa.string()),
+            "axis": pa.array(self.axes, type=pa.string()),
+        })
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "RubricDictionary":
+        ids = table.column("rubric_id").to_pylist()
+        if ids != list(range(len(ids))):
+            order = np.argsort(ids)
+            table = table.take(pa.array(order))
+        return cls(table.column("text").to_pylist(), table.column("axis").to_pylist())
+
+    # Encoding: decoded JSON values (lists/dicts) -> interned Arrow values
+
+    def encode(self, col: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if col in RUBRIC_LIST_COLUMNS:
+            return [self.intern(str(text)) for text in value] if isinstance(value, list) else None
+        if col in RUBRIC_MAP_COLUMNS:
+            if not isinstance(value, dict):
+                return None
+            return [(str(axis), [self.intern(str(text), axis) for text in (texts or [])])
+                    for axis, texts in value.items()]
+        if col in RUBRIC_SCORE_COLUMNS:
+            if not isinstance(value, dict):
+                return None
+            scores = list(value.values())
+            return {
+                "ids": [self.intern(str(text)) for text in value],
+                "bits": pack_bits([1 if s else 0 for s in scores]),
+                "known": pack_bits([0 if s is None else 1 for s in scores]),
+            }
+        raise KeyError(f"Not an interned rubric column: {col}")
+
+    def encode_column(self, col: str, values: List[Any]) -> pa.Array:
+        return pa.array([self.encode(col, v) for v in values], type=INTERNED_COLUMN_TYPES[col])
+
+    # Decoding: interned values (as from ``to_pylist``) -> the JSON shape the pipeline uses
+
+    def decode(self, col: str, value: Any) -> Any:
+        if value is None:
+            return None
+        texts = self.texts
+        if col in RUBRIC_LIST_COLUMNS:
+            return [texts[i] for i in value]
+        if col in RUBRIC_MAP_COLUMNS:
+            return {axis: [texts[i] for i in ids] for axis, ids in value}
+        if col in RUBRIC_SCORE_COLUMNS:
+            ids = value["ids"]
+            bits = unpack_bits(value["bits"], len(ids))
+            known = unpack_bits(value["known"], len(ids))
+            return {texts[i]: (int(b) if k else None) for i, b, k in zip(ids, bits, known)}
+        raise KeyError(f"Not an interned rubric column: {col}")
+
+    def decode_column(self, col: str, values: List[Any]) -> List[Any]:
+        return [self.decode(col, v) for v in values]
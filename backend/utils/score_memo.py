@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from config import RUBRIC_SCORE_MEMO_ENABLED, RUBRIC_SCORE_MEMO_PATH
+from utils.single_flight import request_key
+
+
+def rubric_hash(rubric: str) -> str:
+    return hashlib.sha256(" ".join(rubric.split()).encode("utf-8")).hexdigest()
+
+
+class RubricScoreMemo:
+    """Persistent 0/1 rubric scores, one row per (response, rubric, judge model, prompt version).
+
+    The response key covers the question and the LLM response, so rerunning a stage after
+    changing weights, classification or the rubric list only sends the rubrics that have
+    not been scored for that exact response before. Unscored (None) results are never stored.
+    """
+
+    def __init__(self, db_path: str = RUBRIC_SCORE_MEMO_PATH):
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rubric_scores ("
+            "response_hash TEXT NOT NULL, rubric_hash TEXT NOT NULL, judge_model TEXT NOT NULL, "
+            "prompt_version TEXT NOT NULL, score INTEGER NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (response_hash, rubric_hash, judge_model, prompt_version))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    @staticmethod
+    def response_hash(question: str, llm_response: str) -> str:
+        return request_key(question, llm_response)
+
+    def lookup(self, response_hash: str, rubrics: List[str], judge_model: str,
+               prompt_version: str) -> Dict[str, int]:
+        """Known scores for ``rubrics`` (text -> 0/1); rubrics never scored are left out."""
+        by_hash = {rubric_hash(r): r for r in rubrics}
+        if not by_hash:
+            return {}
+        placeholders = ",".join("?" * len(by_hash))
+        rows = self._conn().execute(
+            f"SELECT rubric_hash, score FROM rubric_scores WHERE response_hash = ? "
+            f"AND judge_model = ? AND prompt_version = ? AND rubric_hash IN ({placeholders})",
+            [response_hash, judge_model, prompt_version, *by_hash],
+        ).fetchall()
+        known = {by_hash[h]: int(score) for h, score in rows}
+        self._count("hits", len(known))
+        self._count("misses", len(by_hash) - len(known))
+        return known
+
+    def store(self, response_hash: str, scores: Dict[str, Optional[int]], judge_model: str,
+              prompt_version: str) -> None:
+        now = time.time()
+        rows = [(response_hash, rubric_hash(r), judge_model, prompt_version, int(s), now)
+                for r, s in scores.items() if s is not None]
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO rubric_scores VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("stored", len(rows))
+
+
+_memo: Optional[RubricScoreMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_score_memo() -> Optional[RubricScoreMemo]:
+    """Process-wide memo, or None when RUBRIC_SCORE_MEMO_ENABLED is off."""
+    global _memo
+    if not RUBRIC_SCORE_MEMO_ENABLED:
+        return None
+    with _memo_lock:
+        if _memo is None:
+            _memo = RubricScoreMemo()
+        return _memo
+
+
+def memoized_rubric_scores(score: Callable[[Dict[str, int]], Dict[str, Optional[int]]],
+                           question: str, llm_response: str, rubrics: List[str],
+                           judge_model: Optional[str], prompt_version: str,
+                           use_memo: bool = True) -> Dict[str, Optional[int]]:
+    """Run ``score(known)`` with the memoized scores for ``rubrics`` and store the new ones.
+
+    ``score`` receives text -> score for the rubrics already scored by ``judge_model`` under
+    ``prompt_version`` and should only send the rest to the judge.
+    """
+    memo = get_score_memo() if use_memo and judge_model else None
+    if memo is None:
+        return score({})
+    key = memo.response_hash(question, llm_response)
+    known = memo.lookup(key, rubrics, judge_model, prompt_version)
+    scores = score(known)
+    memo.store(key, {r: s for r, s in scores.items() if r not in known}, judge_model, prompt_version)
+    return scores
+
+
+def score_memo_stats() -> Dict[str, int]:
+    with _memo_lock:
+        return dict(_memo.stats) if _memo is not None else {}
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+def request_key(*parts: Any) -> str:
+    """Hash of the request parts, with whitespace-normalized strings and key-sorted JSON."""
+    normalized = []
+    for part in parts:
+        if isinstance(part, str):
+            normalized.append(re.sub(r"\s+", " ", part).strip())
+        else:
+            normalized.append(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str))
+    return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests: one caller runs ``fn``, the rest wait for it.
+
+    Nothing is cached once the leading call finishes; this only removes duplicate work
+    that is in flight at the same moment.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Process-wide coalescing group, e.g. "judge" or "context_cache"."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: dict(group.stats) for name, group in groups.items()}
@@ -0,0 +1,289 @@
+import json
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from config import (
+    SUMMARY_FLUSH_ROWS,
+    SUMMARY_HISTOGRAM_BINS,
+    SUMMARY_HISTOGRAM_RANGES,
+    SUMMARY_STORE_PATH,
+)
+from utils.file_utils import atomic_write_csv
+
+# Summary key -> score column, in summary_scores.csv column order
+SUMMARY_METRICS = {
+    "med1": "medical_quality_score",
+    "med2": "medical_quality_score_2",
+    "sbert": "sbert_similarity",
+    "cohere": "cohere_similarity",
+    "voyage": "voyage_similarity",
+    "openai": "openai_similarity",
+    "bert": "bert_score_f1",
+    "bleu": "bleu_score",
+    "meteor": "meteor_score",
+    "rouge_l": "rouge_l_score",
+    "perplexity": "perplexity",
+    "ling": "linguistic_quality_score",
+}
+# Summary keys held by each pipeline stage's shard
+STAGE_METRICS = {
+    "linguistic": ["bleu", "meteor", "rouge_l", "perplexity", "ling"],
+    "semantic": ["sbert", "cohere", "voyage", "openai", "bert"],
+    "medical": ["med1"],
+    "medical_2": ["med2"],
+}
+
+
+class RunningStats:
+    """Count, mean and variance (Welford), min/max and a fixed-bin histogram of one metric.
+
+    Values outside the histogram range land in the edge bins. Two instances over disjoint
+    rows merge exactly (Chan et al.), so shards can be combined in any order.
+    """
+
+    def __init__(self, low: float = 0.0, high: float = 1.0, bins: int = SUMMARY_HISTOGRAM_BINS):
+        self.low, self.high, self.bins = low, high, bins
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.histogram = np.zeros(bins, dtype=np.int64)
+
+    @classmethod
+    def for_metric(cls, metric: str) -> "RunningStats":
+        return cls(*SUMMARY_HISTOGRAM_RANGES.get(metric, (0.0, 1.0)))
+
+    def add_many(self, values: Iterable[Any]) -> None:
+        batch = pd.to_numeric(pd.Series(list(values), dtype="object"), errors="coerce").dropna().to_numpy(dtype=np.float64)
+        if len(batch) == 0:
+            return
+        other = RunningStats(self.low, self.high, self.bins)
+        other.count = len(batch)
+        other.mean = float(batch.mean())
+        other.m2 = float(((batch - other.mean) ** 2).sum())
+        other.min, other.max = float(batch.min()), float(batch.max())
+        other.histogram, _ = np.histogram(np.clip(batch, self.low, self.high), bins=self.bins,
+                                          range=(self.low, self.high))
+        self.merge(other)
+
+    def add(self, value: Any) -> None:
+        try:
+            x = float(value)
+        except (TypeError, ValueError):
+            return
+        if math.isnan(x):
+            return
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min, self.max = min(self.min, x), max(self.max, x)
+        position = (min(max(x, self.low), self.high) - self.low) / (self.high - self.low)
+        self.histogram[min(int(position * self.bins), self.bins - 1)] += 1
+
+    def merge(self, other: "RunningStats") -> None:
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.histogram = self.histogram + other.histogram
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def interval(self, z: float = 1.96) -> Dict[str, float]:
+        """Normal-approximation CI for the mean."""
+        half = z * math.sqrt(self.variance / self.count) if self.count else math.nan
+        return {"ci_low": self.mean - half, "ci_high": self.mean + half}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count, "mean": self.mean, "m2": self.m2,
+            "min": self.min if self.count else None, "max": self.max if self.count else None,
+            "low": self.low, "high": self.high, "histogram": self.histogram.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunningStats":
+        stats = cls(data["low"], data["high"], len(data["histogram"]))
+        stats.count, stats.mean, stats.m2 = data["count"], data["mean"], data["m2"]
+        stats.min = math.inf if data["min"] is None else data["min"]
+        stats.max = -math.inf if data["max"] is None else data["max"]
+        stats.histogram = np.asarray(data["histogram"], dtype=np.int64)
+        return stats
+
+
+class SummaryStore:
+    """SQLite store of per-shard metric statistics, one row per (run, dataset, shard, metric).
+
+    A shard (e.g. one pipeline stage) always writes its complete current state, so flushing
+    again never double counts; reads merge every shard of a run and dataset. The store is
+    the source of truth for summary_scores.csv: anything that changes a stage's scores
+    outside the pipeline writes them back with ``replace_shard``.
+    """
+
+    def __init__(self, db_path: str = SUMMARY_STORE_PATH):
+        self.db_path = db_path
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS summary_stats ("
+            "run TEXT NOT NULL, dataset TEXT NOT NULL, shard TEXT NOT NULL, metric TEXT NOT NULL, "
+            "stats TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (run, dataset, shard, metric))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def write_shard(self, run: str, dataset: str, shard: str, stats: Dict[str, RunningStats]) -> None:
+        now = time.time()
+        rows = [(run, dataset, shard, metric, json.dumps(s.to_dict()), now) for metric, s in stats.items()]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM summary_stats WHERE run = ? AND dataset = ? AND shard = ?", (run, dataset, shard))
+            conn.executemany("INSERT INTO summary_stats VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def replace_shard(self, run: str, dataset: str, shard: str, df: pd.DataFrame) -> None:
+        """Rebuild a stage's shard from the finished rows in ``df`` (its STAGE_METRICS columns)."""
+        stats = {}
+        for key in STAGE_METRICS[shard]:
+            if SUMMARY_METRICS[key] in df.columns:
+                stats[key] = RunningStats.for_metric(key)
+                stats[key].add_many(df[SUMMARY_METRICS[key]])
+        self.write_shard(run, dataset, shard, {key: s for key, s in stats.items() if s.count})
+
+    def has_shard(self, run: str, dataset: str, shard: str) -> bool:
+        return self._conn().execute(
+            "SELECT 1 FROM summary_stats WHERE run = ? AND dataset = ? AND shard = ? LIMIT 1", (run, dataset, shard)
+        ).fetchone() is not None
+
+    def read(self, run: str, dataset: Optional[str] = None) -> Dict[str, Dict[str, RunningStats]]:
+        """dataset -> metric -> stats merged over shards."""
+        query = "SELECT dataset, metric, stats FROM summary_stats WHERE run = ?"
+        params: List[Any] = [run]
+        if dataset is not None:
+            query += " AND dataset = ?"
+            params.append(dataset)
+        merged: Dict[str, Dict[str, RunningStats]] = {}
+        for row_dataset, metric, payload in self._conn().execute(query, params).fetchall():
+            stats = RunningStats.from_dict(json.loads(payload))
+            per_dataset = merged.setdefault(row_dataset, {})
+            if metric in per_dataset:
+                per_dataset[metric].merge(stats)
+            else:
+                per_dataset[metric] = stats
+        return merged
+
+
+class SummaryAggregator:
+    """Running statistics for one shard, fed row by row (or frame by frame) as results finish.
+
+    Flushes its state to the store every ``flush_rows`` rows and on ``flush``.
+    """
+
+    def __init__(self, store: SummaryStore, run: str, dataset: str, shard: str,
+                 metrics: Optional[Dict[str, str]] = None, flush_rows: int = SUMMARY_FLUSH_ROWS):
+        self.store, self.run, self.dataset, self.shard = store, run, dataset, shard
+        self.metrics = SUMMARY_METRICS if metrics is None else metrics
+        self.flush_rows = flush_rows
+        self.stats = {key: RunningStats.for_metric(key) for key in self.metrics}
+        self._lock = threading.Lock()
+        # Serializes flushes so an older snapshot can never overwrite a newer one
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+
+    def add_row(self, outputs: Dict[str, Any]) -> None:
+        with self._lock:
+            for key, column in self.metrics.items():
+                if column in outputs:
+                    self.stats[key].add(outputs[column])
+            self._pending += 1
+            due = self._pending >= self.flush_rows
+        if due:
+            self.flush()
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        with self._lock:
+            for key, column in self.metrics.items():
+                if column in df.columns:
+                    self.stats[key].add_many(df[column])
+        self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                snapshot = {key: RunningStats.from_dict(s.to_dict()) for key, s in self.stats.items() if s.count}
+                self._pending = 0
+            self.store.write_shard(self.run, self.dataset, self.shard, snapshot)
+
+
+def summary_means(stats: Dict[str, RunningStats]) -> Dict[str, float]:
+    """summary_scores.csv metric columns from merged stats (0.0 for metrics with no values)."""
+    return {key: stats[key].mean if key in stats and stats[key].count else 0.0 for key in SUMMARY_METRICS}
+
+
+def summary_row(dataset: str, stats: Dict[str, RunningStats], rows: Optional[int] = None,
+                estimates: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """One summary_scores.csv row from a dataset's merged stats.
+
+    ``rows`` defaults to the largest metric count. med1/med2 come with their n and a normal
+    CI, or from ``estimates`` (summary key -> saved estimate) for stages that stopped early.
+    """
+    row = {
+        "dataset": dataset,
+        "rows": rows if rows is not None else max((s.count for s in stats.values()), default=0),
+        **summary_means(stats),
+    }
+    for key in ("med1", "med2"):
+        estimate = (estimates or {}).get(key)
+        if estimate is None:
+            running = stats.get(key) or RunningStats()
+            estimate = {"mean": running.mean if running.count else 0.0, "n": running.count, **running.interval()}
+        # Rows judged and the CI; n < rows when the stage stopped early
+        row[key] = estimate["mean"]
+        row[f"{key}_n"] = estimate["n"]
+        row[f"{key}_ci_low"] = estimate["ci_low"]
+        row[f"{key}_ci_high"] = estimate["ci_high"]
+    return row
+
+
+def write_summary_csv(store: SummaryStore, run: str, path: str, current: Optional[str] = None,
+                      rows: Optional[int] = None,
+                      estimates: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """Write summary_scores.csv (one row per input dataset of ``run``) from the store.
+
+    ``rows`` and ``estimates`` apply to the ``current`` dataset only. Rows for datasets the
+    store does not know (outputs older than the store) are kept as they are. The file is
+    replaced atomically, so concurrent writers never leave a half-written summary.
+    """
+    merged = store.read(run)
+    summary = pd.DataFrame([
+        summary_row(dataset, stats, rows if dataset == current else None,
+                    estimates if dataset == current else None)
+        for dataset, stats in merged.items()
+    ])
+    if Path(path).exists():
+        existing = pd.read_csv(path)
+        summary = pd.concat([existing[~existing["dataset"].isin(merged)], summary], ignore_index=True)
+    atomic_write_csv(summary, path)
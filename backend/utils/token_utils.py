@@ -0,0 +1,111 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+# Characters per token for the cheap heuristic. Indic scripts tokenize far less
+# efficiently than Latin text in BPE vocabularies, so they get a lower ratio.
+LATIN_CHARS_PER_TOKEN = 4.0
+INDIC_CHARS_PER_TOKEN = 1.5
+
+_tokenizer = None
+_lock = threading.Lock()
+# Per-provider multiplier learned from reported usage (reported / estimated)
+_calibration: Dict[str, float] = {}
+_usage_log: List[Dict[str, Any]] = []
+CALIBRATION_ALPHA = 0.1
+
+
+def register_tokenizer(tokenizer) -> None:
+    """Use an already-loaded HF tokenizer (e.g. LinguisticAnalyzer's GPT-2) for estimates."""
+    global _tokenizer
+    _tokenizer = tokenizer
+
+
+def _heuristic_tokens(text: str) -> int:
+    indic = sum(1 for ch in text if 0x0900 <= ord(ch) <= 0x0DFF)
+    other = len(text) - indic
+    return int(other / LATIN_CHARS_PER_TOKEN + indic / INDIC_CHARS_PER_TOKEN) + 1
+
+
+def estimate_tokens(text: str, provider: Optional[str] = None) -> int:
+    """Estimate the token count of text, calibrated to the provider when usage has been seen."""
+    if not text:
+        return 0
+    if _tokenizer is not None:
+        try:
+            raw = len(_tokenizer.encode(text))
+        except Exception:
+            raw = _heuristic_tokens(text)
+    else:
+        raw = _heuristic_tokens(text)
+    factor = _calibration.get(provider, 1.0) if provider else 1.0
+    return max(1, int(round(raw * factor)))
+
+
+def record_usage(provider: str, model: str, estimated: int, reported: Optional[int],
+                 cached: Optional[int] = None) -> None:
+    """Log estimated vs reported prompt tokens and nudge the provider's calibration factor.
+
+    ``cached`` is the part of the prompt served from a provider (or stand-in) context cache.
+    """
+    with _lock:
+        _usage_log.append({
+            "provider": provider, "model": model,
+            "estimated": estimated, "reported": reported, "cached": cached or 0,
+        })
+        if reported and estimated:
+            # The estimate already includes the current factor, so fold the error into it
+            ratio = reported / estimated
+            current = _calibration.get(provider, 1.0)
+            _calibration[provider] = current * (1 - CALIBRATION_ALPHA + CALIBRATION_ALPHA * ratio)
+
+
+def usage_summary() -> Dict[str, Dict[str, float]]:
+    """Per-provider totals of estimated and reported prompt tokens, plus the calibration factor."""
+    with _lock:
+        entries = list(_usage_log)
+        calibration = dict(_calibration)
+    summary: Dict[str, Dict[str, float]] = {}
+    for entry in entries:
+        stats = summary.setdefault(entry["provider"], {
+            "calls": 0, "estimated_tokens": 0, "reported_tokens": 0, "calls_with_usage": 0,
+            "cached_tokens": 0,
+        })
+        stats["calls"] += 1
+        stats["estimated_tokens"] += entry["estimated"]
+        stats["cached_tokens"] += entry["cached"]
+        if entry["reported"]:
+            stats["reported_tokens"] += entry["reported"]
+            stats["calls_with_usage"] += 1
+    for provider, stats in summary.items():
+        stats["calibration"] = round(calibration.get(provider, 1.0), 3)
+        input_tokens = stats["reported_tokens"] or stats["estimated_tokens"]
+        stats["uncached_tokens"] = max(0, input_tokens - stats["cached_tokens"])
+    return summary
+
+
+def reported_prompt_tokens(response: Any) -> Optional[int]:
+    """Pull the provider-reported prompt/input token count from an SDK response, if present."""
+    usage_metadata = getattr(response, "usage_metadata", None)  # Gemini
+    if usage_metadata is not None:
+        return getattr(usage_metadata, "prompt_token_count", None)
+    usage = getattr(response, "usage", None)  # OpenAI / Together
+    if usage is not None:
+        return getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None)
+    meta = getattr(response, "meta", None)  # Cohere
+    billed = getattr(meta, "billed_units", None) if meta is not None else None
+    if billed is not None:
+        tokens = getattr(billed, "input_tokens", None)
+        return int(tokens) if tokens is not None else None
+    return None
+
+
+def reported_cached_tokens(response: Any) -> Optional[int]:
+    """Prompt tokens the provider served from its context cache, if reported."""
+    usage_metadata = getattr(response, "usage_metadata", None)  # Gemini
+    if usage_metadata is not None:
+        return getattr(usage_metadata, "cached_content_token_count", None)
+    usage = getattr(response, "usage", None)  # OpenAI automatic prompt caching
+    details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+    if details is not None:
+        return getattr(details, "cached_tokens", None)
+    return None